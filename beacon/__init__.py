@@ -0,0 +1,8 @@
+"""
+Beacon Offline Agent — shared Python helpers for the notebooks.
+
+The notebooks in the repo root (`pdfOrMarkdownVectorDBCreation.ipynb`,
+`imageCaptionVectorDB.ipynb`, `FinalBeaconAgent.ipynb`) import from here so the
+knowledge-pack build and retrieval logic lives in one place. The agent itself
+(`agent.py`) also runs headless: `python -m beacon.kiosk <pack>`.
+"""
@@ -0,0 +1,691 @@
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import yaml
+
+from .tracing import span
+
+# The kiosk agent, importable outside the notebook (see kiosk.py for the entry point).
+#
+# Only the standard library and yaml are imported at module level: langchain,
+# numpy / FAISS and the embedding backend are imported where they are first used,
+# so a KnowledgePack can read its manifest instantly and load its indexes on a
+# background thread while the agent and UI come up.
+
+DEFAULT_LLM = "ollama:gpt-oss:20b"
+DEFAULT_TEMPERATURE = 0.2  # lower = more deterministic
+DEFAULT_K = 4
+LOAD_RETRY_S = 10.0  # a pack that failed to load is tried again on its next use after this
+
+
+# ----------------------------
+# Startup timing
+# ----------------------------
+
+class StartupTimer:
+    """Wall-clock startup phases; phases may overlap (they run on different threads)."""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _record(self, name: str, start: float, end: float) -> None:
+        with self._lock:
+            self.phases[name] = {"ms": (end - start) * 1000, "at_ms": (end - self.t0) * 1000}
+
+    @contextmanager
+    def phase(self, name: str):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, t, time.perf_counter())
+
+    def mark(self, name: str, once: bool = False) -> None:
+        """A milestone (zero-length phase) at the current time since boot."""
+        with self._lock:
+            if once and name in self.phases:
+                return
+        t = time.perf_counter()
+        self._record(name, t, t)
+
+    def report(self) -> str:
+        with self._lock:
+            rows = sorted(self.phases.items(), key=lambda kv: kv[1]["at_ms"])
+        lines = [f"{'startup phase':<28}{'took ms':>10}{'done at ms':>12}"]
+        for name, p in rows:
+            took = f"{p['ms']:.0f}" if p["ms"] else "—"
+            lines.append(f"  {name:<26}{took:>10}{p['at_ms']:>12.0f}")
+        return "\n".join(lines)
+
+
+# ----------------------------
+# Knowledge pack
+# ----------------------------
+
+def read_manifest(root: Path) -> Dict[str, Any]:
+    with open(Path(root) / "manifest.yaml", "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+class KnowledgePack:
+    """
+    One pack's manifest (read on construction) and retrieval state (loaded by
+    `load()`, usually on a background thread via `load_in_background()`).
+
+    Tools call `wait()` before touching an index, so a question asked while the
+    indexes are still loading waits for them instead of failing. A store whose
+    files are missing (e.g. a pack shipped without a text index) is left as
+    None and its tool answers "nothing found"; any other load error is raised
+    from `wait()`.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        *,
+        backend: str = "ollama",
+        model_dir: Optional[Path] = None,
+        num_threads: Optional[int] = None,
+        keep_alive: Optional[Any] = None,
+        backend_pool: Optional[Dict[Any, Any]] = None,
+        timer: Optional[StartupTimer] = None,
+        log=print,
+    ):
+        self.root = Path(root)
+        self.timer = timer or StartupTimer()
+        self.log = log
+        self.backend_kind = backend
+        self.model_dir = model_dir
+        self.num_threads = num_threads
+        self.keep_alive = keep_alive
+        self.backend_pool = backend_pool  # shared by a PackRegistry: one embedder for packs with the same model
+        with self.timer.phase("manifest"):
+            self.manifest = read_manifest(self.root)
+
+        self.backend = None        # EmbeddingBackend under emb (residency.py adjusts its keep_alive)
+        self.emb = None            # QueryEmbeddingCache shared by context + getImage
+        self.text_vs = None        # LangChain FAISS store
+        self.text_lexical = None   # BM25 index (None = vector-only)
+        self.text_filter = None    # topic_id / locale row masks
+        self.image_matcher = None
+        self.error: Optional[BaseException] = None
+        self._failed_at = 0.0
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._load_lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return self.manifest.get("name", self.root.name)
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def _retry_due(self) -> bool:
+        return self.error is not None and time.monotonic() - self._failed_at >= LOAD_RETRY_S
+
+    def load(self) -> "KnowledgePack":
+        """Load the indexes; after a failure, the next load() (LOAD_RETRY_S later) tries again."""
+        with self._load_lock:
+            if self._ready.is_set() and (self.error is None or not self._retry_due()):
+                return self
+            self.error = None
+            self._ready.clear()
+            try:
+                self._load()
+            except BaseException as e:
+                self._drop()  # whatever loaded before the failure
+                self.error, self._failed_at = e, time.monotonic()
+                raise
+            finally:
+                self._ready.set()  # wakes wait()ers, who see `error`
+        return self
+
+    def _drop(self) -> None:
+        if self.emb is not None:
+            self.emb.close()
+        self.emb = self.backend = None
+        self.text_vs = self.text_lexical = self.text_filter = self.image_matcher = None
+
+    def unload(self) -> None:
+        """Drop the loaded indexes (a PackRegistry evicting this pack); the next wait() loads them again."""
+        with self._load_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return  # still loading in the background; evict it later
+            self._drop()
+            self.error = None
+            self._thread = None
+            self._ready.clear()
+
+    def memory_mb(self) -> float:
+        """Approximate RAM held by the loaded indexes (FAISS index, BM25 arrays, image matrix)."""
+        import numpy as np
+
+        total = 0
+        if self.text_vs is not None:
+            index = self.text_vs.index
+            total += index.ntotal * getattr(index, "code_size", index.d * 4)  # bytes per stored vector
+        for holder in (self.text_lexical, self.image_matcher):
+            if holder is not None:
+                total += sum(v.nbytes for v in vars(holder).values() if isinstance(v, np.ndarray))
+        return round(total / 2**20, 2)
+
+    def _load(self) -> None:
+        timer, log = self.timer, self.log
+        with timer.phase("imports: retrieval"):
+            from .assets import INDEX_FILE, asset_settings
+            from .embedding import TruncatedEmbeddings, check_backend, make_backend
+            from .filters import RowFilter
+            from .image_matcher import ImageMatcher
+            from .lexical import load_lexical_index
+            from .query_cache import QueryEmbeddingCache
+            from .vector_store import load_faiss_store, pack_paths
+
+        cfg = self.manifest["embedding_config"]
+        indices = self.manifest["precomputed_indices"]
+        with timer.phase("embedding backend"):
+            key = (self.backend_kind, cfg["text"]["model"], str(self.model_dir or ""))
+            backend = self.backend_pool.get(key) if self.backend_pool is not None else None
+            if backend is None:
+                backend = make_backend(self.backend_kind, cfg["text"]["model"], model_dir=self.model_dir,
+                                       num_threads=self.num_threads, keep_alive=self.keep_alive)
+                if self.backend_pool is not None:
+                    self.backend_pool[key] = backend
+            # refuse a backend whose model / normalization / dim cannot serve this pack's vectors
+            check_backend(backend, cfg["text"], "text")
+            check_backend(backend, cfg["images"], "images")
+            # Packs store vectors Matryoshka-truncated to the manifest dim; queries get the same truncation
+            dim = cfg["text"].get("dim")
+            if cfg["images"].get("dim") != dim:
+                raise ValueError("text and image dims must match to share one query-embedding cache")
+            self.backend = backend
+            self.emb = QueryEmbeddingCache(
+                TruncatedEmbeddings(backend, dim),
+                model=f"{backend.cache_key}@{dim}",
+                path=self.root / "vector_db" / "query_cache.sqlite",
+            )
+
+        paths = pack_paths(self.root, indices["text"])
+        if paths["docstore"].exists() and (paths["index"].exists() or paths["vectors"].exists()):
+            with timer.phase("text index"):
+                self.text_vs = load_faiss_store(self.root, indices["text"], self.emb, dim=dim)
+                self.text_filter = RowFilter.from_store(self.text_vs)
+            with timer.phase("lexical index"):
+                self.text_lexical = load_lexical_index(self.root, indices["text"], log=log)
+        else:
+            log(f"! {self.root.name}: no text index (build it with pdfOrMarkdownVectorDBCreation.ipynb); context() will find nothing")
+
+        paths = pack_paths(self.root, indices["images"])
+        if paths["docstore"].exists() and paths["vectors"].exists():
+            with timer.phase("image index"):
+                self.image_matcher = ImageMatcher.from_pack(self.root, indices["images"], self.emb, dim=dim)
+            if self.manifest.get("assets") and not (self.root / asset_settings(self.manifest)["dir"] / INDEX_FILE).exists():
+                log(f"! {self.root.name}: images are shown at full size (run `python -m beacon.assets` for chat-size copies)")
+        else:
+            log(f"! {self.root.name}: no image vector pack (build it with imageCaptionVectorDB.ipynb); getImage() will find nothing")
+        timer.mark("indexes ready")
+
+    def load_in_background(self) -> threading.Thread:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._load_quietly, name="beacon-pack-load", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def _load_quietly(self) -> None:
+        try:
+            self.load()
+        except BaseException as e:
+            self.log(f"! loading {self.root.name} failed: {e}")
+
+    def wait(self, timeout: Optional[float] = None) -> "KnowledgePack":
+        """
+        Block until the indexes are loaded; re-raise the load error if there was one.
+        A failed load (e.g. Ollama not up yet) is retried here once LOAD_RETRY_S have passed.
+        """
+        loading = self._thread is not None and self._thread.is_alive()
+        if not loading and (not self.ready or self._retry_due()):
+            try:
+                self.load()
+            except BaseException:
+                pass  # raised below as RuntimeError, like a background load's error
+        if not self._ready.wait(timeout):
+            raise TimeoutError(f"{self.root.name} indexes still loading after {timeout}s")
+        if self.error is not None:
+            raise RuntimeError(f"{self.root.name} failed to load: {self.error}") from self.error
+        return self
+
+
+# ----------------------------
+# Tools
+# ----------------------------
+
+def format_chunk(doc, max_chars: Optional[int] = None) -> Dict:
+    """Return a dict with the chunk text (cut at `max_chars` if given) + key metadata for prompting & audit."""
+    txt = doc.page_content.strip()
+    if max_chars and len(txt) > max_chars:
+        txt = txt[:max_chars].rstrip() + " …"
+    m = doc.metadata
+    return {
+        "id": m.get("chunk_id"),
+        "topic_id": m.get("topic_id"),
+        "file_id": m.get("file_id"),
+        "locale": m.get("locale"),
+        "path": m.get("path"),
+        "citations": [c.get("title", "") for c in m.get("citations", [])],
+        "text": txt
+    }
+
+
+CONTEXT_HEADER = "### Retrieved Context (use only what is relevant)"
+
+
+def format_passage(i: int, c: Dict) -> str:
+    """One numbered entry of the context block."""
+    cite_str = "; ".join([t for t in c["citations"] if t]) or "—"
+    head = f"[{i}] {c['topic_id']} · {c['file_id']} · {c['locale']} · {c['path']}"
+    if c.get("pack"):
+        head = f"[{i}] {c['pack']} · " + head.split(" ", 1)[1]
+    return f"{head}\n{c['text']}\nSource(s): {cite_str}"
+
+
+def format_context_block(chunks: List[Dict]) -> str:
+    """Human/LLM-friendly context block the agent can drop into its reasoning."""
+    lines = [CONTEXT_HEADER]
+    for i, c in enumerate(chunks, 1):
+        lines.append(format_passage(i, c))
+        lines.append("")  # blank line
+    return "\n".join(lines).strip()
+
+
+def make_tools(packs, counter=None) -> List[Any]:
+    """
+    The agent's tools, bound to `packs` (a KnowledgePack, or a registry.PackRegistry
+    whose questions are routed per pack): context, math, knowledgeMeta, getImage.
+    `counter` (tokens.TokenCounter) measures the context budget; default: by DEFAULT_LLM.
+    """
+    from contextlib import ExitStack
+
+    from langchain_core.tools import tool
+
+    from .registry import PackRegistry
+
+    registry = packs if isinstance(packs, PackRegistry) else PackRegistry.of(packs)
+
+    def _pack_ids(query: str, pack: Optional[str], topic_id: Optional[str] = None,
+                  locale: Optional[str] = None) -> List[str]:
+        if pack:
+            try:
+                return [registry.resolve(pack)]
+            except KeyError:
+                pass  # an unknown pack name is routed like no name
+        return registry.route(query, topic_id=topic_id, locale=locale)
+
+    def _use_routed(stack: ExitStack, keys: Sequence[str]) -> List[KnowledgePack]:
+        # every routed pack, held in `stack`; one that fails to load is skipped (and retried
+        # on a later question) unless it is the home pack or the only one routed to
+        packs, errors = [], []
+        for key in keys:
+            try:
+                packs.append(stack.enter_context(registry.use(key)))
+            except Exception as e:
+                if key == registry.home:
+                    raise
+                registry.log(f"! skipping pack {key}: {e}")
+                errors.append(e)
+        if not packs and errors:
+            raise errors[0]
+        return packs
+
+    @tool
+    def context(
+        query: str,
+        k: int = DEFAULT_K,
+        topic_id: Optional[str] = None,
+        locale: Optional[str] = None,
+        pack: Optional[str] = None
+    ) -> dict:
+        """
+        PURPOSE
+        Retrieve Pack knowledge for the user's query.
+        TRIGGERS — YOU MUST CALL THIS TOOL BEFORE ANSWERING OR REFUSING IF:
+          1) The query involves local geography or place-specific info:
+             - “nearby”, “closest”, “where is…”, shelters/clinics/transport, checkpoints, routes, hours, hazards
+          2) The query is wellbeing/safety-critical or time-sensitive:
+             - first aid, symptoms, medications, exposure, heat/cold, water/food safety, wounds, evacuation, flooding, snakebite, pesticides, hazardous materials
+          3) The query is high-uncertainty and a mistake could harm the user.
+
+        Do NOT refuse until you have called this tool at least once.
+
+        Args:
+            query: Natural-language question or keywords.
+            k: Max separate passages to return (default 4); chunks adjacent to a returned one are merged into it.
+            topic_id: Optional manifest topic filter (e.g. "snakebite", "post-hurricane").
+            locale: Optional locale (e.g. "en", "hi"); "en" also matches bilingual "hi_en" chunks.
+            pack: Optional pack id from knowledgeMeta (e.g. "FLORIDA", "INDIA"); omitted = routed by the query.
+
+        Returns:
+            {
+              "query": str,
+              "k": int,
+              "packs": [str],         # the pack(s) searched
+              "filters": {"topic_id":..., "locale":..., "ignored": {...}},  # unknown values are ignored
+              "context_block": str,   # pasteable summary of chunks, within the pack's token budget
+              "tokens": int,          # size of context_block in chat-model tokens
+              "chunks": [ {id, topic_id, file_id, path, locale, citations[], text, chunk_ids?}, ... ]
+            }
+
+        USAGE NOTES
+        - Use retrieved content to ground your answer
+        - If nothing relevant is found, say so and offer next-best actions present in the Pack.
+        """
+        from .context_assembly import assemble_across, context_settings
+        from .tokens import token_counter
+
+        with ExitStack() as stack:
+            packs = _use_routed(stack, _pack_ids(query, pack, topic_id, locale))
+            sources, filters = [], {}
+            for p in packs:
+                if p.text_vs is None:
+                    continue
+                # topic/locale pre-filter: only matching rows are searched, so a full k comes back
+                allowed, _filter = p.text_filter.mask(topic_id=topic_id, locale=locale)
+                filters = _filter if len(packs) == 1 else dict(filters, **{p.name: _filter})
+                sources.append({"vs": p.text_vs, "lexical": p.text_lexical, "allowed": allowed, "pack": p.name})
+            names = [p.name for p in packs]
+            if not sources:
+                return {"query": query, "k": k, "packs": names, "filters": {},
+                        "context_block": "No text knowledge in this Pack.", "tokens": 0, "chunks": []}
+
+            # Hybrid retrieval (BM25 + vector, RRF) over more candidates, then MMR,
+            # dedup and merging of adjacent chunks into the (first) pack's token budget
+            assembled = assemble_across(
+                sources, query, k=k, counter=counter or token_counter(DEFAULT_LLM),
+                **context_settings(packs[0].manifest),
+            )
+        return {
+            "query": query,
+            "k": k,
+            "packs": names,
+            "filters": filters,
+            "context_block": assembled["context_block"],
+            "tokens": assembled["tokens"],
+            "chunks": assembled["chunks"]
+        }
+
+    @tool
+    def add(a: float, b: float) -> float:
+        """Add two numbers.
+
+        Args:
+            a: First float
+            b: Second float
+        """
+        return a + b
+
+    @tool
+    def subtract(a: float, b: float) -> float:
+        """Subtract first number by second number.
+
+        Args:
+            a: First float
+            b: Second float
+        """
+        return a - b
+
+    @tool
+    def multiply(a: float, b: float) -> float:
+        """Multiply two numbers.
+
+        Args:
+            a: First float
+            b: Second float
+        """
+        return a * b
+
+    @tool
+    def divide(a: float, b: float) -> float:
+        """Divide first number by second number.
+
+        Args:
+            a: First float
+            b: Second float
+        """
+        if b == 0:
+            return 0
+        return a / b
+
+    @tool
+    def knowledgeMeta(pack_dir: Optional[str] = None) -> dict:
+        """
+        Read a knowledge pack manifest and return metadata for trust and recency.
+
+        Args:
+          pack_dir: A pack id (e.g. "FLORIDA") or the path to a pack folder (containing manifest.yaml).
+                    If omitted, uses the home pack.
+
+        Returns:
+          {
+            "name": str,
+            "version": str,
+            "date": str,
+            "locales": [..],
+            "topics_count": int,
+            "manifest_path": str,
+            "packs": [{id, name, version, date, locales, topics, loaded}, ...]  # every pack this kiosk serves
+          }
+
+        """
+        try:
+            key = registry.resolve(pack_dir) if pack_dir else registry.home
+            base, m = registry.packs[key].root, registry.packs[key].manifest  # parsed once, at startup
+        except KeyError:
+            base = Path(pack_dir)
+            if not (base / "manifest.yaml").exists():
+                return {"error": f"manifest.yaml not found at {base / 'manifest.yaml'}"}
+            m = read_manifest(base)
+        return {
+            "name": m.get("name", str(base.name)),
+            "version": m.get("version", "unknown"),
+            "date": m.get("date", "unknown"),
+            "locales": m.get("locales", []),
+            "topics_count": len(m.get("index_of_topics", []) or []),
+            "manifest_path": str(base / "manifest.yaml"),
+            "packs": [registry.describe(k) for k in registry.packs],
+        }
+
+    @tool
+    def getImage(query: str, pack: Optional[str] = None) -> Dict[str, Any]:
+        """
+        PURPOSE
+        Retrieve a single high-confidence Pack image for the query. DO NOT DISPLAY IMAGE, IT IS DONE SO AUTOMATICALLY AT THE TOP OF YOUR MESSAGE.
+
+        TRIGGERS — YOU MUST CALL THIS TOOL WHEN:
+          1) The user asks to "show" or "see" something (e.g., “show me the Heimlich position”),
+          2) The user requests a diagram or visual (diagram / illustrate / picture / visual / map),
+          3) A visual guide would materially improve a physical technique (CPR posture, tourniquet placement, splinting, boiling water, wound cleaning, snakebite immobilization).
+
+        If no suitable image is found, return NO_IMAGE and proceed with clear step-by-step text (and cite “context” if used).
+
+        Args:
+            query: What the image should show.
+            pack: Optional pack id from knowledgeMeta; omitted = routed by the query.
+
+        Returns:
+            {
+              "status": "OK" | "NO_IMAGE",
+              "version": str,
+              "date": str,
+              "locales": [str],
+              "pack_name": str,
+              "image_path": str,      # absolute or pack-relative path
+              "score": float | None,  # cosine similarity, >= the pack's threshold
+              "citations": list       # e.g., [{"title": "...", ...}]
+            }
+        """
+        q = (query or "").strip()
+        keys = _pack_ids(q, pack)
+        manifest = registry.packs[keys[0]].manifest
+        result = {
+            "status": "NO_IMAGE",
+            "version": manifest.get("version", ""),
+            "date": manifest.get("date", ""),
+            "locales": manifest.get("locales", []),
+            "pack_name": manifest.get("name", ""),
+            "image_path": "",
+            "score": None,
+            "citations": []
+        }
+        if not q:
+            return result
+
+        # Exact cosine over every caption; None unless the best one clears the pack threshold
+        # (the conservative default for an uncalibrated pack). Across routed packs, the match
+        # furthest above its own pack's threshold wins.
+        best = None
+        with ExitStack() as stack:
+            for p in _use_routed(stack, keys):
+                if p.image_matcher is None:
+                    continue
+                with span("image.match", pack=p.name):
+                    match = p.image_matcher.match(q)
+                if match is None:
+                    continue
+                margin = match.score - p.image_matcher.threshold
+                if best is None or margin > best[0]:
+                    best = (margin, p, match)
+        if best is None:
+            return result
+        _, p, match = best
+        result.update(
+            status="OK",
+            version=p.manifest.get("version", ""),
+            date=p.manifest.get("date", ""),
+            locales=p.manifest.get("locales", []),
+            pack_name=p.manifest.get("name", ""),
+            image_path=str(p.root / match.doc.metadata["path"]),
+            score=round(match.score, 4),
+            citations=match.doc.metadata.get("citations", []),
+        )
+        return result
+
+    return [context, add, multiply, subtract, divide, knowledgeMeta, getImage]
+
+
+# ----------------------------
+# Agent
+# ----------------------------
+
+SYSTEM_PROMPT = """You are Beacon, a helpful assistant that answers using the active Knowledge Pack (domain- and locale-specific, offline-first).
+
+HARD RULES — TOOL USE
+1) You MUST call the tool named “context” BEFORE answering or refusing if:
+   • The user asks about local geography, “near me/nearby/closest”, directions, hours, routes, checkpoints, shelters, clinics, water points, transport, or place-specific availability, OR
+   • The user’s request affects health, safety, or wellbeing (first aid, symptoms, medications, exposure, heat/cold, water safety, food safety, wound care, evacuation decisions, flooding, snakebite, pesticides, hazardous materials), OR
+   • The query is high-stakes, time-sensitive, or ambiguous in a way that could impact safety.
+   → Do not refuse UNTIL you have called “context”.
+
+2) You MUST call the tool named “getImage” when:
+   • The user says “show me …”, “what does … look like?”, “diagram”, “visual”, “illustrate”, OR
+   • A visual guide would materially improve understanding for a physical technique (e.g., CPR posture, Heimlich, tourniquet placement, splinting, water boiling steps, winding a bandage).
+   If “getImage” returns NO_IMAGE, continue with clear, step-by-step text and cite sources from “context” if available.
+
+3) Tool names must match exactly from {tool_names}. Prefer the smallest sufficient k. If a Pack locale or topic is clear, pass it.
+
+4) Citations: When “context” is used, include a short “Sources” line drawn from its returned citations when you give final guidance.
+
+5) Refusals: Only refuse after calling “context” if (a) the Pack lacks relevant guidance or (b) the request is outside your guardrails. In refusals, suggest the nearest safe alternative or escalation path if the Pack provides one.
+
+6) If the user's message ends with a “PACK RETRIEVAL” block, those tool calls have already been made for this question and count as calling them: answer from that block directly. Only call a tool yourself if you need something it does not cover (another query, topic_id, k, or an image).
+
+OUTPUT STYLE
+• Be concise, stepwise, and actionable. If life/safety-critical, front-load DOs and DON’Ts and emphasize time-critical steps.
+• If the Pack is ambiguous, state assumptions briefly and continue.
+• NEVER hallucinate locations or phone numbers—use “context”. If none found, say so and offer next-best actions present in the Pack.
+
+You MUST use the following tools at least once if the above rules apply:
+{tools}
+(Always call tools by exact name from: {tool_names}. If no rule triggers, you may answer directly.)
+"""
+
+
+def chat_model(llm: str = DEFAULT_LLM, temperature: float = DEFAULT_TEMPERATURE,
+               keep_alive: Optional[Any] = None, **kwargs):
+    """init_chat_model(llm); `keep_alive` is passed on for Ollama models only."""
+    from langchain.chat_models import init_chat_model
+
+    if keep_alive is not None and llm.startswith("ollama:"):
+        kwargs["keep_alive"] = keep_alive
+    return init_chat_model(model=llm, temperature=temperature, **kwargs)
+
+
+def build_prompt(tools: List[Any]):
+    """The agent's ChatPromptTemplate: system prompt with the tool list, history, question, scratchpad."""
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+    from langchain_core.tools import render_text_description
+
+    return ChatPromptTemplate.from_messages([
+        ("system", SYSTEM_PROMPT),
+        MessagesPlaceholder("chat_history", optional=True),
+        ("human", "{input}{prefetched}"),                 # prefetched: router.format_prefetched() block
+        MessagesPlaceholder("agent_scratchpad"),
+    ]).partial(
+        tools=render_text_description(tools),            # tool names + descriptions in plain text
+        tool_names=", ".join([t.name for t in tools]),   # exact callable names
+        prefetched="",
+    )
+
+
+def build_agent(tools: List[Any], llm: str = DEFAULT_LLM, temperature: float = DEFAULT_TEMPERATURE,
+                verbose: bool = False, timer: Optional[StartupTimer] = None, keep_alive: Optional[Any] = None):
+    """Tool-calling AgentExecutor over `tools` with the Beacon system prompt."""
+    timer = timer or StartupTimer()
+    with timer.phase("imports: agent"):
+        from langchain.agents import AgentExecutor, create_tool_calling_agent
+        # timed here, used by chat_model() / build_prompt()
+        from langchain.chat_models import init_chat_model  # noqa: F401
+        from langchain_core.prompts import ChatPromptTemplate  # noqa: F401
+
+    with timer.phase("agent"):
+        model = chat_model(llm, temperature, keep_alive)
+        agent = create_tool_calling_agent(llm=model, tools=tools, prompt=build_prompt(tools))
+        executor = AgentExecutor(agent=agent, tools=tools, verbose=verbose).with_config({"run_name": "Agent"})
+    return executor
+
+
+def prompt_warmup(tools: List[Any], llm: str = DEFAULT_LLM, temperature: float = DEFAULT_TEMPERATURE,
+                  keep_alive: Optional[Any] = None, question: str = "hello"):
+    """
+    A callable that sends the agent's fixed prompt prefix (system prompt + tool
+    schemas, bound exactly as create_tool_calling_agent binds them) for a single
+    output token, so Ollama loads the model and caches that prefix. It returns
+    the response metadata (Ollama's load / prompt_eval durations).
+    """
+    model = chat_model(llm, temperature, keep_alive, num_predict=1).bind_tools(tools)
+    messages = build_prompt(tools).format_messages(input=question, chat_history=[], agent_scratchpad=[])
+    return lambda: dict(model.invoke(messages).response_metadata)
+
+
+def prompt_summarizer(tools: List[Any], llm: str = DEFAULT_LLM, temperature: float = DEFAULT_TEMPERATURE,
+                      keep_alive: Optional[Any] = None, max_tokens: int = 512):
+    """
+    An async callable request -> reply text, for the rolling conversation summary
+    (memory.py). The request goes in as the question behind the agent's own prompt
+    prefix, bound as prompt_warmup binds it, so Ollama reuses the cached prefix and
+    keeps it cached for the next visitor; tool calls in the reply are ignored.
+    """
+    model = chat_model(llm, temperature, keep_alive, num_predict=max_tokens).bind_tools(tools)
+    prompt = build_prompt(tools)
+
+    async def summarize(request: str) -> str:
+        reply = await model.ainvoke(prompt.format_messages(input=request, chat_history=[], agent_scratchpad=[]))
+        return reply.content if isinstance(reply.content, str) else ""
+
+    return summarize
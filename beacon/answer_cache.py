@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import json
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .build_cache import _pack_vector, _unpack_vector
+from .query_cache import normalize_query
+
+# Semantic answer cache in front of the agent (see ChatService.stream).
+#
+# A finished turn is stored with its query embedding; a later question whose
+# embedding has cosine >= threshold with a stored one gets that answer (plus the
+# image and sources its tools returned) without an LLM run. Entries are scoped
+# to pack name + version + LLM + embedding model, so a pack update or a model
+# swap never serves stale answers. Settings per pack in the manifest:
+#
+#   answer_cache:
+#     threshold: 0.95        # cosine; high, "dog bite" must not answer "snake bite"
+#     max_entries: 2000
+#     max_age_days: 30
+#     faq:                   # pre-warmed while the kiosk is idle
+#       - "Where is the nearest shelter?"
+
+DEFAULT_THRESHOLD = 0.95
+DEFAULT_MAX_ENTRIES = 2000
+DEFAULT_MAX_AGE_DAYS = 30.0
+
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)?")
+
+
+def _numbers(text: str) -> List[str]:
+    return _NUMBER_RE.findall(text or "")
+
+
+@dataclass
+class CachedAnswer:
+    query: str               # the stored question that matched
+    answer: str
+    tools: List[Dict[str, Any]]  # [{"tool", "observation"}] as the agent's tool steps returned them
+    similarity: float
+    run_ms: float            # what the original agent run took (= time saved, minus the lookup)
+
+
+class AnswerCache:
+    """
+    Persistent (SQLite) question -> answer cache matched by embedding similarity.
+
+    All vectors of the current scope are held in one normalized matrix, so a
+    lookup is a single mat-vec. Questions must also agree on every number they
+    contain ("12 times 7" never answers "12 times 8").
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        scope: str,
+        *,
+        threshold: float = DEFAULT_THRESHOLD,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+    ):
+        self.path = Path(path)
+        self.scope = scope
+        self.threshold = float(threshold)
+        self.max_entries = int(max_entries)
+        self.max_age_s = float(max_age_days) * 86400
+        self.lookups = 0
+        self.hits = 0
+        self.saved_ms = 0.0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                id        INTEGER PRIMARY KEY,
+                scope     TEXT NOT NULL,
+                query     TEXT NOT NULL,
+                vector    BLOB NOT NULL,
+                answer    TEXT NOT NULL,
+                tools     TEXT NOT NULL,
+                run_ms    REAL NOT NULL,
+                created   REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hits      INTEGER NOT NULL DEFAULT 0,
+                UNIQUE (scope, query)
+            )
+            """
+        )
+        # answers from an older pack version / another model are never served again
+        self._conn.execute("DELETE FROM answers WHERE scope != ?", (scope,))
+        self._conn.commit()
+        self._evict()
+        self._load()
+
+    @classmethod
+    def for_pack(cls, root: Path, manifest: Dict[str, Any], llm: str, embed_key: str,
+                 packs: str = "") -> "AnswerCache":
+        """
+        Cache at <pack>/vector_db/answer_cache.sqlite with the manifest's answer_cache settings.
+        `packs` (PackRegistry.signature()) joins the scope when answers may come from other packs too.
+        """
+        cfg = manifest.get("answer_cache", {}) or {}
+        scope = f"{manifest.get('name', Path(root).name)}@{manifest.get('version', '')}|{llm}|{embed_key}"
+        if packs:
+            scope += f"|{packs}"
+        return cls(
+            Path(root) / "vector_db" / "answer_cache.sqlite",
+            scope,
+            threshold=cfg.get("threshold", DEFAULT_THRESHOLD),
+            max_entries=cfg.get("max_entries", DEFAULT_MAX_ENTRIES),
+            max_age_days=cfg.get("max_age_days", DEFAULT_MAX_AGE_DAYS),
+        )
+
+    def _load(self) -> None:
+        rows = self._conn.execute("SELECT id, query, vector FROM answers WHERE scope = ?", (self.scope,)).fetchall()
+        self._ids = [r[0] for r in rows]
+        self._queries = [r[1] for r in rows]
+        if rows:
+            mat = np.asarray([_unpack_vector(r[2]) for r in rows], dtype=np.float32)
+            norms = np.linalg.norm(mat, axis=1, keepdims=True)
+            self._matrix = mat / np.where(norms == 0, 1.0, norms)
+        else:
+            self._matrix = None
+
+    def _evict(self) -> None:
+        cutoff = time.time() - self.max_age_s
+        self._conn.execute("DELETE FROM answers WHERE scope = ? AND created < ?", (self.scope, cutoff))
+        self._conn.execute(
+            """
+            DELETE FROM answers WHERE id IN (
+                SELECT id FROM answers WHERE scope = ? ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.scope, self.max_entries),
+        )
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, query: str) -> bool:
+        return normalize_query(query) in self._queries
+
+    def lookup(self, query: str, vector: Sequence[float]) -> Optional[CachedAnswer]:
+        t0 = time.perf_counter()
+        with self._lock:
+            self.lookups += 1
+            if self._matrix is None:
+                return None
+            q = np.asarray(vector, dtype=np.float32)
+            q = q / (np.linalg.norm(q) or 1.0)
+            if q.shape[0] != self._matrix.shape[1]:
+                return None
+            scores = self._matrix @ q
+            want = _numbers(query)
+            for i in np.argsort(-scores)[:4]:
+                if scores[i] < self.threshold:
+                    break
+                if _numbers(self._queries[i]) != want:
+                    continue
+                row = self._conn.execute(
+                    "SELECT query, answer, tools, run_ms FROM answers WHERE id = ?", (self._ids[i],)
+                ).fetchone()
+                if row is None:
+                    continue
+                self._conn.execute(
+                    "UPDATE answers SET last_used = ?, hits = hits + 1 WHERE id = ?", (time.time(), self._ids[i])
+                )
+                self._conn.commit()
+                self.hits += 1
+                self.saved_ms += max(0.0, row[3] - (time.perf_counter() - t0) * 1000)
+                return CachedAnswer(row[0], row[1], json.loads(row[2]), float(scores[i]), row[3])
+        return None
+
+    def put(self, query: str, vector: Sequence[float], answer: str, tools: Sequence[Dict[str, Any]],
+            run_ms: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO answers (scope, query, vector, answer, tools, run_ms, created, last_used, hits)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)
+                """,
+                (self.scope, normalize_query(query), _pack_vector(vector), answer,
+                 json.dumps(list(tools), ensure_ascii=False, default=str), float(run_ms), now, now),
+            )
+            self._conn.commit()
+            self._evict()
+            self._load()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._ids),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+                "saved_ms": round(self.saved_ms, 1),
+                "threshold": self.threshold,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM answers WHERE scope = ?", (self.scope,))
+            self._conn.commit()
+            self._load()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
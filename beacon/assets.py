@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+import argparse
+import html
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import yaml
+
+from .build_cache import sha256_file
+
+# Image derivatives for the chat UI. Pack images are print resolution (up to
+# 2550x3300 px, 3 MB). Shown as they are, every answer with an image sends the
+# whole PNG to the browser, and a low-end tablet then decodes it at full size
+# only to draw it 500 px wide. The build step (build_derivatives, run at the end
+# of ingest.build_image_index or with `python -m beacon.assets PACK`) writes, for
+# every manifest `assets` entry,
+#
+#   vector_db/assets/<hash>-<width>.webp / .jpg    one pair per width, never upscaled
+#   vector_db/assets/index.json                    asset path -> hash, size, derivatives
+#
+# where <hash> is the start of the source file's sha256. A changed image gets new
+# names, so browsers may cache the files forever (server.py serves them at
+# /media/<file> with Cache-Control: immutable), an unchanged one is not encoded
+# again, and files no index entry names any more are removed. Optional manifest
+# settings:
+#
+#   precomputed_indices:
+#     assets:
+#       dir: "vector_db/assets"
+#       widths: [320, 640, 1280]
+#       webp_quality: 80
+#       jpeg_quality: 82
+#
+# The UI shows the smallest derivative at least CHAT_WIDTH wide; with the /media
+# route the browser picks from srcset instead, WebP with a JPEG fallback for
+# older tablet browsers, and a tap opens the largest. Packs without derivatives
+# show the original.
+
+DEFAULT_DIR = "vector_db/assets"
+DEFAULT_WIDTHS = (320, 640, 1280)
+DEFAULT_WEBP_QUALITY = 80
+DEFAULT_JPEG_QUALITY = 82
+CHAT_WIDTH = 640       # CSS px of an image in a chat bubble, roughly
+INDEX_FILE = "index.json"
+HASH_CHARS = 16
+MEDIA_TYPES = {"webp": "image/webp", "jpg": "image/jpeg"}
+MEDIA_NAME_RE = re.compile(r"^[0-9a-f]{%d}-\d+\.(?:webp|jpg)$" % HASH_CHARS)
+
+
+def asset_settings(manifest: Dict[str, Any]) -> Dict[str, Any]:
+    """The manifest's `precomputed_indices.assets` block, with defaults."""
+    cfg = (manifest.get("precomputed_indices", {}) or {}).get("assets", {}) or {}
+    return {
+        "dir": cfg.get("dir", DEFAULT_DIR),
+        "widths": sorted({int(w) for w in cfg.get("widths", DEFAULT_WIDTHS)}),
+        "webp_quality": int(cfg.get("webp_quality", DEFAULT_WEBP_QUALITY)),
+        "jpeg_quality": int(cfg.get("jpeg_quality", DEFAULT_JPEG_QUALITY)),
+    }
+
+
+def _read_manifest(root: Path) -> Dict[str, Any]:
+    with open(Path(root) / "manifest.yaml", "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+# ----------------------------
+# Build
+# ----------------------------
+
+def _target_widths(width: int, widths: Sequence[int]) -> List[int]:
+    """Each configured width, capped at the original's (never upscaled)."""
+    return sorted({min(w, width) for w in widths})
+
+
+def _encode(src: Path, out_dir: Path, digest: str, cfg: Dict[str, Any]) -> Dict[str, Any]:
+    from PIL import Image, ImageOps
+
+    with Image.open(src) as im:
+        im = ImageOps.exif_transpose(im)
+        width, height = im.size
+        has_alpha = im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info)
+        im = im.convert("RGBA" if has_alpha else "RGB")
+        if has_alpha:  # JPEG has no alpha: flatten onto the white a chat bubble shows anyway
+            flat = Image.new("RGB", im.size, (255, 255, 255))
+            flat.paste(im, mask=im.getchannel("A"))
+        else:
+            flat = im
+
+        derivatives = []
+        for w in _target_widths(width, cfg["widths"]):
+            h = max(1, round(height * w / width))
+            for fmt in ("webp", "jpg"):
+                base = im if fmt == "webp" else flat
+                out = base if w == width else base.resize((w, h), Image.LANCZOS, reducing_gap=3.0)
+                name = f"{digest}-{w}.{fmt}"
+                tmp = out_dir / (name + ".tmp")
+                if fmt == "webp":
+                    out.save(tmp, "WEBP", quality=cfg["webp_quality"], method=4)
+                else:
+                    out.save(tmp, "JPEG", quality=cfg["jpeg_quality"], optimize=True, progressive=True)
+                os.replace(tmp, out_dir / name)  # a crash never leaves a half-written file under a final name
+                derivatives.append({"file": name, "format": fmt, "width": w, "height": h,
+                                    "bytes": (out_dir / name).stat().st_size})
+    return {"hash": digest, "width": width, "height": height, "derivatives": derivatives}
+
+
+def _reusable(old: Optional[Dict[str, Any]], digest: str, out_dir: Path, cfg: Dict[str, Any]) -> bool:
+    if not old or old.get("hash") != digest:
+        return False
+    if [d["width"] for d in old["derivatives"] if d["format"] == "webp"] != _target_widths(old["width"], cfg["widths"]):
+        return False
+    return all((out_dir / d["file"]).exists() for d in old["derivatives"])
+
+
+def build_derivatives(
+    root: Path,
+    *,
+    workers: Optional[int] = None,
+    force: bool = False,
+    log: Callable[[str], None] = print,
+) -> Dict[str, Any]:
+    """
+    Write WebP/JPEG derivatives of every manifest `assets` image and index.json
+    (see the comment above). Unchanged images are skipped unless `force`.
+
+    Returns a report: assets, encoded, reused, missing, removed, source / derivative MB, seconds.
+    """
+    t0 = time.perf_counter()
+    root = Path(root)
+    manifest = _read_manifest(root)
+    cfg = asset_settings(manifest)
+    out_dir = root / cfg["dir"]
+    out_dir.mkdir(parents=True, exist_ok=True)
+    index_path = out_dir / INDEX_FILE
+    old = {} if force or not index_path.exists() else json.loads(index_path.read_text(encoding="utf-8"))
+
+    sources: Dict[str, Path] = {}
+    missing = []
+    for a in manifest.get("assets", []) or []:
+        src = root / a["path"]
+        if src.exists():
+            sources[a["path"]] = src
+        else:
+            missing.append(a["path"])
+            log(f"! asset {a['path']} not found; skipped")
+
+    def one(item: Tuple[str, Path]) -> Tuple[str, Dict[str, Any], bool]:
+        rel, src = item
+        digest = sha256_file(src)[:HASH_CHARS]
+        if _reusable(old.get(rel), digest, out_dir, cfg):
+            return rel, old[rel], False
+        return rel, _encode(src, out_dir, digest, cfg), True
+
+    # Pillow releases the GIL while resizing and encoding, so threads use several cores
+    with ThreadPoolExecutor(max_workers=workers or min(4, os.cpu_count() or 1)) as pool:
+        results = list(pool.map(one, sources.items()))
+
+    index = {rel: entry for rel, entry, _ in results}
+    tmp = index_path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(index, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, index_path)
+
+    keep = {d["file"] for entry in index.values() for d in entry["derivatives"]} | {INDEX_FILE}
+    removed = 0
+    for f in out_dir.iterdir():
+        if f.is_file() and f.name not in keep:
+            f.unlink()
+            removed += 1
+
+    encoded = sum(1 for _, _, new in results if new)
+    report = {
+        "assets": len(index),
+        "encoded": encoded,
+        "reused": len(index) - encoded,
+        "missing": missing,
+        "removed": removed,
+        "source_mb": round(sum(p.stat().st_size for p in sources.values()) / 2**20, 2),
+        "derivative_mb": round(sum(d["bytes"] for e in index.values() for d in e["derivatives"]) / 2**20, 2),
+        "chat_mb": round(sum(pick(e, CHAT_WIDTH, "webp")["bytes"] for e in index.values()) / 2**20, 2),
+        "seconds": round(time.perf_counter() - t0, 2),
+    }
+    log(f"Image derivatives: {report['encoded']} encoded, {report['reused']} unchanged, "
+        f"{report['removed']} stale files removed ({report['source_mb']} MB of originals -> "
+        f"{report['chat_mb']} MB at chat size) ✅")
+    return report
+
+
+# ----------------------------
+# Lookup
+# ----------------------------
+
+def pick(entry: Dict[str, Any], width: int, fmt: str = "webp") -> Dict[str, Any]:
+    """The smallest derivative in `fmt` at least `width` wide (else the largest there is)."""
+    options = sorted((d for d in entry["derivatives"] if d["format"] == fmt), key=lambda d: d["width"])
+    return next((d for d in options if d["width"] >= width), options[-1])
+
+
+class AssetCache:
+    """A pack's index.json: derivatives by manifest asset path."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.dir = self.root / asset_settings(_read_manifest(self.root))["dir"]
+        path = self.dir / INDEX_FILE
+        self.index: Dict[str, Dict[str, Any]] = (
+            json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+        )
+        self.mtime = path.stat().st_mtime if path.exists() else None
+
+    def entry(self, image_path: Path) -> Optional[Dict[str, Any]]:
+        try:
+            rel = Path(image_path).resolve().relative_to(self.root.resolve()).as_posix()
+        except ValueError:
+            return None
+        entry = self.index.get(rel)
+        return entry if entry and entry.get("derivatives") else None
+
+    def file(self, name: str) -> Path:
+        return self.dir / name
+
+
+_CACHES: Dict[Path, AssetCache] = {}
+_LOCK = threading.Lock()
+
+
+def _pack_root(path: Path) -> Optional[Path]:
+    for parent in Path(path).resolve().parents:
+        if (parent / "manifest.yaml").exists():
+            return parent
+    return None
+
+
+def asset_cache(root: Path) -> AssetCache:
+    """The pack's AssetCache, re-read when index.json was rebuilt."""
+    root = Path(root).resolve()
+    with _LOCK:
+        cache = _CACHES.get(root)
+        if cache is not None:
+            path = cache.dir / INDEX_FILE
+            if (path.stat().st_mtime if path.exists() else None) == cache.mtime:
+                return cache
+        cache = _CACHES[root] = AssetCache(root)
+        return cache
+
+
+def find_derivatives(image_path: str) -> Optional[Tuple[AssetCache, Dict[str, Any]]]:
+    """(cache, index entry) for a pack image path (e.g. getImage's image_path), or None if not built."""
+    root = _pack_root(Path(image_path))
+    if root is None:
+        return None
+    cache = asset_cache(root)
+    entry = cache.entry(Path(image_path))
+    return (cache, entry) if entry else None
+
+
+def media_file(roots: Sequence[Path], name: str) -> Optional[Path]:
+    """The derivative file called `name` in any of these packs (for the /media route), or None."""
+    if not MEDIA_NAME_RE.match(name):
+        return None
+    for root in roots:
+        path = asset_cache(root).file(name)
+        if path.exists():
+            return path
+    return None
+
+
+def image_html(entry: Dict[str, Any], url_prefix: str, alt: str = "", width: int = CHAT_WIDTH) -> str:
+    """<picture> for a chat bubble: WebP srcset, JPEG fallback, a link to the largest size."""
+    def srcset(fmt: str) -> str:
+        return ", ".join(f"{url_prefix}/{d['file']} {d['width']}w"
+                         for d in entry["derivatives"] if d["format"] == fmt)
+
+    shown = pick(entry, width, "jpg")
+    largest = pick(entry, entry["width"], "jpg")
+    shown_w = min(width, shown["width"])
+    sizes = f"(max-width: {shown_w}px) 100vw, {shown_w}px"
+    return (
+        f'<a href="{url_prefix}/{largest["file"]}" target="_blank">'
+        f'<picture><source type="image/webp" srcset="{srcset("webp")}" sizes="{sizes}">'
+        f'<img src="{url_prefix}/{shown["file"]}" srcset="{srcset("jpg")}" sizes="{sizes}" '
+        f'width="{shown_w}" height="{round(shown_w * entry["height"] / entry["width"])}" '
+        f'alt="{html.escape(alt, quote=True)}" decoding="async" style="max-width:100%;height:auto">'
+        f'</picture></a>'
+    )
+
+
+# ----------------------------
+# CLI
+# ----------------------------
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m beacon.assets",
+        description="Write the chat UI's resized WebP/JPEG copies of each pack's images",
+    )
+    parser.add_argument("packs", nargs="*", type=Path,
+                        help="pack directories (default: every pack in 'Knowledge Packs')")
+    parser.add_argument("--workers", type=int, help="images encoded in parallel (default: up to 4)")
+    parser.add_argument("--force", action="store_true", help="re-encode unchanged images too")
+    args = parser.parse_args(argv)
+
+    packs = args.packs or sorted(p.parent for p in Path("Knowledge Packs").glob("*/manifest.yaml"))
+    if not packs:
+        parser.error("no packs found")
+    status = 0
+    for pack in packs:
+        print(f"== {Path(pack).name}")
+        report = build_derivatives(pack, workers=args.workers, force=args.force)
+        status = status or int(bool(report["missing"]))
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
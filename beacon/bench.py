@@ -0,0 +1,484 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import yaml
+
+from .chunking import STRATEGIES
+
+# Offline retrieval benchmark over per-pack golden queries.
+#
+#   <pack>/eval/golden.yaml
+#     stand_in:                # optional settings for the stand-in embedder
+#       match_threshold: 0.3   # image threshold used instead of the (nomic-calibrated) manifest one
+#     text:
+#       - query: "..."
+#         expect: {file_id: ...}          # chunk metadata keys and/or "text" (substring);
+#                                         # a list of such dicts = several relevant targets
+#         topic_id: ...                   # optional: run filtered, as context(topic_id=...) does
+#         locale: ...
+#     images:
+#       - query: "..."
+#         expect: asset-id                # null = getImage should return nothing
+#
+# Stand-in mode (default) rebuilds the pack from its sources into a work dir with
+# HashingEmbeddings: deterministic, no Ollama, so it runs in CI and scores the
+# effect of chunking / index type / threshold changes (`--chunking chars` builds
+# with the old character splitter, to compare chunk counts, fill and recall
+# against the manifest's strategy). `--real` benchmarks the
+# shipped vectors with the manifest's model (Ollama, or in-process ONNX with
+# `--backend onnx`), the way the kiosk loads them.
+
+GOLDEN_FILE = Path("eval") / "golden.yaml"
+PERCENTILES = (50, 95, 99)
+FETCH_K = 20  # candidates per side before fusion, as hybrid_search
+
+# quality metrics compared against a baseline report (higher is better)
+QUALITY_KEYS = ("recall@{k}", "mrr", "hit_rate", "top1_accuracy", "reject_rate")
+
+
+# ----------------------------
+# Golden sets / scoring
+# ----------------------------
+
+def load_golden(root: Path) -> Dict[str, Any]:
+    path = Path(root) / GOLDEN_FILE
+    if not path.exists():
+        raise FileNotFoundError(f"no golden queries at {path}")
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+
+def _targets(expect) -> List[Dict[str, Any]]:
+    return list(expect) if isinstance(expect, list) else [expect]
+
+
+def latency_summary(ms: Sequence[float]) -> Dict[str, float]:
+    if not ms:
+        return {"n": 0}
+    arr = np.asarray(ms, dtype=np.float64)
+    out: Dict[str, float] = {"n": int(arr.size), "mean": round(float(arr.mean()), 3)}
+    for p in PERCENTILES:
+        out[f"p{p}"] = round(float(np.percentile(arr, p)), 3)
+    return out
+
+
+class _Stages:
+    """Per-stage latency samples in ms."""
+
+    def __init__(self):
+        self.ms: Dict[str, List[float]] = {}
+
+    def time(self, stage: str, fn: Callable[[], Any]) -> Any:
+        t0 = time.perf_counter()
+        out = fn()
+        self.ms.setdefault(stage, []).append((time.perf_counter() - t0) * 1000)
+        return out
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {stage: latency_summary(ms) for stage, ms in self.ms.items()}
+
+
+# ----------------------------
+# Text retrieval (the `context` tool)
+# ----------------------------
+
+def bench_text(vs, lexical, row_filter, cases: Sequence[Dict[str, Any]], k: int = 4,
+               repeats: int = 3, stages: Optional[_Stages] = None) -> Dict[str, Any]:
+    """
+    recall@k and MRR of vector-only, BM25-only and hybrid retrieval, timing each
+    stage of the hybrid path (embed, filter, vector, bm25, fuse+docstore) and the
+    context tool's assembly (context_assembly.py) with the size of its block.
+
+    recall@k is the share of a query's expected targets found in its top k,
+    averaged over queries; MRR uses the first relevant hit.
+    """
+    from .agent import DEFAULT_LLM
+    from .context_assembly import assemble_context
+    from .lexical import matches_expect, rrf_fuse, row_documents, vector_rows
+    from .tokens import token_counter
+
+    stages = stages or _Stages()
+    counter = token_counter(DEFAULT_LLM, log=lambda *_: None)
+    block_tokens: List[int] = []
+    modes = ("vector", "bm25", "hybrid") if lexical is not None else ("vector",)
+    totals = {m: {"recall": 0.0, "rr": 0.0} for m in modes}
+    misses: List[str] = []
+
+    for case in cases:
+        query = case["query"]
+        targets = _targets(case["expect"])
+        for rep in range(max(1, repeats)):
+            t0 = time.perf_counter()
+            vec = stages.time("text.embed", lambda: vs.embedding_function.embed_query(query))
+            allowed = None
+            if case.get("topic_id") or case.get("locale"):
+                allowed, _ = stages.time(
+                    "text.filter", lambda: row_filter.mask(topic_id=case.get("topic_id"), locale=case.get("locale"))
+                )
+            v_rows = stages.time("text.vector", lambda: vector_rows(vs, query, max(k, FETCH_K), vector=vec, allowed=allowed))
+            rows = {"vector": v_rows[:k]}
+            if lexical is not None:
+                l_rows = stages.time("text.bm25", lambda: [r for r, _ in lexical.search(query, FETCH_K, allowed=allowed)])
+                rows["bm25"] = l_rows[:k]
+                docs = stages.time(
+                    "text.fuse", lambda: row_documents(vs, [r for r, _ in rrf_fuse([v_rows, l_rows])[:k]])
+                )
+            else:
+                docs = stages.time("text.fuse", lambda: row_documents(vs, v_rows[:k]))
+            stages.ms.setdefault("text.total", []).append((time.perf_counter() - t0) * 1000)
+            assembled = stages.time(
+                "text.assemble",
+                lambda: assemble_context(vs, lexical, query, k=k, counter=counter, vector=vec, allowed=allowed),
+            )
+            if rep:
+                continue
+            block_tokens.append(assembled["tokens"])
+
+            # score once per query (results are deterministic across repeats)
+            ranked = {"vector": row_documents(vs, rows["vector"])}
+            if lexical is not None:
+                ranked.update(bm25=row_documents(vs, rows["bm25"]), hybrid=docs)
+            for mode in modes:
+                found = [any(matches_expect(d, t) for d in ranked[mode]) for t in targets]
+                totals[mode]["recall"] += sum(found) / len(targets)
+                first = next((i for i, d in enumerate(ranked[mode], 1) if any(matches_expect(d, t) for t in targets)), None)
+                totals[mode]["rr"] += 1.0 / first if first else 0.0
+            if not any(matches_expect(d, t) for d in ranked[modes[-1]] for t in targets):
+                misses.append(query)
+
+    n = max(1, len(cases))
+    report: Dict[str, Any] = {"queries": len(cases), "filtered": sum(bool(c.get("topic_id") or c.get("locale")) for c in cases)}
+    for mode in modes:
+        report[mode] = {
+            f"recall@{k}": round(totals[mode]["recall"] / n, 3),
+            "mrr": round(totals[mode]["rr"] / n, 3),
+        }
+    report["context_tokens"] = {
+        "mean": round(float(np.mean(block_tokens)), 1) if block_tokens else 0.0,
+        "max": max(block_tokens, default=0),
+        "counter": counter.name,
+    }
+    report["misses"] = misses
+    return report
+
+
+# ----------------------------
+# Image matching (the `getImage` tool)
+# ----------------------------
+
+def bench_images(matcher, cases: Sequence[Dict[str, Any]], repeats: int = 3,
+                 stages: Optional[_Stages] = None) -> Dict[str, Any]:
+    """
+    hit_rate: positives whose accepted match is the expected asset.
+    top1_accuracy: positives whose best caption is the expected asset, ignoring the threshold.
+    reject_rate: negatives (expect: null) for which nothing clears the threshold.
+    """
+    stages = stages or _Stages()
+    positives = [c for c in cases if c.get("expect")]
+    negatives = [c for c in cases if not c.get("expect")]
+    hits = top1 = rejected = 0
+    misses: List[str] = []
+
+    for case in cases:
+        query = case["query"]
+        for rep in range(max(1, repeats)):
+            t0 = time.perf_counter()
+            vec = stages.time("image.embed", lambda: matcher.embeddings.embed_query(query))
+            match = stages.time("image.match", lambda: matcher.match_vector(vec))
+            stages.ms.setdefault("image.total", []).append((time.perf_counter() - t0) * 1000)
+            if rep:
+                continue
+            got = match.doc.metadata.get("id") if match is not None else None
+            if case.get("expect"):
+                best = matcher.rank(vec, k=1)[0][0].metadata.get("id")
+                top1 += best == case["expect"]
+                hits += got == case["expect"]
+                if got != case["expect"]:
+                    misses.append(f"{query} -> {got} (want {case['expect']})")
+            else:
+                rejected += got is None
+                if got is not None:
+                    misses.append(f"{query} -> {got} (want none)")
+
+    return {
+        "queries": len(cases),
+        "positives": len(positives),
+        "negatives": len(negatives),
+        "threshold": matcher.threshold,
+        "hit_rate": round(hits / len(positives), 3) if positives else None,
+        "top1_accuracy": round(top1 / len(positives), 3) if positives else None,
+        "reject_rate": round(rejected / len(negatives), 3) if negatives else None,
+        "misses": misses,
+    }
+
+
+# ----------------------------
+# Pack setup
+# ----------------------------
+
+def default_workdir(root: Path, chunking: Optional[str] = None) -> Path:
+    """Stand-in builds persist here between runs (one per --chunking), so only changed files are re-chunked."""
+    name = Path(root).resolve().name + (f"--{chunking.replace('+', '-')}" if chunking else "")
+    return Path(tempfile.gettempdir()) / "beacon-bench" / name
+
+
+def prepare_workdir(root: Path, workdir: Path) -> Path:
+    """
+    Mirror a pack into `workdir` for a stand-in build: manifest.yaml is copied
+    fresh every run (so edits to chunking / faiss.type apply), sources are
+    symlinked (copied where symlinks are unavailable) and vector_db stays local.
+    """
+    root, workdir = Path(root).resolve(), Path(workdir)
+    workdir.mkdir(parents=True, exist_ok=True)
+    shutil.copy2(root / "manifest.yaml", workdir / "manifest.yaml")
+    for entry in root.iterdir():
+        if entry.name in ("manifest.yaml", "vector_db", GOLDEN_FILE.parts[0]):
+            continue
+        dest = workdir / entry.name
+        if dest.exists() or dest.is_symlink():
+            continue
+        try:
+            os.symlink(entry, dest, target_is_directory=entry.is_dir())
+        except OSError:
+            (shutil.copytree if entry.is_dir() else shutil.copy2)(entry, dest)
+    return workdir
+
+
+def run_benchmark(
+    root: Path,
+    *,
+    real: bool = False,
+    workdir: Optional[Path] = None,
+    k: int = 4,
+    repeats: int = 3,
+    index_type: Optional[str] = None,
+    backend: str = "ollama",
+    model_dir: Optional[Path] = None,
+    num_threads: Optional[int] = None,
+    chunking: Optional[str] = None,
+    tokenizer: Optional[Path] = None,
+    log: Callable[[str], None] = print,
+) -> Dict[str, Any]:
+    """
+    Benchmark one pack against its golden set. Returns a JSON-safe report with
+    text/image quality and p50/p95/p99 latency per retrieval stage.
+    With `real`, queries are embedded by `backend` ("ollama" or "onnx" with
+    `model_dir`), checked against the manifest's embedding_config first.
+    Stand-in builds chunk with `chunking` (default: the manifest's strategy),
+    counting tokens with `tokenizer` (see ingest.build_text_index; without one,
+    by the estimate, which the report names); the report's
+    "chunking" has the chunk size distribution and build / embed seconds.
+    """
+    from .embedding import HashingEmbeddings, TruncatedEmbeddings, check_backend, make_backend
+    from .filters import RowFilter
+    from .image_matcher import ImageMatcher
+    from .ingest import build_image_index, build_text_index, load_manifest
+    from .lexical import load_lexical_index
+    from .vector_store import index_kind, load_faiss_store, pack_paths
+
+    root = Path(root)
+    golden = load_golden(root)
+    manifest = load_manifest(root)
+    text_dim = manifest["embedding_config"]["text"].get("dim")
+    image_dim = manifest["embedding_config"]["images"].get("dim")
+    report: Dict[str, Any] = {"pack": manifest.get("name"), "mode": "real" if real else "stand-in", "k": k}
+    stages = _Stages()
+    threshold = None
+
+    if real:
+        if index_type or chunking:
+            log("! index_type / chunking are ignored with --real (the shipped index is benchmarked; see reindex_pack)")
+        pack_root = root
+        model = manifest["embedding_config"]["text"]["model"]
+        emb = make_backend(backend, model, model_dir=model_dir, num_threads=num_threads)
+        check_backend(emb, manifest["embedding_config"]["text"], "text")
+        check_backend(emb, manifest["embedding_config"]["images"], "images")
+        report["backend"] = emb.describe()
+        text_emb = TruncatedEmbeddings(emb, text_dim)
+        image_emb = TruncatedEmbeddings(emb, image_dim)
+    else:
+        pack_root = prepare_workdir(root, workdir or default_workdir(root, chunking))
+        # overrides go into the workdir manifest, which the loaders below read
+        if chunking:
+            manifest["embedding_config"]["text"].setdefault("chunking", {})["strategy"] = chunking
+        if index_type:
+            for cfg in (manifest.get("precomputed_indices") or {}).values():
+                cfg.setdefault("faiss", {})["type"] = index_type
+        if chunking or index_type:
+            (pack_root / "manifest.yaml").write_text(yaml.safe_dump(manifest, allow_unicode=True, sort_keys=False),
+                                                     encoding="utf-8")
+        model = HashingEmbeddings(text_dim or 512).model
+        text_emb = HashingEmbeddings(text_dim or 512)
+        image_emb = HashingEmbeddings(image_dim or 512)
+        threshold = (golden.get("stand_in") or {}).get("match_threshold")
+        log(f"Stand-in build in {pack_root}")
+    report["model"] = model
+
+    text_cases = golden.get("text") or []
+    if text_cases:
+        idx_cfg = manifest["precomputed_indices"]["text"]
+        if not real:
+            t0 = time.perf_counter()
+            _, build = build_text_index(pack_root, index_type=index_type, backend=text_emb, tokenizer=tokenizer,
+                                        allow_estimate=True, log=lambda *_: None)
+            report["build_text_s"] = round(time.perf_counter() - t0, 2)
+            report["chunking"] = dict(build["chunking"], strategy=chunking or manifest["embedding_config"]["text"].get(
+                "chunking", {}).get("strategy"), embed_s=(build.get("embed") or {}).get("seconds", 0.0))
+        if pack_paths(pack_root, idx_cfg)["vectors"].exists():
+            vs = load_faiss_store(pack_root, idx_cfg, text_emb, dim=text_dim)
+            if index_type and not real and index_kind(vs.index) != index_type:
+                raise RuntimeError(f"{pack_root}: asked for a {index_type} index, loaded {index_kind(vs.index)}")
+            lexical = load_lexical_index(pack_root, idx_cfg, log=log)
+            report["text"] = bench_text(vs, lexical, RowFilter.from_store(vs), text_cases, k=k, repeats=repeats, stages=stages)
+            report["text"]["chunks"] = vs.index.ntotal
+            report["text"]["index"] = index_kind(vs.index)
+        else:
+            log(f"! {manifest.get('name')}: no text index in the pack; text queries skipped (benchmark without --real)")
+
+    image_cases = golden.get("images") or []
+    if image_cases:
+        idx_cfg = manifest["precomputed_indices"]["images"]
+        if not real:
+            build_image_index(pack_root, index_type=index_type, backend=image_emb, log=lambda *_: None)
+        matcher = ImageMatcher.from_pack(pack_root, idx_cfg, image_emb, threshold=threshold, dim=image_dim)
+        report["images"] = bench_images(matcher, image_cases, repeats=repeats, stages=stages)
+
+    report["latency_ms"] = stages.summary()
+    return report
+
+
+# ----------------------------
+# Reporting / regression check
+# ----------------------------
+
+def _quality(report: Dict[str, Any]) -> Dict[str, float]:
+    keys = [q.format(k=report.get("k", 4)) for q in QUALITY_KEYS]
+    out: Dict[str, float] = {}
+    for section in ("text", "images"):
+        sec = report.get(section) or {}
+        for name, val in sec.items():
+            if isinstance(val, dict):
+                out.update({f"{section}.{name}.{m}": v for m, v in val.items() if m in keys and v is not None})
+            elif name in keys and val is not None:
+                out[f"{section}.{name}"] = val
+    return out
+
+
+def compare_reports(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.0) -> List[str]:
+    """Quality metrics that dropped more than `tolerance` below the baseline report."""
+    now, before = _quality(report), _quality(baseline)
+    return [
+        f"{key}: {before[key]} -> {now.get(key)}"
+        for key in sorted(before)
+        if key in now and now[key] < before[key] - tolerance
+    ]
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    k = report.get("k", 4)
+    via = f" via {report['backend']['backend']}" if report.get("backend") else ""
+    lines = [f"== {report.get('pack')} [{report.get('mode')}, {report.get('model')}{via}]"]
+    text = report.get("text")
+    if text:
+        lines.append(f"text: {text['queries']} queries ({text['filtered']} filtered), "
+                     f"{text.get('chunks')} chunks, index {text.get('index')}")
+        for mode in ("vector", "bm25", "hybrid"):
+            if mode in text:
+                lines.append(f"  {mode:<7} recall@{k} {text[mode][f'recall@{k}']:.3f}   mrr {text[mode]['mrr']:.3f}")
+        if "context_tokens" in text:
+            ct = text["context_tokens"]
+            lines.append(f"  context block tokens mean {ct['mean']} / max {ct['max']} ({ct['counter']})")
+        lines += [f"  miss: {q}" for q in text["misses"]]
+    ch = report.get("chunking")
+    if ch and ch.get("chunks"):
+        lines.append(f"chunking {ch['strategy']} ({ch.get('tokenizer')}): {ch['chunks']} chunks, "
+                     f"tokens mean {ch['tokens_mean']} / p95 {ch['tokens_p95']} / max {ch['tokens_max']}, "
+                     f"fill {ch['fill']:.0%}, {ch['over_max']} over max_tokens; build {report.get('build_text_s')}s "
+                     f"(embedding {ch['embed_s']}s)")
+    images = report.get("images")
+    if images:
+        lines.append(f"images: {images['positives']} positives / {images['negatives']} negatives, "
+                     f"threshold {images['threshold']}")
+        lines.append(f"  hit_rate {images['hit_rate']}   top1_accuracy {images['top1_accuracy']}   "
+                     f"reject_rate {images['reject_rate']}")
+        lines += [f"  miss: {m}" for m in images["misses"]]
+    lines.append(f"  {'stage':<14}" + "".join(f"{'p' + str(p):>10}" for p in PERCENTILES) + "   (ms)")
+    for stage, s in report.get("latency_ms", {}).items():
+        lines.append(f"  {stage:<14}" + "".join(f"{s.get(f'p{p}', 0):>10.3f}" for p in PERCENTILES))
+    return "\n".join(lines)
+
+
+def find_packs(packs_dir: Path) -> List[Path]:
+    """Every pack under `packs_dir` that ships a golden set."""
+    return sorted(p for p in Path(packs_dir).iterdir() if (p / GOLDEN_FILE).exists())
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m beacon.bench",
+        description="Retrieval quality + latency on each pack's eval/golden.yaml",
+    )
+    parser.add_argument("packs", nargs="*", type=Path,
+                        help="pack directories (default: every pack in 'Knowledge Packs' with a golden set)")
+    parser.add_argument("--real", action="store_true", help="use the shipped vectors and the manifest's embedding model")
+    parser.add_argument("--backend", default="ollama", choices=("ollama", "onnx"), help="embedding backend with --real")
+    parser.add_argument("--model-dir", type=Path, help="model.onnx + tokenizer.json folder for --backend onnx")
+    parser.add_argument("--threads", type=int, help="embedding threads with --real")
+    parser.add_argument("-k", type=int, default=4, help="top-k for text retrieval (the context tool's default)")
+    parser.add_argument("--repeats", type=int, default=3, help="timed runs per query")
+    parser.add_argument("--index-type", help="stand-in builds only: override the manifest faiss.type")
+    parser.add_argument("--workdir", type=Path, help="stand-in build directory (one pack only)")
+    parser.add_argument("--chunking", choices=STRATEGIES,
+                        help="stand-in builds only: chunk with this strategy instead of the manifest's")
+    parser.add_argument("--tokenizer", type=Path,
+                        help="embedding model tokenizer.json for chunk token counts (stand-in builds)")
+    parser.add_argument("--json", type=Path, help="write the reports to this file")
+    parser.add_argument("--baseline", type=Path, help="earlier --json output; exit 1 if quality dropped")
+    parser.add_argument("--tolerance", type=float, default=0.0, help="allowed drop per quality metric")
+    args = parser.parse_args(argv)
+
+    packs = args.packs or find_packs(Path("Knowledge Packs"))
+    if not packs:
+        parser.error("no packs with eval/golden.yaml found")
+    if args.workdir and len(packs) > 1:
+        parser.error("--workdir needs a single pack")
+
+    reports = []
+    for pack in packs:
+        report = run_benchmark(
+            pack, real=args.real, workdir=args.workdir, k=args.k,
+            repeats=args.repeats, index_type=args.index_type,
+            backend=args.backend, model_dir=args.model_dir, num_threads=args.threads,
+            chunking=args.chunking, tokenizer=args.tokenizer,
+        )
+        print(format_report(report), flush=True)
+        reports.append(report)
+
+    if args.json:
+        args.json.write_text(json.dumps(reports, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    if args.baseline:
+        before = {r["pack"]: r for r in json.loads(args.baseline.read_text(encoding="utf-8"))}
+        regressions = [
+            f"{r['pack']}: {line}"
+            for r in reports if r["pack"] in before
+            for line in compare_reports(r, before[r["pack"]], args.tolerance)
+        ]
+        for line in regressions:
+            print("REGRESSION", line)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
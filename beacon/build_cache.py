@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import time
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+# ----------------------------
+# Content hashing
+# ----------------------------
+
+def sha256_file(path: Path, block_size: int = 1 << 20) -> str:
+    """Hex SHA-256 of a file's bytes (streamed, so large PDFs don't load into RAM)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def sha256_text(text: str) -> str:
+    """Hex SHA-256 of a chunk's text (UTF-8)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _pack_vector(vec: Sequence[float]) -> bytes:
+    return array("f", vec).tobytes()
+
+
+def _unpack_vector(blob: bytes) -> List[float]:
+    a = array("f")
+    a.frombytes(blob)
+    return a.tolist()
+
+
+# ----------------------------
+# Persistent build cache
+# ----------------------------
+
+class BuildCache:
+    """
+    SQLite file that makes pack builds incremental and resumable.
+
+    Tables:
+      - files:      (file_key) -> file hash, chunking config key, extracted chunks (JSON)
+      - embeddings: (model, chunk_hash) -> float32 vector
+      - pdfs/pages: (file_hash, page) -> extracted PDF page text + status, so
+                    re-chunking with new settings never re-parses a PDF
+
+    Every file and every embedding batch is committed as soon as it is produced,
+    so the cache doubles as the build checkpoint: re-running an interrupted build
+    only redoes the work that never reached disk.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                file_key   TEXT PRIMARY KEY,
+                file_hash  TEXT NOT NULL,
+                config_key TEXT NOT NULL,
+                chunks     TEXT NOT NULL,
+                updated    REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model      TEXT NOT NULL,
+                chunk_hash TEXT NOT NULL,
+                dim        INTEGER NOT NULL,
+                vector     BLOB NOT NULL,
+                PRIMARY KEY (model, chunk_hash)
+            );
+            CREATE TABLE IF NOT EXISTS pdfs (
+                file_hash  TEXT PRIMARY KEY,
+                page_count INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                file_hash  TEXT NOT NULL,
+                page       INTEGER NOT NULL,
+                text       TEXT NOT NULL,
+                status     TEXT NOT NULL,
+                error      TEXT,
+                PRIMARY KEY (file_hash, page)
+            );
+            CREATE TABLE IF NOT EXISTS state (
+                key   TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            """
+        )
+        self.conn.commit()
+
+    # --- file-level chunk cache ---
+    def get_file_chunks(self, file_key: str, file_hash: str, config_key: str) -> Optional[List[Dict[str, Any]]]:
+        """Return cached chunks if the file bytes and chunking config are unchanged, else None."""
+        row = self.conn.execute(
+            "SELECT file_hash, config_key, chunks FROM files WHERE file_key = ?", (file_key,)
+        ).fetchone()
+        if row is None or row[0] != file_hash or row[1] != config_key:
+            return None
+        return json.loads(row[2])
+
+    def put_file_chunks(self, file_key: str, file_hash: str, config_key: str, chunks: List[Dict[str, Any]]) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files (file_key, file_hash, config_key, chunks, updated) VALUES (?, ?, ?, ?, ?)",
+            (file_key, file_hash, config_key, json.dumps(chunks, ensure_ascii=False), time.time()),
+        )
+        self.conn.commit()
+
+    # --- embedding cache keyed by (model, chunk hash) ---
+    def get_vectors(self, model: str, chunk_hashes: Iterable[str]) -> Dict[str, List[float]]:
+        """Look up cached vectors; missing hashes are simply absent from the result."""
+        out: Dict[str, List[float]] = {}
+        hashes = list(dict.fromkeys(chunk_hashes))
+        # SQLite limits bound parameters, so query in slices
+        for i in range(0, len(hashes), 500):
+            part = hashes[i:i + 500]
+            marks = ",".join("?" * len(part))
+            rows = self.conn.execute(
+                f"SELECT chunk_hash, vector FROM embeddings WHERE model = ? AND chunk_hash IN ({marks})",
+                (model, *part),
+            )
+            for chunk_hash, blob in rows:
+                out[chunk_hash] = _unpack_vector(blob)
+        return out
+
+    def put_vectors(self, model: str, items: Sequence[Tuple[str, Sequence[float]]]) -> None:
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, chunk_hash, dim, vector) VALUES (?, ?, ?, ?)",
+            [(model, h, len(v), _pack_vector(v)) for h, v in items],
+        )
+        self.conn.commit()
+
+    # --- per-page PDF text cache keyed by (file hash, page number) ---
+    def get_pdf_page_count(self, file_hash: str) -> Optional[int]:
+        row = self.conn.execute("SELECT page_count FROM pdfs WHERE file_hash = ?", (file_hash,)).fetchone()
+        return row[0] if row else None
+
+    def put_pdf_page_count(self, file_hash: str, page_count: int) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO pdfs (file_hash, page_count) VALUES (?, ?)", (file_hash, page_count))
+        self.conn.commit()
+
+    def cached_pages(self, file_hash: str) -> set:
+        """Page numbers (1-indexed) already extracted for this file."""
+        return {r[0] for r in self.conn.execute("SELECT page FROM pages WHERE file_hash = ?", (file_hash,))}
+
+    def put_pages(self, file_hash: str, rows: Sequence[Tuple[int, str, str, Optional[str]]]) -> None:
+        """rows: (page, text, status, error) with status in {"ok", "empty", "error"}."""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO pages (file_hash, page, text, status, error) VALUES (?, ?, ?, ?, ?)",
+            [(file_hash, *r) for r in rows],
+        )
+        self.conn.commit()
+
+    def get_pages(self, file_hash: str) -> List[Tuple[int, str, str, Optional[str]]]:
+        return list(self.conn.execute(
+            "SELECT page, text, status, error FROM pages WHERE file_hash = ? ORDER BY page", (file_hash,)
+        ))
+
+    # --- build progress marker ---
+    def get_state(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, key: str, value: str) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value))
+        self.conn.commit()
+
+    def clear(self) -> None:
+        """Forget everything (used for a forced full rebuild)."""
+        self.conn.executescript("DELETE FROM files; DELETE FROM embeddings; DELETE FROM pdfs; DELETE FROM pages; DELETE FROM state;")
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "BuildCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
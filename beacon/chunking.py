@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+# Chunking for pack ingestion (embedding_config.text.chunking in the manifest):
+#
+#   chunking:
+#     strategy: "semantic+fixed"   # or "fixed", or "chars" (the old character splitter)
+#     max_tokens: 512              # embedding-model tokens (tokens.embedding_token_counter)
+#     overlap_tokens: 64
+#
+# semantic+fixed reads a PDF (all its pages in order) or a Markdown body as
+# blocks: headings, numbered steps and list items, paragraphs (blank lines, "---"
+# rules and sentence ends followed by a new item split them; page numbers and
+# lines repeated at the top / bottom of many pages are dropped).
+# Each heading opens a section. Chunks are filled with whole blocks up to
+# max_tokens; a new section starts a new chunk once the current one holds
+# MIN_FILL of the budget, so a short heading + three steps are not split from
+# each other nor padded with the next topic's first paragraph. A chunk that
+# continues a section starts with its heading and the last overlap_tokens of the
+# previous chunk (whole sentences). Only a block larger than the budget is cut:
+# at sentence ends, and a sentence that alone is too long in fixed windows.
+#
+# fixed is those fixed windows over the whole text (max_tokens, overlap_tokens).
+# chars keeps the RecursiveCharacterTextSplitter at TOK_TO_CHAR characters per
+# token, for comparing against (python -m beacon.bench --chunking chars).
+
+STRATEGIES = ("semantic+fixed", "fixed", "chars")
+DEFAULT_STRATEGY = "semantic+fixed"
+TOK_TO_CHAR = 4      # characters per token assumed by the "chars" strategy
+MIN_FILL = 0.6       # share of max_tokens a chunk needs before a heading may end it
+
+_HEADING_MAX_CHARS = 80
+_HEADING_MAX_WORDS = 12
+_RULE_RE = re.compile(r"^\s*(?:-{3,}|\*{3,}|_{3,})\s*$")
+_PAGE_NUMBER_RE = re.compile(r"^\s*(?:pag\s?e\s+)?\d{1,4}(?:\s+of\s+\d{1,4})?\s*$", re.IGNORECASE)
+_ITEM_RE = re.compile(
+    r"^\s*(?:\d{1,2}[.)]\s|[a-zA-Z][.)]\s|\(\w{1,3}\)\s|[•●▪◦‣○■□➢►✓✔\-–*\uf0a0-\uf0ff]\s?|step\s+\d+\b)", re.IGNORECASE,
+)
+_SECTION_NUMBER_RE = re.compile(r"^\s*(?:\d+(?:\.\d+)*\.?|[A-Z][.)]|[IVX]+\.)\s+\S")
+_TERMINAL_RE = re.compile(r"[.,;:!?।]['\")\]]?\s*$")
+_SENTENCE_RE = re.compile(r"(?<=[.!?।])\s+|\n+")
+_SMALL_WORDS = {"a", "an", "and", "as", "at", "by", "for", "from", "in", "of", "on", "or", "the", "to", "with"}
+
+
+@dataclass
+class Block:
+    kind: str            # "heading" | "item" | "text"
+    text: str
+    tokens: int = 0
+    page: Optional[int] = None
+    carried: bool = False   # repeated from the previous chunk (its heading / overlap)
+
+
+# ----------------------------
+# Structure
+# ----------------------------
+
+def is_heading(line: str) -> bool:
+    """A short title-like line: no sentence punctuation, mostly capitalized words (or all caps)."""
+    line = line.strip()
+    if not line or len(line) > _HEADING_MAX_CHARS or _TERMINAL_RE.search(line):
+        return False
+    words = re.sub(r"^\s*(?:\d+(?:\.\d+)*\.?|[A-Z][.)]|[IVX]+\.)\s+", "", line).split()
+    if not words or len(words) > _HEADING_MAX_WORDS:
+        return False
+    letters = [w for w in words if any(ch.isalpha() for ch in w)]
+    if not letters or sum(ch.isdigit() for ch in line) > len(line) / 3:   # table rows, amounts
+        return False
+    if not any(ch.isascii() for ch in "".join(letters)):
+        return False  # no case in Devanagari: leave those to blank lines / items
+    if line.isupper():
+        return True
+    content = [w for w in letters if w.lower() not in _SMALL_WORDS]
+    capitalized = sum(1 for w in content if w[0].isupper() or not w[0].isalpha())
+    return bool(content) and content[0][0].isupper() and capitalized >= max(1, 0.6 * len(content))
+
+
+def parse_blocks(text: str) -> List[Block]:
+    """`text` as headings, list items / steps and paragraphs, keeping each block's line breaks."""
+    blocks: List[Block] = []
+    lines: List[str] = []
+    kind = "text"
+
+    def close() -> None:
+        nonlocal lines, kind
+        if lines:
+            blocks.append(Block(kind, "\n".join(lines)))
+        lines, kind = [], "text"
+
+    for raw in (text or "").splitlines():
+        line = raw.rstrip()
+        if not line.strip() or _RULE_RE.match(line):
+            close()
+            continue
+        if _PAGE_NUMBER_RE.match(line):
+            continue
+        if _ITEM_RE.match(line) and not (_SECTION_NUMBER_RE.match(line) and is_heading(line)):
+            close()
+            kind = "item"
+        elif is_heading(line) and (not lines or _TERMINAL_RE.search(lines[-1]) or kind == "heading"):
+            if kind != "heading":
+                close()
+            kind = "heading"   # consecutive heading lines are one (wrapped) heading
+        elif kind == "heading":
+            close()
+        elif lines and kind == "text" and _TERMINAL_RE.search(lines[-1]) and len(lines[-1]) < 0.6 * max(
+                len(l) for l in lines):
+            close()  # a short last line ending a sentence: the paragraph ended there
+        lines.append(line)
+    close()
+    return blocks
+
+
+# ----------------------------
+# Splitting
+# ----------------------------
+
+def fixed_windows(text: str, max_tokens: int, overlap_tokens: int, count: Callable[[str], int]) -> List[str]:
+    """Word-aligned windows of at most max_tokens, each repeating the last overlap_tokens of the one before."""
+    words = text.split(" ")
+    sizes = [count(w) for w in words]
+    out: List[str] = []
+    start = 0
+    while start < len(words):
+        end, used = start, 0
+        while end < len(words) and (used + sizes[end] <= max_tokens or end == start):
+            used += sizes[end]
+            end += 1
+        piece = " ".join(words[start:end]).strip()
+        while count(piece) > max_tokens and end - start > 1:   # per-word counts underestimated the join
+            end -= 1
+            piece = " ".join(words[start:end]).strip()
+        if piece:
+            out.append(piece)
+        if end >= len(words):
+            break
+        back, kept = end, 0
+        while back > start + 1 and kept + sizes[back - 1] <= overlap_tokens:
+            back -= 1
+            kept += sizes[back]
+        start = back
+    return out
+
+
+def split_block(block: Block, max_tokens: int, overlap_tokens: int, count: Callable[[str], int]) -> List[Block]:
+    """A block over max_tokens as sentence-aligned pieces (fixed windows for an over-long sentence)."""
+    pieces: List[Block] = []
+    for sentence in (s for s in _SENTENCE_RE.split(block.text) if s.strip()):
+        n = count(sentence)
+        if n <= max_tokens:
+            pieces.append(Block(block.kind, sentence, n, block.page))
+        else:
+            pieces += [Block(block.kind, w, count(w), block.page)
+                       for w in fixed_windows(sentence, max_tokens, overlap_tokens, count)]
+    return pieces
+
+
+def _tail(blocks: Sequence[Block], overlap_tokens: int, count: Callable[[str], int]) -> List[Block]:
+    """The last whole sentences of `blocks` within overlap_tokens (none for a heading-only tail)."""
+    if overlap_tokens <= 0 or not blocks or blocks[-1].kind == "heading":
+        return []
+    sentences = [s for s in _SENTENCE_RE.split(blocks[-1].text) if s.strip()]
+    kept: List[str] = []
+    used = 0
+    for s in reversed(sentences):
+        n = count(s)
+        if used + n > overlap_tokens:
+            break
+        kept.insert(0, s)
+        used += n
+    return [Block(blocks[-1].kind, " ".join(kept), used, blocks[-1].page, carried=True)] if kept else []
+
+
+def pack_blocks(blocks: Sequence[Block], max_tokens: int, overlap_tokens: int,
+                count: Callable[[str], int]) -> List[List[Block]]:
+    """The semantic+fixed strategy (see above): blocks grouped into chunks; carried ones are marked."""
+    sep = count("\n\n") or 1
+    chunks: List[List[Block]] = []
+    current: List[Block] = []
+    used = 0
+    heading: Optional[Block] = None
+
+    def flush(continues: bool) -> None:
+        nonlocal current, used
+        if any(not b.carried for b in current):
+            chunks.append(current)
+        carry: List[Block] = []
+        if continues:
+            if heading is not None and heading.tokens + sep < max_tokens // 2:
+                carry.append(replace(heading, carried=True))
+            carry += _tail([b for b in current if b is not heading], overlap_tokens, count)
+        current = carry
+        used = sum(b.tokens + sep for b in current)
+
+    for block in blocks:
+        block.tokens = count(block.text)
+        if block.kind == "heading":
+            if current and used >= MIN_FILL * max_tokens:
+                flush(continues=False)
+            heading = block
+        parts = [block] if block.tokens <= max_tokens else split_block(block, max_tokens, overlap_tokens, count)
+        for part in parts:
+            if current and used + part.tokens > max_tokens:
+                flush(continues=True)
+                if used + part.tokens > max_tokens:   # the carried heading / overlap does not fit with it
+                    current, used = [], 0
+            current.append(part)
+            used += part.tokens + sep
+    if any(not b.carried for b in current):
+        chunks.append(current)
+    return chunks
+
+
+def running_lines(pages: Sequence[str], edge: int = 3, min_share: float = 0.3) -> Set[str]:
+    """Lines repeated at the top / bottom of many pages (running titles, footers), digits ignored."""
+    if len(pages) < 4:
+        return set()
+    seen: Dict[str, int] = {}
+    for text in pages:
+        lines = [l.strip() for l in text.splitlines() if l.strip()]
+        for line in set(lines[:edge] + lines[-edge:]):
+            key = re.sub(r"\d+", "#", line)
+            seen[key] = seen.get(key, 0) + 1
+    return {key for key, n in seen.items() if n >= max(3, min_share * len(pages))}
+
+
+def _strip_running(text: str, running: Set[str]) -> str:
+    if not running:
+        return text
+    return "\n".join(l for l in text.splitlines() if re.sub(r"\d+", "#", l.strip()) not in running)
+
+
+def _join(blocks: Sequence[Block]) -> str:
+    return "\n\n".join(b.text for b in blocks).strip()
+
+
+def chunk_stats(chunks: Sequence[str], max_tokens: int, count: Callable[[str], int]) -> Dict[str, Any]:
+    """Chunk count and size distribution in tokens: mean / p50 / p95 / max, mean fill of max_tokens, overfull."""
+    sizes = sorted(count(c) for c in chunks)
+    if not sizes:
+        return {"chunks": 0}
+    pct = lambda p: sizes[min(len(sizes) - 1, int(p / 100 * len(sizes)))]  # noqa: E731
+    return {
+        "chunks": len(sizes),
+        "tokens_mean": round(sum(sizes) / len(sizes), 1),
+        "tokens_p50": pct(50),
+        "tokens_p95": pct(95),
+        "tokens_max": sizes[-1],
+        "fill": round(sum(sizes) / len(sizes) / max_tokens, 3),
+        "over_max": sum(1 for n in sizes if n > max_tokens),
+    }
+
+
+class Chunker:
+    """
+    chunker(text) -> chunk texts; chunker.pages([(page, text), ...]) -> [(first page,
+    last page, text)]. semantic+fixed chunks run across page breaks, with lines
+    repeated at the top / bottom of many pages (running titles, footers) removed;
+    the other strategies chunk each page on its own.
+    """
+
+    def __init__(self, settings: Dict[str, Any], count: Optional[Callable[[str], int]] = None):
+        self.strategy = settings.get("strategy", DEFAULT_STRATEGY)
+        self.max_tokens, self.overlap_tokens = int(settings["max_tokens"]), int(settings["overlap_tokens"])
+        self.count = count
+        if self.strategy not in STRATEGIES:
+            raise ValueError(f"unknown chunking strategy {self.strategy!r}; expected one of {', '.join(STRATEGIES)}")
+        if self.strategy == "chars":
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+            self._splitter = RecursiveCharacterTextSplitter(
+                separators=["\n\n", "\n", "। ", ". ", "?", "!", " "],
+                chunk_size=max(64, self.max_tokens * TOK_TO_CHAR),
+                chunk_overlap=max(0, self.overlap_tokens * TOK_TO_CHAR),
+                length_function=len,
+            )
+        elif count is None:
+            raise ValueError(f"the {self.strategy!r} chunking strategy needs a token counter")
+
+    def __call__(self, text: str) -> List[str]:
+        if not text or not text.strip():
+            return []
+        if self.strategy == "chars":
+            pieces = self._splitter.split_text(text)
+        elif self.strategy == "fixed":
+            pieces = fixed_windows(" ".join(text.split()), self.max_tokens, self.overlap_tokens, self.count)
+        else:
+            pieces = [_join(c) for c in pack_blocks(parse_blocks(text), self.max_tokens, self.overlap_tokens,
+                                                    self.count)]
+        return [p.strip() for p in pieces if p.strip()]
+
+    def pages(self, pages: Sequence[Tuple[int, str]]) -> List[Tuple[int, int, str]]:
+        if self.strategy != "semantic+fixed":
+            return [(page, page, piece) for page, text in pages for piece in self(text)]
+        running = running_lines([text for _, text in pages])
+        blocks: List[Block] = []
+        for page, text in pages:
+            for block in parse_blocks(_strip_running(text, running)):
+                block.page = page
+                blocks.append(block)
+        out: List[Tuple[int, int, str]] = []
+        for chunk in pack_blocks(blocks, self.max_tokens, self.overlap_tokens, self.count):
+            own = [b.page for b in chunk if not b.carried]
+            text = _join(chunk)
+            if text:
+                out.append((min(own), max(own), text))
+        return out
+
+
+def make_chunker(settings: Dict[str, Any], count: Optional[Callable[[str], int]] = None) -> Chunker:
+    """A Chunker for ingest.chunking_settings() `settings`, counting tokens with `count`."""
+    return Chunker(settings, count)
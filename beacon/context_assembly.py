@@ -0,0 +1,350 @@
+from __future__ import annotations
+
+import hashlib
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .agent import CONTEXT_HEADER, format_chunk, format_context_block, format_passage
+from .lexical import RRF_K, rrf_fuse, row_documents, tokenize, vector_rows
+from .tokens import TokenCounter, token_counter
+from .tracing import span
+
+# Context assembly for the `context` tool: what the agent reads is prefilled on
+# CPU before the first answer token, so the block should carry as much distinct
+# Pack text per token as possible. Instead of the top-k chunks cut at 400 chars:
+#
+#   1. fetch_k hybrid candidates (BM25 + vector, RRF), as hybrid_search
+#   2. drop exact duplicates: the same file indexed under several topics
+#   3. MMR order (relevance = fused score, redundancy = cosine of the stored
+#      vectors; token overlap when the index cannot reconstruct them)
+#   4. a candidate next to an already chosen chunk of the same file is merged into
+#      it, the splitter's overlap removed (a procedure cut mid-way stays whole)
+#   5. paragraphs already in the block are dropped from later passages
+#   6. passages are packed into budget_tokens, counted with the chat model's
+#      tokenizer (tokens.py); the passage that crosses the budget is cut at a
+#      sentence end, at most k separate passages are opened
+#
+# Settings per pack in the manifest (all optional):
+#
+#   context:
+#     budget_tokens: 900   # the whole context block
+#     fetch_k: 20          # candidates before MMR / merging
+#     mmr_lambda: 0.7      # 1 = relevance only, 0 = diversity only
+
+DEFAULT_BUDGET_TOKENS = 900
+DEFAULT_FETCH_K = 20
+DEFAULT_MMR_LAMBDA = 0.7
+MIN_PASSAGE_TOKENS = 48     # a remainder smaller than this is not worth a cut passage
+MIN_OVERLAP_CHARS = 16      # shorter suffix/prefix matches are coincidence, not splitter overlap
+MAX_OVERLAP_CHARS = 1024    # > the 256-char (64-token) chunk overlap the packs are built with
+MIN_DEDUP_LINE_CHARS = 40   # short lines ("---", "Call 911") may legitimately repeat
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?।])\s+|\n+")
+
+
+def context_settings(manifest: Dict[str, Any]) -> Dict[str, Any]:
+    cfg = manifest.get("context", {}) or {}
+    return {
+        "budget_tokens": int(cfg.get("budget_tokens", DEFAULT_BUDGET_TOKENS)),
+        "fetch_k": int(cfg.get("fetch_k", DEFAULT_FETCH_K)),
+        "mmr_lambda": float(cfg.get("mmr_lambda", DEFAULT_MMR_LAMBDA)),
+    }
+
+
+# ----------------------------
+# Candidates + MMR
+# ----------------------------
+
+def candidate_rows(
+    vs,
+    lexical,
+    query: str,
+    fetch_k: int = DEFAULT_FETCH_K,
+    vector: Optional[Sequence[float]] = None,
+    allowed: Optional[np.ndarray] = None,
+) -> List[Tuple[int, float]]:
+    """(row, fused score) best first; vector ranks scored like RRF when the pack has no BM25."""
+    with span("text.vector", rows=vs.index.ntotal):
+        v_rows = vector_rows(vs, query, fetch_k, vector=vector, allowed=allowed)
+    if lexical is None:
+        return [(r, 1.0 / (RRF_K + rank)) for rank, r in enumerate(v_rows, 1)]
+    with span("text.bm25"):
+        l_rows = [r for r, _ in lexical.search(query, fetch_k, allowed=allowed)]
+    return rrf_fuse([v_rows, l_rows])[:fetch_k]
+
+
+def _row_vectors(vs, rows: Sequence[int]) -> Optional[np.ndarray]:
+    """L2-normalized stored vectors for `rows`, or None if the index type cannot reconstruct (IVF)."""
+    try:
+        mat = np.asarray(vs.index.reconstruct_batch(np.asarray(rows, dtype=np.int64)), dtype=np.float32)
+    except Exception:
+        return None
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    return mat / np.where(norms == 0, 1.0, norms)
+
+
+def _token_overlap(texts: Sequence[str]) -> np.ndarray:
+    sets = [set(tokenize(t)) for t in texts]
+    n = len(sets)
+    sim = np.zeros((n, n), dtype=np.float32)
+    for i in range(n):
+        for j in range(i + 1, n):
+            union = len(sets[i] | sets[j])
+            sim[i, j] = sim[j, i] = len(sets[i] & sets[j]) / union if union else 0.0
+    return sim
+
+
+def mmr_order(relevance: Sequence[float], similarity: np.ndarray, lam: float = DEFAULT_MMR_LAMBDA) -> List[int]:
+    """Maximal marginal relevance: every index, most relevant first, penalized by similarity to those before it."""
+    rel = np.asarray(relevance, dtype=np.float32)
+    if rel.size == 0:
+        return []
+    rel = rel / (rel.max() or 1.0)
+    order: List[int] = []
+    left = list(range(len(rel)))
+    redundancy = np.zeros(len(rel), dtype=np.float32)
+    while left:
+        best = max(left, key=lambda i: lam * rel[i] - (1 - lam) * redundancy[i])
+        order.append(best)
+        left.remove(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+    return order
+
+
+# ----------------------------
+# Merging / dedup / budget
+# ----------------------------
+
+def _text_key(text: str) -> str:
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+def join_overlapping(a: str, b: str) -> str:
+    """a + b without the longest suffix of `a` that `b` starts with (the splitter's chunk overlap)."""
+    for n in range(min(len(a), len(b), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if a.endswith(b[:n]):
+            return a + b[n:]
+    return a + "\n" + b
+
+
+def _line_key(line: str) -> str:
+    return " ".join(line.lower().split())
+
+
+def _drop_seen_lines(text: str, seen: set) -> str:
+    kept = []
+    for line in text.split("\n"):
+        key = _line_key(line)
+        if len(key) >= MIN_DEDUP_LINE_CHARS:
+            if key in seen:
+                continue
+            seen.add(key)
+        kept.append(line)
+    return "\n".join(kept).strip()
+
+
+def cut_to_tokens(text: str, max_tokens: int, count) -> str:
+    """Longest prefix of `text` ending at a sentence / line end that fits in max_tokens (with the " …")."""
+    ends = [m.start() for m in _SENTENCE_END_RE.finditer(text)] + [len(text)]
+    lo, hi, best = 0, len(ends) - 1, ""
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        candidate = text[:ends[mid]].rstrip() + " …"
+        if count(candidate) <= max_tokens:
+            best, lo = candidate, mid + 1
+        else:
+            hi = mid - 1
+    return best
+
+
+class _Passage:
+    """Consecutive chunks of one file, kept in chunk_index order."""
+
+    def __init__(self, doc, show_pack: bool = False):
+        self.docs = [doc]
+        self.text = doc.page_content.strip()
+        self.show_pack = show_pack
+
+    @property
+    def file_id(self):
+        return self.docs[0].metadata.get("file_id")
+
+    def _indexes(self) -> List[int]:
+        return [d.metadata.get("chunk_index", -10) for d in self.docs]
+
+    def adjacent(self, doc) -> bool:
+        idx = doc.metadata.get("chunk_index")
+        if idx is None or doc.metadata.get("file_id") != self.file_id:
+            return False
+        if doc.metadata.get("pack_name") != self.docs[0].metadata.get("pack_name"):
+            return False
+        indexes = self._indexes()
+        return min(indexes) - 1 <= idx <= max(indexes) + 1
+
+    def merged_text(self, doc) -> str:
+        docs = sorted(self.docs + [doc], key=lambda d: d.metadata.get("chunk_index", 0))
+        text = docs[0].page_content.strip()
+        for d in docs[1:]:
+            text = join_overlapping(text, d.page_content.strip())
+        return text
+
+    def add(self, doc, text: str) -> None:
+        self.docs = sorted(self.docs + [doc], key=lambda d: d.metadata.get("chunk_index", 0))
+        self.text = text
+
+    def as_chunk(self, text: Optional[str] = None) -> Dict[str, Any]:
+        c = format_chunk(self.docs[0])
+        c["text"] = self.text if text is None else text
+        if len(self.docs) > 1:
+            c["chunk_ids"] = [d.metadata.get("chunk_id") for d in self.docs]
+        if self.show_pack:
+            c["pack"] = self.docs[0].metadata.get("pack_name")
+        return c
+
+
+def pack_passages(
+    docs: Sequence[Any],
+    k: int,
+    budget_tokens: int,
+    counter: TokenCounter,
+    show_pack: bool = False,
+) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    Steps 4-6 over `docs` in MMR order -> (chunks for format_context_block, counters).
+    `show_pack` labels each passage with its pack (multi-pack answers).
+    """
+    count = counter.count
+    passages: List[_Passage] = []
+    costs: List[int] = []           # each passage's tokens as rendered in the block
+    seen_lines: set = set()
+    used = count(CONTEXT_HEADER)
+    stats = {"merged": 0, "skipped": 0, "cut": 0}
+
+    for doc in docs:
+        if budget_tokens - used < MIN_PASSAGE_TOKENS:
+            break
+        home = next((i for i, p in enumerate(passages) if p.adjacent(doc)), None)
+        if home is not None:
+            # continuation of a chosen chunk: worth it only if it fits whole
+            text = passages[home].merged_text(doc)
+            chunk = passages[home].as_chunk(text)
+            block = format_passage(home + 1, chunk)
+            cost = count(block) - costs[home]
+            if used + cost > budget_tokens:
+                stats["skipped"] += 1
+                continue
+            passages[home].add(doc, text)
+            costs[home] += cost
+            used += cost
+            stats["merged"] += 1
+            continue
+
+        if len(passages) >= k:
+            continue
+        passage = _Passage(doc, show_pack)
+        trial_seen = set(seen_lines)
+        passage.text = _drop_seen_lines(passage.text, trial_seen)
+        if not passage.text:
+            stats["skipped"] += 1
+            continue
+        i = len(passages) + 1
+        block = format_passage(i, passage.as_chunk())
+        cost = count(block)
+        if used + cost > budget_tokens:
+            # cut the crossing passage at a sentence end to use the rest of the budget
+            frame = count(format_passage(i, passage.as_chunk(""))) + 1
+            text = cut_to_tokens(passage.text, budget_tokens - used - frame, count)
+            if count(text) < MIN_PASSAGE_TOKENS // 2:
+                stats["skipped"] += 1
+                continue
+            passage.text = text
+            block = format_passage(i, passage.as_chunk())
+            cost = count(block)
+            stats["cut"] += 1
+        seen_lines = trial_seen
+        passages.append(passage)
+        costs.append(cost)
+        used += cost
+
+    return [p.as_chunk() for p in passages], stats
+
+
+def assemble_context(
+    vs,
+    lexical,
+    query: str,
+    *,
+    k: int = 4,
+    budget_tokens: int = DEFAULT_BUDGET_TOKENS,
+    fetch_k: int = DEFAULT_FETCH_K,
+    mmr_lambda: float = DEFAULT_MMR_LAMBDA,
+    counter: Optional[TokenCounter] = None,
+    vector: Optional[Sequence[float]] = None,
+    allowed: Optional[np.ndarray] = None,
+) -> Dict[str, Any]:
+    """
+    {"context_block", "chunks", "tokens", "stats"} for `query` (steps 1-6 above).
+    `tokens` is the finished block counted with `counter`.
+    """
+    return assemble_across([{"vs": vs, "lexical": lexical, "vector": vector, "allowed": allowed}], query, k=k,
+                           budget_tokens=budget_tokens, fetch_k=fetch_k, mmr_lambda=mmr_lambda, counter=counter)
+
+
+def assemble_across(
+    sources: Sequence[Dict[str, Any]],
+    query: str,
+    *,
+    k: int = 4,
+    budget_tokens: int = DEFAULT_BUDGET_TOKENS,
+    fetch_k: int = DEFAULT_FETCH_K,
+    mmr_lambda: float = DEFAULT_MMR_LAMBDA,
+    counter: Optional[TokenCounter] = None,
+) -> Dict[str, Any]:
+    """
+    assemble_context over several stores (one per pack, registry.py fan-out):
+    sources are {"vs", "lexical", "vector"?, "allowed"?, "pack"?}. Each store's
+    fused scores are scaled to its own best hit before they compete, and
+    redundancy is token overlap, since packs may embed with different models.
+    Chunks carry "pack" when there is more than one source.
+    """
+    counter = counter or token_counter()
+    multi = len(sources) > 1
+    rows, scores, docs, seen, n_fused = [], [], [], set(), 0
+    for src in sources:
+        vs = src["vs"]
+        vector = src.get("vector")
+        if vector is None:
+            with span("text.embed"):
+                vector = vs.embedding_function.embed_query(query)
+        fused = candidate_rows(vs, src.get("lexical"), query, fetch_k=max(k, fetch_k), vector=vector,
+                               allowed=src.get("allowed"))
+        n_fused += len(fused)
+        top = fused[0][1] if fused else 1.0
+        # 2) exact duplicates (same text under another topic / file id / pack): keep the best ranked
+        for row, score in fused:
+            found = row_documents(vs, [row])
+            if not found:
+                continue
+            key = _text_key(found[0].page_content)
+            if key in seen:
+                continue
+            seen.add(key)
+            if src.get("pack"):
+                found[0].metadata.setdefault("pack_name", src["pack"])
+            rows.append(row)
+            scores.append(score / top if multi else score)
+            docs.append(found[0])
+
+    with span("text.assemble", candidates=n_fused) as attrs:
+        # 3) MMR
+        vecs = _row_vectors(sources[0]["vs"], rows) if rows and not multi else None
+        similarity = vecs @ vecs.T if vecs is not None else _token_overlap([d.page_content for d in docs])
+        order = mmr_order(scores, similarity, mmr_lambda)
+
+        chunks, stats = pack_passages([docs[i] for i in order], k, budget_tokens, counter, show_pack=multi)
+        block = format_context_block(chunks)
+        stats.update(candidates=n_fused, duplicates=n_fused - len(docs))
+        attrs["tokens"] = tokens = counter.count(block)
+    return {"context_block": block, "chunks": chunks, "tokens": tokens, "stats": stats}
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Sequence, Tuple, Union
+
+from langchain_core.documents import Document
+from langchain_community.docstore.base import Docstore
+
+# docstore.sqlite layout:
+#   docs(row, doc_id, text, metadata, citation_ids) — row == FAISS id == vectors.npy row
+#   citations(id, data)                              — each manifest citation stored once
+# Chunk metadata keeps only citation ids; full citation objects are attached
+# when a row is materialized, so tools still see metadata["citations"] as dicts.
+
+
+def write_docstore(
+    path: Path,
+    ids: Sequence[str],
+    texts: Sequence[str],
+    metadatas: Sequence[Dict[str, Any]],
+) -> None:
+    """(Re)write a docstore.sqlite for FAISS rows 0..n-1."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    if tmp.exists():
+        tmp.unlink()
+
+    conn = sqlite3.connect(str(tmp))
+    conn.executescript(
+        """
+        CREATE TABLE docs (
+            row          INTEGER PRIMARY KEY,
+            doc_id       TEXT NOT NULL UNIQUE,
+            text         TEXT NOT NULL,
+            metadata     TEXT NOT NULL,
+            citation_ids TEXT NOT NULL
+        );
+        CREATE TABLE citations (
+            id   TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+        """
+    )
+    citations: Dict[str, Dict[str, Any]] = {}
+    rows = []
+    for i, (doc_id, text, md) in enumerate(zip(ids, texts, metadatas)):
+        md = dict(md)
+        c_ids: List[str] = []
+        for c in md.pop("citations", None) or []:
+            cid = c.get("id") or c.get("title") or json.dumps(c, sort_keys=True)
+            citations.setdefault(cid, c)
+            c_ids.append(cid)
+        rows.append((i, doc_id, text, json.dumps(md, ensure_ascii=False), json.dumps(c_ids, ensure_ascii=False)))
+    conn.executemany("INSERT INTO docs VALUES (?, ?, ?, ?, ?)", rows)
+    conn.executemany(
+        "INSERT INTO citations VALUES (?, ?)",
+        [(cid, json.dumps(c, ensure_ascii=False)) for cid, c in citations.items()],
+    )
+    conn.commit()
+    conn.close()
+    tmp.replace(path)  # atomic swap, a running agent never sees a half-written file
+
+
+class SqliteDocstore(Docstore):
+    """
+    Read-only LangChain docstore over docstore.sqlite.
+
+    Nothing but the (small) citation table is loaded up front; `search(doc_id)`
+    materializes a single Document, so a FAISS query only ever builds its top-k hits.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._citations = {
+            cid: json.loads(data) for cid, data in self._conn.execute("SELECT id, data FROM citations")
+        }
+
+    def _to_document(self, row: Tuple[str, str, str, str]) -> Document:
+        doc_id, text, md_json, c_ids_json = row
+        md = json.loads(md_json)
+        md["citations"] = [self._citations[c] for c in json.loads(c_ids_json) if c in self._citations]
+        return Document(id=doc_id, page_content=text, metadata=md)
+
+    def search(self, search: str) -> Union[str, Document]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT doc_id, text, metadata, citation_ids FROM docs WHERE doc_id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return self._to_document(row)
+
+    def get_row(self, row: int) -> Document:
+        """Document for FAISS id `row`."""
+        with self._lock:
+            r = self._conn.execute(
+                "SELECT doc_id, text, metadata, citation_ids FROM docs WHERE row = ?", (int(row),)
+            ).fetchone()
+        if r is None:
+            raise KeyError(row)
+        return self._to_document(r)
+
+    def metadata_column(self, key: str) -> List[Any]:
+        """metadata[key] for every row in FAISS order, read with SQLite's JSON functions (no Documents built)."""
+        with self._lock:
+            return [
+                v for (v,) in self._conn.execute(
+                    "SELECT json_extract(metadata, ?) FROM docs ORDER BY row", (f"$.{key}",)
+                )
+            ]
+
+    def index_to_docstore_id(self) -> Dict[int, str]:
+        """FAISS id -> doc id mapping that LangChain's FAISS wrapper expects."""
+        with self._lock:
+            return {row: doc_id for row, doc_id in self._conn.execute("SELECT row, doc_id FROM docs")}
+
+    def __iter__(self) -> Iterator[Document]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT doc_id, text, metadata, citation_ids FROM docs ORDER BY row"
+            ).fetchall()
+        for r in rows:
+            yield self._to_document(r)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def convert_pickle_docstore(pkl_path: Path, sqlite_path: Path) -> int:
+    """
+    One-off migration of a LangChain index.pkl (docstore, index_to_docstore_id) that
+    YOU built into docstore.sqlite. Only run this on trusted files: it unpickles.
+    """
+    import pickle
+
+    with open(pkl_path, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    ids = [index_to_docstore_id[i] for i in range(len(index_to_docstore_id))]
+    docs = [docstore.search(i) for i in ids]
+    write_docstore(sqlite_path, ids, [d.page_content for d in docs], [d.metadata for d in docs])
+    return len(ids)
@@ -0,0 +1,348 @@
+from __future__ import annotations
+
+import hashlib
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+# Defaults for build-time embedding. Ollama serves a batch per request much faster
+# than one request per chunk; a couple of requests in flight keeps it busy without
+# starving the machine (OLLAMA_NUM_PARALLEL caps what the server really runs).
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_MAX_CONCURRENCY = 2
+
+
+def embed_texts(
+    texts: Sequence[str],
+    model: str,
+    *,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    host: Optional[str] = None,
+    backend: Optional["EmbeddingBackend"] = None,
+    on_batch: Optional[Callable[[List[int], List[List[float]]], None]] = None,
+    log: Optional[Callable[[str], None]] = print,
+) -> Tuple[List[List[float]], Dict[str, Any]]:
+    """
+    Embed `texts` with `backend` (default: OllamaBackend(model), i.e. Ollama's
+    /api/embed) in batches of `batch_size`, with at most `max_concurrency`
+    batches in flight.
+
+    `on_batch(indices, vectors)` is called (from the calling thread) as each batch
+    finishes, e.g. to checkpoint vectors to a build cache.
+
+    Returns (vectors aligned with `texts`, stats) where stats includes chunks/sec.
+    """
+    vectors: List[Optional[List[float]]] = [None] * len(texts)
+    batches = [list(range(i, min(i + batch_size, len(texts)))) for i in range(0, len(texts), batch_size)]
+
+    if backend is None:
+        backend = OllamaBackend(model, host=host, batch_size=batch_size)
+
+    def _run(idx: List[int]) -> List[List[float]]:
+        return [list(v) for v in backend.embed_documents([texts[i] for i in idx])]
+
+    t0 = time.perf_counter()
+    done = 0
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+        futures = {pool.submit(_run, idx): idx for idx in batches}
+        for fut in as_completed(futures):
+            idx = futures[fut]
+            vecs = fut.result()
+            for i, v in zip(idx, vecs):
+                vectors[i] = v
+            if on_batch is not None:
+                on_batch(idx, vecs)
+            done += len(idx)
+            if log:
+                log(f"  embedded {done}/{len(texts)}")
+
+    seconds = time.perf_counter() - t0
+    stats = {
+        "chunks": len(texts),
+        "batches": len(batches),
+        "batch_size": batch_size,
+        "max_concurrency": max_concurrency,
+        "seconds": round(seconds, 2),
+        "chunks_per_sec": round(len(texts) / seconds, 1) if seconds > 0 and texts else 0.0,
+    }
+    return vectors, stats  # type: ignore[return-value]
+
+
+# ----------------------------
+# Matryoshka truncation
+# ----------------------------
+# nomic-embed-text v1.5 is trained so that a prefix of the (layer-normed) embedding
+# is itself a good embedding. Packs store vectors at the manifest's declared dim;
+# queries must go through the exact same transform.
+
+def matryoshka_truncate(vectors: Any, dim: Optional[int]) -> Any:
+    """
+    Layer-norm, keep the first `dim` components, L2-normalize (row-wise).
+    Vectors already at (or below) `dim` are returned unchanged.
+    """
+    import numpy as np
+
+    mat = np.asarray(vectors, dtype=np.float32)
+    if not dim or mat.shape[-1] <= int(dim):
+        return mat
+    mat = mat - mat.mean(axis=-1, keepdims=True)  # layer norm; its scale is undone by the L2 step
+    mat = mat[..., : int(dim)]
+    norms = np.linalg.norm(mat, axis=-1, keepdims=True)
+    return mat / np.where(norms == 0, 1.0, norms)
+
+
+class TruncatedEmbeddings(Embeddings):
+    """Embeddings wrapper applying matryoshka_truncate to every vector (pass-through when dim is None)."""
+
+    def __init__(self, base: Embeddings, dim: Optional[int]):
+        self.base = base
+        self.dim = int(dim) if dim else None
+
+    def embed_query(self, text: str) -> List[float]:
+        return matryoshka_truncate(self.base.embed_query(text), self.dim).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return matryoshka_truncate(self.base.embed_documents(texts), self.dim).tolist()
+
+
+# ----------------------------
+# Embedding backends
+# ----------------------------
+# Every embedding (build time and per query) goes through one of these. They all
+# return L2-normalized vectors at the model's native dim, like Ollama's /api/embed;
+# Matryoshka truncation to the manifest dim is applied on top (TruncatedEmbeddings).
+#   ollama  — HTTP to the Ollama server (shares it with the chat model)
+#   onnx    — in-process onnxruntime on CPU from a local model.onnx + tokenizer.json
+#   hashing — deterministic stand-in for benchmarks / CI (not a real model)
+
+BACKENDS = ("ollama", "onnx", "hashing")
+DEFAULT_ONNX_MAX_LENGTH = 2048  # tokens per text, as Ollama's context for nomic-embed-text
+
+
+class EmbeddingBackend(Embeddings):
+    """Batched LangChain Embeddings with a name, a model id and a thread setting."""
+
+    name = "base"
+    normalize = True  # vectors come back L2-normalized
+
+    def __init__(self, model: str, *, batch_size: int = DEFAULT_BATCH_SIZE, num_threads: Optional[int] = None):
+        self.model = model
+        self.batch_size = max(1, int(batch_size))
+        self.num_threads = int(num_threads) if num_threads else None
+        self.dim: Optional[int] = None  # native output dim; known once loaded or after the first call
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    @property
+    def cache_key(self) -> str:
+        """Namespace for build / query caches, so vectors from different backends are never mixed."""
+        return self.model if self.name == "ollama" else f"{self.name}:{self.model}"
+
+    def describe(self) -> Dict[str, Any]:
+        return {"backend": self.name, "model": self.model, "dim": self.dim,
+                "batch_size": self.batch_size, "num_threads": self.num_threads}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        out: List[List[float]] = []
+        for i in range(0, len(texts), self.batch_size):
+            out.extend(self._embed_batch(list(texts[i:i + self.batch_size])))
+        if out and self.dim is None:
+            self.dim = len(out[0])
+        return out
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class OllamaBackend(EmbeddingBackend):
+    """
+    Ollama's /api/embed, one request per batch. `num_threads` is passed as the
+    num_thread option; `keep_alive` (e.g. -1, "30m") with every request, so the
+    model stays loaded as residency.py decides (None: Ollama's default, 5 minutes).
+    """
+
+    name = "ollama"
+
+    def __init__(self, model: str, *, host: Optional[str] = None, batch_size: int = DEFAULT_BATCH_SIZE,
+                 num_threads: Optional[int] = None, keep_alive: Optional[Any] = None):
+        super().__init__(model, batch_size=batch_size, num_threads=num_threads)
+        from ollama import Client
+
+        self.client = Client(host=host) if host else Client()
+        self.options = {"num_thread": self.num_threads} if self.num_threads else None
+        self.keep_alive = keep_alive
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        resp = self.client.embed(model=self.model, input=texts, options=self.options, keep_alive=self.keep_alive)
+        return [list(v) for v in resp["embeddings"]]
+
+
+class OnnxBackend(EmbeddingBackend):
+    """
+    In-process CPU embeddings from an exported model directory holding
+    model.onnx (or onnx/model.onnx) and tokenizer.json, e.g. the files of
+    nomic-ai/nomic-embed-text-v1.5. `model` names what the file is (it is
+    checked against the manifest); token states are mean-pooled and normalized.
+
+    No prefixes by default, matching how Ollama embeds the shipped packs; keep
+    `query_prefix` / `document_prefix` the same between build and query time.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model: str, model_dir: Path, *, batch_size: int = DEFAULT_BATCH_SIZE,
+                 num_threads: Optional[int] = None, max_length: int = DEFAULT_ONNX_MAX_LENGTH,
+                 query_prefix: str = "", document_prefix: str = ""):
+        super().__init__(model, batch_size=batch_size, num_threads=num_threads)
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("the onnx embedding backend needs `pip install onnxruntime tokenizers`") from e
+
+        model_dir = Path(model_dir)
+        onnx_path = next((p for p in (model_dir / "model.onnx", model_dir / "onnx" / "model.onnx") if p.exists()), None)
+        tokenizer_path = model_dir / "tokenizer.json"
+        if onnx_path is None or not tokenizer_path.exists():
+            raise FileNotFoundError(
+                f"{model_dir} needs model.onnx (or onnx/model.onnx) and tokenizer.json; see README "
+                "'In-process embeddings' for the download"
+            )
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.num_threads:
+            opts.intra_op_num_threads = self.num_threads
+            opts.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(str(onnx_path), sess_options=opts, providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self.session.get_inputs()}
+        out_dim = self.session.get_outputs()[0].shape[-1]
+        self.dim = out_dim if isinstance(out_dim, int) else None
+
+        self.tokenizer = Tokenizer.from_file(str(tokenizer_path))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        if self.tokenizer.padding is None:
+            pad_id = self.tokenizer.token_to_id("[PAD]") or 0
+            self.tokenizer.enable_padding(pad_id=pad_id, pad_token="[PAD]")
+        self.query_prefix = query_prefix
+        self.document_prefix = document_prefix
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        import numpy as np
+
+        encs = self.tokenizer.encode_batch(texts)
+        ids = np.asarray([e.ids for e in encs], dtype=np.int64)
+        mask = np.asarray([e.attention_mask for e in encs], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self._inputs:
+            feeds["token_type_ids"] = np.asarray([e.type_ids for e in encs], dtype=np.int64)
+        out = self.session.run(None, {k: v for k, v in feeds.items() if k in self._inputs})[0]
+        if out.ndim == 3:  # token states -> mean over real (unpadded) tokens
+            m = mask[..., None].astype(np.float32)
+            out = (out * m).sum(axis=1) / np.clip(m.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(out, axis=-1, keepdims=True)
+        return (out / np.where(norms == 0, 1.0, norms)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # batch texts of similar length together so little time is spent on padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vecs = super().embed_documents([self.document_prefix + texts[i] for i in order])
+        out: List[List[float]] = [[] for _ in texts]
+        for pos, i in enumerate(order):
+            out[i] = vecs[pos]
+        return out
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_batch([self.query_prefix + text])[0]
+
+
+class HashingEmbeddings(EmbeddingBackend):
+    """
+    Deterministic stand-in: feature-hashed bag of words + character trigrams.
+    No model, no server, same vector on every machine — for benchmarks and CI
+    (see bench.py), never for kiosks.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 512, *, batch_size: int = DEFAULT_BATCH_SIZE):
+        super().__init__(f"hashing-{int(dim)}", batch_size=batch_size)
+        self.dim = int(dim)
+
+    def _bucket(self, feature: str) -> Tuple[int, float]:
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+        return h % self.dim, (1.0 if (h >> 63) else -1.0)
+
+    def _embed(self, text: str) -> List[float]:
+        from .lexical import tokenize
+
+        counts: Dict[str, int] = {}
+        for tok in tokenize(text):
+            counts[tok] = counts.get(tok, 0) + 1
+            padded = f"#{tok}#"
+            for i in range(len(padded) - 2):  # trigrams catch inflections the stemmer misses
+                tri = "3:" + padded[i:i + 3]
+                counts[tri] = counts.get(tri, 0) + 1
+        vec = [0.0] * self.dim
+        for feature, tf in counts.items():
+            i, sign = self._bucket(feature)
+            weight = 0.25 if feature.startswith("3:") else 1.0
+            vec[i] += sign * weight * (1.0 + math.log(tf))
+        norm = math.sqrt(sum(v * v for v in vec))
+        return [v / norm for v in vec] if norm else vec
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+
+def make_backend(
+    kind: str,
+    model: str,
+    *,
+    model_dir: Optional[Path] = None,
+    host: Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    num_threads: Optional[int] = None,
+    keep_alive: Optional[Any] = None,
+) -> EmbeddingBackend:
+    """
+    Backend by name ("ollama", "onnx", "hashing"); `model` is the manifest's
+    embedding model. `keep_alive` only applies to Ollama.
+    """
+    if kind == "ollama":
+        return OllamaBackend(model, host=host, batch_size=batch_size, num_threads=num_threads, keep_alive=keep_alive)
+    if kind == "onnx":
+        if model_dir is None:
+            raise ValueError("the onnx backend needs model_dir (a folder with model.onnx + tokenizer.json)")
+        return OnnxBackend(model, model_dir, batch_size=batch_size, num_threads=num_threads)
+    if kind == "hashing":
+        return HashingEmbeddings(batch_size=batch_size)
+    raise ValueError(f"unknown embedding backend {kind!r}; expected one of {', '.join(BACKENDS)}")
+
+
+def check_backend(backend: EmbeddingBackend, embedding_cfg: Dict[str, Any], what: str = "text",
+                  probe: bool = False) -> None:
+    """
+    Raise ValueError unless `backend` can serve a pack built for
+    manifest embedding_config.<what>: same model, same normalization and at least
+    the declared dim. `probe=True` embeds one string to learn the dim when the
+    backend does not know it yet (Ollama).
+    """
+    if probe and backend.dim is None:
+        backend.embed_query("dimension probe")
+    problems = []
+    if backend.model != embedding_cfg.get("model"):
+        problems.append(f"model {backend.model!r} != {embedding_cfg.get('model')!r}")
+    if backend.normalize != bool(embedding_cfg.get("normalize", True)):
+        problems.append(f"normalize {backend.normalize} != {embedding_cfg.get('normalize')}")
+    dim = embedding_cfg.get("dim")
+    if dim and backend.dim is not None and backend.dim < int(dim):
+        problems.append(f"backend dim {backend.dim} < declared dim {dim}")
+    if problems:
+        raise ValueError(f"{backend.name} embedding backend does not match embedding_config.{what}: " + "; ".join(problems))
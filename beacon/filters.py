@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# topic_id / locale pre-filtering. Row masks are built once from chunk metadata
+# when a pack loads; a filtered query hands the mask to FAISS as an
+# IDSelectorBitmap (and to BM25 as `allowed`), so only matching vectors are
+# scored and a full k still comes back whenever k rows match, whatever the
+# pack's faiss.type (filtered_search). A chunk shared by several topics
+# (ingest.merge_duplicate_chunks) is in the mask of each of them.
+
+
+def _locale_parts(locale: Optional[str]) -> frozenset:
+    # "hi_en" / "hi-en" -> {"hi", "en"}
+    return frozenset(p for p in re.split(r"[_\-]", (locale or "").lower()) if p)
+
+
+class RowFilter:
+    """Boolean row masks per topic_id and per locale for one FAISS store."""
+
+    def __init__(self, topic_ids: Sequence[Any], locales: Sequence[Optional[str]]):
+        self.n = len(topic_ids)
+        self.topics: Dict[str, np.ndarray] = self._group(topic_ids)
+        self.locales: Dict[str, np.ndarray] = self._group(locales)
+        self._masks: Dict[Tuple[Optional[str], Optional[str]], np.ndarray] = {}
+
+    def _group(self, values: Sequence[Any]) -> Dict[str, np.ndarray]:
+        """value -> rows having it; a row's value may be a list (every topic a shared chunk belongs to)."""
+        groups: Dict[str, np.ndarray] = {}
+        for row, value in enumerate(values):
+            for v in (value if isinstance(value, list) else [value]):
+                if v:
+                    groups.setdefault(v, np.zeros(len(values), dtype=bool))[row] = True
+        return groups
+
+    @classmethod
+    def from_store(cls, vs) -> "RowFilter":
+        """Build from a loaded FAISS store (SqliteDocstore columns, or Documents for a legacy docstore)."""
+        ds = vs.docstore
+        if hasattr(ds, "metadata_column"):
+            shared = [json.loads(v) if v else None for v in ds.metadata_column("topic_ids")]
+            topics = [s or t for s, t in zip(shared, ds.metadata_column("topic_id"))]
+            return cls(topics, ds.metadata_column("locale"))
+        docs = [ds.search(vs.index_to_docstore_id[i]) for i in range(vs.index.ntotal)]
+        return cls([d.metadata.get("topic_ids") or d.metadata.get("topic_id") for d in docs],
+                   [d.metadata.get("locale") for d in docs])
+
+    def _locale_mask(self, locale: str) -> Optional[np.ndarray]:
+        # "en" matches en and hi_en chunks; "hi_en" matches hi, en and hi_en chunks
+        want = _locale_parts(locale)
+        matches = [m for loc, m in self.locales.items() if want & _locale_parts(loc)]
+        return np.logical_or.reduce(matches) if matches else None
+
+    def mask(
+        self, topic_id: Optional[str] = None, locale: Optional[str] = None
+    ) -> Tuple[Optional[np.ndarray], Dict[str, Any]]:
+        """
+        Row mask for the requested filters, plus a dict of what was applied.
+
+        A topic_id or locale that does not exist in the pack is ignored (and
+        reported under "ignored") instead of returning nothing. Returns
+        (None, ...) when no filter applies, i.e. search everything.
+        """
+        applied: Dict[str, Any] = {}
+        ignored: Dict[str, Any] = {}
+        topic_mask = loc_mask = None
+        if topic_id:
+            topic_mask = self.topics.get(topic_id)
+            (applied if topic_mask is not None else ignored)["topic_id"] = topic_id
+        if locale:
+            loc_mask = self._locale_mask(locale)
+            (applied if loc_mask is not None else ignored)["locale"] = locale
+        if ignored:
+            applied["ignored"] = ignored
+
+        key = (applied.get("topic_id"), applied.get("locale"))
+        if key == (None, None):
+            return None, applied
+        if key not in self._masks:
+            parts = [m for m in (topic_mask, loc_mask) if m is not None]
+            self._masks[key] = np.logical_and.reduce(parts)
+        return self._masks[key], applied
+
+    def topic_ids(self) -> List[str]:
+        return sorted(self.topics)
+
+
+def faiss_search_params(mask: np.ndarray, index=None, nprobe: Optional[int] = None):
+    """
+    SearchParameters restricting a FAISS search to the rows set in `mask`
+    (SearchParametersIVF, with `nprobe` or the index's own, when `index` is an IVF index).
+    """
+    import faiss
+
+    bitmap = np.packbits(mask.astype(bool), bitorder="little")
+    sel = faiss.IDSelectorBitmap(mask.shape[0], faiss.swig_ptr(bitmap))
+    ivf = faiss.try_extract_index_ivf(index) if index is not None else None
+    if ivf is not None:
+        params = faiss.SearchParametersIVF(sel=sel, nprobe=int(nprobe or ivf.nprobe))
+    else:
+        params = faiss.SearchParameters(sel=sel)
+    params._bitmap = bitmap  # the selector only holds a pointer; keep the bytes alive
+    return params
+
+
+def filtered_search(index, vec: np.ndarray, k: int, mask: np.ndarray) -> List[int]:
+    """
+    Rows set in `mask` nearest to `vec` (a (1, dim) float32 array), best first:
+    k of them, or every matching row when fewer match.
+
+    flat / sq8 take the mask as a selector. IVF indexes do too, but only scan
+    nprobe lists, which may hold fewer than k matching rows; nprobe is raised
+    until they do (or every list is scanned). IndexPQ accepts no selector, so it
+    is searched over-fetched and rows outside the mask are dropped afterwards.
+    """
+    import faiss
+
+    from .vector_store import index_kind
+
+    k = min(k, int(mask.sum()))
+    if k <= 0:
+        return []
+    if index_kind(index) == "pq":
+        fetch = min(index.ntotal, 2 * k * index.ntotal // int(mask.sum()))
+        while True:
+            _, idx = index.search(vec, fetch)
+            rows = [int(i) for i in idx[0] if i >= 0 and mask[i]]
+            if len(rows) >= k or fetch >= index.ntotal:
+                return rows[:k]
+            fetch = min(index.ntotal, fetch * 4)
+
+    ivf = faiss.try_extract_index_ivf(index)
+    nprobe = int(ivf.nprobe) if ivf is not None else None
+    while True:
+        _, idx = index.search(vec, k, params=faiss_search_params(mask, index, nprobe))
+        rows = [int(i) for i in idx[0] if i >= 0]
+        if ivf is None or len(rows) >= k or nprobe >= ivf.nlist:
+            return rows
+        nprobe = min(int(ivf.nlist), nprobe * 4)
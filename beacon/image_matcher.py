@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import re
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .vector_store import check_declared_dim, load_vectors, pack_paths
+
+# Image packs are tiny (tens of captions), so getImage skips FAISS: every caption
+# vector sits in one L2-normalized float32 matrix and a query is scored against
+# all of them with a single mat-vec (exact cosine, higher = better).
+#
+# The acceptance threshold is per pack, calibrated on labelled queries and kept
+# in the manifest as precomputed_indices.images.match_threshold. A pack that has
+# not been calibrated yet (`match_threshold: null`) gets DEFAULT_MATCH_THRESHOLD,
+# a conservative cut-off: the router prefetches getImage for any "show" / "map" /
+# "wound" question and the UI shows the picture unasked, so missing an image is
+# better than showing a wrong one.
+DEFAULT_MATCH_THRESHOLD = 0.6
+CALIBRATION_MARGIN = 0.02
+
+
+@dataclass
+class ImageMatch:
+    doc: Any          # langchain Document (caption text + asset metadata)
+    score: float      # cosine similarity in [-1, 1]
+    ms: float         # scoring time, excluding the query embedding
+
+
+def _normalize(mat: np.ndarray) -> np.ndarray:
+    mat = np.asarray(mat, dtype=np.float32)
+    norms = np.linalg.norm(mat, axis=-1, keepdims=True)
+    return mat / np.where(norms == 0, 1.0, norms)
+
+
+class ImageMatcher:
+    """Exact cosine matcher over every caption in an image pack."""
+
+    def __init__(self, vectors: np.ndarray, docs: Sequence[Any], embeddings=None,
+                 threshold: Optional[float] = None):
+        if vectors.shape[0] != len(docs):
+            raise ValueError(f"{vectors.shape[0]} caption vectors for {len(docs)} documents")
+        self.matrix = np.ascontiguousarray(_normalize(vectors))
+        self.docs = list(docs)
+        self.embeddings = embeddings
+        self.calibrated = threshold is not None
+        self.threshold = float(threshold) if threshold is not None else DEFAULT_MATCH_THRESHOLD
+
+    @classmethod
+    def from_pack(cls, root: Path, idx_cfg: Dict[str, Any], embeddings=None,
+                  threshold: Optional[float] = None, dim: Optional[int] = None) -> "ImageMatcher":
+        """
+        Load vectors.npy + docstore.sqlite; threshold defaults to the manifest's
+        match_threshold (null: DEFAULT_MATCH_THRESHOLD, `calibrated` False). With
+        `dim` (manifest's declared dim) a mismatched pack is refused.
+        """
+        from .docstore import SqliteDocstore
+
+        paths = pack_paths(root, idx_cfg)
+        docstore = SqliteDocstore(paths["docstore"])
+        try:
+            docs = list(docstore)  # a few dozen captions: materialize once, keep in memory
+        finally:
+            docstore.close()
+        if threshold is None:
+            threshold = idx_cfg.get("match_threshold")
+        vectors = load_vectors(paths["vectors"], mmap=False)
+        check_declared_dim(vectors, dim, str(paths["vectors"]))
+        return cls(vectors, docs, embeddings, threshold)
+
+    def scores(self, query_vector: Sequence[float]) -> np.ndarray:
+        q = _normalize(np.asarray(query_vector, dtype=np.float32))
+        if q.shape[-1] != self.matrix.shape[1]:
+            raise ValueError(f"query vector has dim {q.shape[-1]}, image pack has dim {self.matrix.shape[1]}")
+        return self.matrix @ q
+
+    def rank(self, query_vector: Sequence[float], k: int = 4) -> List[Tuple[Any, float]]:
+        """Top-k (doc, cosine) regardless of threshold — for inspection and calibration."""
+        s = self.scores(query_vector)
+        top = np.argsort(-s, kind="stable")[:k]
+        return [(self.docs[i], float(s[i])) for i in top]
+
+    def match_vector(self, query_vector: Sequence[float]) -> Optional[ImageMatch]:
+        """Best image if its cosine clears the pack threshold, else None."""
+        t0 = time.perf_counter()
+        s = self.scores(query_vector)
+        i = int(np.argmax(s))
+        ms = (time.perf_counter() - t0) * 1000
+        if float(s[i]) < self.threshold:
+            return None
+        return ImageMatch(self.docs[i], float(s[i]), ms)
+
+    def match(self, query: str) -> Optional[ImageMatch]:
+        """Embed `query` (through the shared query cache when there is one) and match it."""
+        if self.embeddings is None:
+            raise ValueError("ImageMatcher was built without embeddings; use match_vector()")
+        return self.match_vector(self.embeddings.embed_query(query))
+
+
+# ----------------------------
+# Calibration
+# ----------------------------
+
+def calibrate_threshold(
+    matcher: ImageMatcher,
+    positives: Sequence[Tuple[str, str]],
+    negatives: Sequence[str],
+    margin: float = CALIBRATION_MARGIN,
+) -> Dict[str, Any]:
+    """
+    Pick a threshold that never returns a wrong image on the labelled set.
+
+    positives: (query, asset id) pairs that should return that image.
+    negatives: queries that should return no image.
+    "Wrong" scores are the best score of every negative query and of every
+    positive whose top image is the wrong asset. The threshold is at least
+    `margin` above all of them; when right and wrong scores separate cleanly it
+    sits halfway between the two groups, leaving room on both sides.
+    """
+    if matcher.embeddings is None:
+        raise ValueError("calibration needs a matcher with embeddings")
+
+    wrong: List[float] = []
+    right: List[float] = []
+    for query, asset_id in positives:
+        doc, score = matcher.rank(matcher.embeddings.embed_query(query), k=1)[0]
+        (right if doc.metadata.get("id") == asset_id else wrong).append(score)
+    for query in negatives:
+        wrong.append(matcher.rank(matcher.embeddings.embed_query(query), k=1)[0][1])
+
+    if wrong:
+        threshold = max(wrong) + margin
+        if right and min(right) > threshold:
+            threshold = max(threshold, (max(wrong) + min(right)) / 2)
+        threshold = round(threshold, 3)
+    else:
+        threshold = round(min(right, default=DEFAULT_MATCH_THRESHOLD), 3)
+    recall = sum(s >= threshold for s in right) / len(positives) if positives else 0.0
+    return {
+        "threshold": threshold,
+        "recall": round(recall, 3),
+        "positives": len(positives),
+        "negatives": len(negatives),
+        "top1_correct": len(right),
+        "max_wrong_score": round(max(wrong), 3) if wrong else None,
+        "min_right_score": round(min(right), 3) if right else None,
+    }
+
+
+_THRESHOLD_RE = re.compile(r"^(\s*match_threshold:\s*)([-0-9.]+|null|~)(.*)$", re.MULTILINE)
+
+
+def write_manifest_threshold(root: Path, threshold: float) -> None:
+    """Set precomputed_indices.images.match_threshold in manifest.yaml, keeping comments and layout."""
+    path = Path(root) / "manifest.yaml"
+    text = path.read_text(encoding="utf-8")
+    if not _THRESHOLD_RE.search(text):
+        raise ValueError(f"{path} has no images match_threshold line to update")
+    path.write_text(_THRESHOLD_RE.sub(lambda m: f"{m.group(1)}{threshold}{m.group(3)}", text, count=1), encoding="utf-8")
@@ -0,0 +1,695 @@
+from __future__ import annotations
+
+import json
+import re
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import yaml
+
+from .build_cache import BuildCache, sha256_file, sha256_text
+from .chunking import DEFAULT_STRATEGY, STRATEGIES, Chunker, chunk_stats, make_chunker
+from .embedding import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_MAX_CONCURRENCY,
+    EmbeddingBackend,
+    OllamaBackend,
+    TruncatedEmbeddings,
+    embed_texts,
+    matryoshka_truncate,
+)
+from .lexical import LexicalIndex, lexical_path
+from .pdf_extract import DEFAULT_PAGES_PER_TASK, extract_pdfs, format_page_issues
+from .tokens import EMBED_TOKENIZER_ENV, TokenCounter, embedding_token_counter
+from .vector_store import build_index, index_report, index_spec, load_faiss_store, pack_paths, write_vector_pack
+
+# Bump when extraction/chunking code changes in a way that alters chunk text,
+# so cached chunks from an older build are not reused.
+CHUNKER_VERSION = 2
+
+SUPPORTED_MEDIA_TYPES = ["pdf", "md", "markdown"]
+
+
+# -------------------- 0) Manifest --------------------
+
+def load_manifest(root: Path) -> Dict[str, Any]:
+    with open(Path(root) / "manifest.yaml", "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+# -------------------- 1) Extraction helpers --------------------
+# PDFs are extracted page-by-page in a process pool (see pdf_extract.py);
+# Markdown is cheap and handled inline.
+
+FM_RE = re.compile(r"^\s*---\s*\n(.*?)\n---\s*\n?", re.DOTALL)
+
+
+def strip_markdown_syntax(md: str) -> str:
+    """Lightweight MD→text. Keeps content, removes common syntax; OK for embeddings."""
+    # remove code fences
+    md = re.sub(r"```.*?```", "", md, flags=re.DOTALL)
+    # remove inline code backticks
+    md = md.replace("`", "")
+    # images/links: keep label + URL text-ish
+    md = re.sub(r"!\[([^\]]*)\]\([^\)]*\)", r"\1", md)
+    md = re.sub(r"\[([^\]]+)\]\([^\)]*\)", r"\1", md)
+    # headings/bold/italics
+    md = re.sub(r"^\s{0,3}#{1,6}\s*", "", md, flags=re.MULTILINE)
+    md = re.sub(r"[*_]{1,3}([^*_]+)[*_]{1,3}", r"\1", md)
+    # blockquotes / lists / tables pipes
+    md = re.sub(r"^\s{0,3}>\s?", "", md, flags=re.MULTILINE)
+    md = re.sub(r"^\s*[-*+]\s+", "- ", md, flags=re.MULTILINE)  # list items / numbered steps stay items
+    md = md.replace("|", " ")
+    # collapse whitespace
+    md = re.sub(r"[ \t]+", " ", md)
+    md = re.sub(r"\n{3,}", "\n\n", md)
+    return md.strip()
+
+
+def extract_markdown_blocks(md_path: Path) -> Tuple[Optional[dict], str]:
+    """
+    Returns (front_matter_dict_or_none, plain_text_body).
+    Front matter (if present) is parsed as YAML and removed from body.
+    """
+    raw = md_path.read_text(encoding="utf-8", errors="ignore")
+    fm_match = FM_RE.match(raw)
+    front = None
+    if fm_match:
+        try:
+            front = yaml.safe_load(fm_match.group(1)) or {}
+        except Exception:
+            front = {"_parse_error": "front_matter"}
+        raw = raw[fm_match.end():]
+    text = strip_markdown_syntax(raw)
+    return front, text
+
+
+def infer_locale(path_str: str, default: str = "en") -> str:
+    return "hi_en" if "/hi_en/" in path_str else default
+
+
+# -------------------- 2) Chunker (token-counted, structure-aware; see chunking.py) --------------------
+
+def chunking_settings(manifest: Dict[str, Any], counter: Optional[TokenCounter] = None) -> Dict[str, Any]:
+    """Resolve the manifest's token-based chunking config (+ the tokenizer that counts it)."""
+    cfg = manifest["embedding_config"]["text"].get("chunking", {}) or {}
+    strategy = str(cfg.get("strategy", DEFAULT_STRATEGY))
+    if strategy not in STRATEGIES:
+        raise ValueError(f"unknown chunking strategy {strategy!r}; expected one of {', '.join(STRATEGIES)}")
+    return {
+        "strategy": strategy,
+        "max_tokens": int(cfg.get("max_tokens", 512)),
+        "overlap_tokens": int(cfg.get("overlap_tokens", 64)),
+        "tokenizer": counter.name if counter is not None and strategy != "chars" else None,
+    }
+
+
+# -------------------- 3) Per-file chunk records (PDF + MD aware) --------------------
+
+def iter_core_files(manifest: Dict[str, Any], root: Path):
+    """Yield (topic_id, file_meta, absolute_path, kind) for every embeddable core file."""
+    for topic in manifest.get("index_of_topics", []):
+        topic_id = topic["id"]
+        for fmeta in topic.get("core_files", []):
+            fpath = Path(root) / fmeta["path"]
+            media_type = (fmeta.get("media_type") or fpath.suffix.lstrip(".")).lower()
+            is_pdf = (media_type in {"pdf", "application/pdf"}) or (fpath.suffix.lower() == ".pdf")
+            is_md = (media_type in {"md", "markdown", "text/markdown"}) or (fpath.suffix.lower() in {".md", ".markdown"})
+            if not (is_pdf or is_md):
+                # not a core text doc type we embed here
+                continue
+            yield topic_id, fmeta, fpath, ("pdf" if is_pdf else "md")
+
+
+def chunk_core_file(
+    topic_id: str,
+    fmeta: Dict[str, Any],
+    fpath: Path,
+    kind: str,
+    chunker: Chunker,
+    pages: Optional[List[Tuple[int, str]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Chunk one core file into JSON-safe records {"text", "metadata"}.
+    PDFs take their already-extracted `pages` as (1-indexed page_number, text);
+    a chunk that runs over a page break has the page it starts on and page_end.
+    Pack-level fields (name/version/citations) are added later so a manifest edit
+    to those does not invalidate the cached chunks.
+    """
+    locale = infer_locale(fmeta["path"], fmeta.get("locale", "en"))
+    records: List[Dict[str, Any]] = []
+    file_chunk_counter = 0
+
+    if kind == "pdf":
+        for page_num, page_end, piece in chunker.pages(pages or []):
+            records.append({
+                "text": piece,
+                "metadata": {
+                    "topic_id": topic_id,
+                    "file_id": fmeta["id"],
+                    "path": str(fmeta["path"]),
+                    "media_type": "pdf",
+                    "locale": locale,
+                    "page": page_num,
+                    "page_end": page_end,
+                    "chunk_index": file_chunk_counter,
+                    "chunk_id": f"{fmeta['id']}::p{page_num}::chunk::{file_chunk_counter}",
+                    "doc_type": "pdf",
+                },
+            })
+            file_chunk_counter += 1
+    else:
+        front_matter, body_text = extract_markdown_blocks(fpath)
+        for piece in chunker(body_text):
+            records.append({
+                "text": piece,
+                "metadata": {
+                    "topic_id": topic_id,
+                    "file_id": fmeta["id"],
+                    "path": str(fmeta["path"]),
+                    "media_type": "md",
+                    "locale": locale,
+                    "page": None,  # no pages for MD
+                    "front_matter": front_matter or {},
+                    "chunk_index": file_chunk_counter,
+                    "chunk_id": f"{fmeta['id']}::md::chunk::{file_chunk_counter}",
+                    "doc_type": "markdown",
+                },
+            })
+            file_chunk_counter += 1
+
+    for r in records:
+        r["metadata"]["chunk_hash"] = sha256_text(r["text"])
+    return records
+
+
+_PACK_FIELDS = ("pack_name", "pack_version", "citations")  # added per build, never cached
+
+
+def retarget_chunks(records: List[Dict[str, Any]], topic_id: str, fmeta: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Chunk records of a file as records of an identical file listed under another topic / file id."""
+    locale = infer_locale(fmeta["path"], fmeta.get("locale", "en"))
+    out = []
+    for r in records:
+        md = {k: v for k, v in r["metadata"].items() if k not in _PACK_FIELDS}
+        md.update(topic_id=topic_id, file_id=fmeta["id"], path=str(fmeta["path"]), locale=locale)
+        md["chunk_id"] = f"{fmeta['id']}::{md['chunk_id'].split('::', 1)[1]}"
+        out.append({"text": r["text"], "metadata": md})
+    return out
+
+
+def merge_duplicate_chunks(records: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    One record per chunk_hash (content-addressed), in first-seen order, and how
+    many were folded. The first keeps its ids; topic_ids / file_ids / paths list
+    every place the text occurs and citations are the union, so a shared chunk
+    is embedded, stored and retrieved once and still passes a topic filter of
+    any of its topics.
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    for r in records:
+        md = r["metadata"]
+        first = merged.get(md["chunk_hash"])
+        if first is None:
+            first = merged[md["chunk_hash"]] = {"text": r["text"], "metadata": dict(md)}
+            first["metadata"].update(topic_ids=[], file_ids=[], paths=[], citations=[])
+        fm = first["metadata"]
+        for key, value in (("topic_ids", md["topic_id"]), ("file_ids", md["file_id"]), ("paths", md["path"])):
+            if value not in fm[key]:
+                fm[key].append(value)
+        seen = {c.get("id") for c in fm["citations"]}
+        fm["citations"] += [c for c in md.get("citations", []) if c.get("id") not in seen]
+    return list(merged.values()), len(records) - len(merged)
+
+
+# -------------------- 4) Incremental build --------------------
+
+def build_text_index(
+    root: Path,
+    *,
+    rebuild: bool = False,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    max_workers: Optional[int] = None,
+    pages_per_task: int = DEFAULT_PAGES_PER_TASK,
+    vector_dtype: str = "float32",
+    export_jsonl: bool = False,
+    index_type: Optional[str] = None,
+    dim: Optional[int] = None,
+    cache_path: Optional[Path] = None,
+    backend: Optional[EmbeddingBackend] = None,
+    tokenizer: Optional[Path] = None,
+    allow_estimate: bool = False,
+    log: Callable[[str], None] = print,
+) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Build (or update) a pack's text FAISS index, binary vector pack
+    (vectors.npy + docstore.sqlite, see vector_store.py) and meta.json.
+    embeddings.jsonl is only written when `export_jsonl=True`.
+
+    Vectors are Matryoshka-truncated to `dim` (default: the manifest's
+    embedding_config.text.dim) and the FAISS index type comes from
+    `index_type` (default: the manifest's faiss.type, else "flat"); the memory
+    footprint and recall@k against a flat index are logged and kept in meta.json.
+
+    Source files are hashed; a file whose bytes and chunking settings are unchanged
+    reuses its cached chunks without re-extraction. PDF pages are extracted in a
+    process pool (`max_workers`, `pages_per_task` pages per task) and cached by
+    (file hash, page), so changing only the chunking settings never re-parses PDFs. Each chunk is hashed and only
+    chunks missing from the (model, chunk_hash) embedding cache are sent to the
+    embedding model, in batches of `batch_size` with up to `max_concurrency`
+    requests in flight. Everything is checkpointed to `cache_path`
+    (default: vector_db/text/build_cache.sqlite), so an interrupted build resumes.
+
+    `backend` is the embedding backend (default: OllamaBackend for the manifest's
+    model; see embedding.make_backend). Its cache_key namespaces the embedding
+    cache, so switching backends never mixes vectors from two of them.
+
+    Chunks are cut to embedding_config.text.chunking (chunking.py) in tokens of
+    the embedding model: `tokenizer` (its tokenizer.json, or $BEACON_EMBED_TOKENIZER),
+    else the ONNX backend's own tokenizer. Without either the build stops
+    (a ~4 chars/token estimate mis-sizes chunks) unless `allow_estimate`, which
+    the stand-in benchmark uses. The tokenizer is part of the chunking settings,
+    so changing it re-chunks (but only re-embeds chunks whose text changed).
+    report["chunking"] has the chunk size distribution and the tokenizer.
+
+    Returns (faiss_vectorstore, report).
+    """
+    import faiss
+    import numpy as np
+
+    t0 = time.perf_counter()
+    root = Path(root)
+    manifest = load_manifest(root)
+
+    backend = backend or OllamaBackend(manifest["embedding_config"]["text"]["model"], batch_size=batch_size)
+    embed_model_name = backend.model
+    if embed_model_name != manifest["embedding_config"]["text"]["model"]:
+        log(f"! building with {embed_model_name}; the manifest declares {manifest['embedding_config']['text']['model']}")
+    dim = dim or manifest["embedding_config"]["text"].get("dim")
+    normalize = bool(manifest["embedding_config"]["text"].get("normalize", True))
+    counter = embedding_token_counter(backend, tokenizer, log=log)
+    settings = chunking_settings(manifest, counter)
+    if settings["strategy"] != "chars" and not counter.exact:
+        if not allow_estimate:
+            raise ValueError(
+                f"no tokenizer for {embed_model_name}: chunk sizes would be estimated. Pass tokenizer= (or set "
+                f"{EMBED_TOKENIZER_ENV}) to its tokenizer.json, e.g. huggingface-cli download "
+                f"nomic-ai/nomic-embed-text-v1.5 tokenizer.json --local-dir models/nomic-embed-text-v1.5"
+            )
+        log(f"! chunk token counts for {embed_model_name} are estimates ({EMBED_TOKENIZER_ENV} not set)")
+    config_key = json.dumps({"v": CHUNKER_VERSION, **settings}, sort_keys=True)
+
+    # Resolve precomputed index paths from manifest
+    text_idx_cfg = manifest["precomputed_indices"]["text"]
+    embeddings_path = root / text_idx_cfg["embeddings"]
+    meta_path = root / text_idx_cfg["meta"]
+    faiss_dir = root / text_idx_cfg["faiss"]["dir"]
+    faiss_dir.mkdir(parents=True, exist_ok=True)
+    embeddings_path.parent.mkdir(parents=True, exist_ok=True)
+    meta_path.parent.mkdir(parents=True, exist_ok=True)
+    cache_path = Path(cache_path) if cache_path else meta_path.parent / "build_cache.sqlite"
+
+    pack_name = manifest.get("name")
+    pack_ver = manifest.get("version")
+    pack_locales = manifest.get("locales", [])
+    citations_by_id = {c["id"]: c for c in manifest.get("citations", [])}
+
+    report: Dict[str, Any] = {
+        "files_total": 0, "files_reused": 0, "files_chunked": 0, "files_duplicate": 0,
+        "files_missing": 0, "files_empty": 0,
+        "chunks_total": 0, "chunks_cached": 0, "chunks_embedded": 0,
+    }
+
+    with BuildCache(cache_path) as cache:
+        if rebuild:
+            cache.clear()
+        elif cache.get_state("status") == "in_progress":
+            log(f"Resuming interrupted build from {cache_path}")
+        cache.set_state("status", "in_progress")
+
+        # ---- a) hash files; find which ones need (re)chunking ----
+        entries: List[Tuple[str, Dict[str, Any], Path, str, str, str, Optional[List[Dict[str, Any]]]]] = []
+        source_hashes: Dict[str, str] = {}
+
+        for topic_id, fmeta, fpath, kind in iter_core_files(manifest, root):
+            if not fpath.exists():
+                log(f"! Skipping missing file: {fpath}")
+                report["files_missing"] += 1
+                continue
+            report["files_total"] += 1
+
+            file_hash = sha256_file(fpath)
+            source_hashes[str(fmeta["path"])] = file_hash
+            file_key = f"{topic_id}::{fmeta['id']}"
+            cached = cache.get_file_chunks(file_key, file_hash, config_key)
+            entries.append((topic_id, fmeta, fpath, kind, file_hash, file_key, cached))
+
+        # ---- b) parallel PDF extraction into the per-page cache ----
+        pdf_jobs = [(e[4], e[2]) for e in entries if e[6] is None and e[3] == "pdf"]
+        incomplete: set = set()  # PDFs with pages not extracted: chunked, but not cached, so retried next build
+        if pdf_jobs:
+            extract_report = extract_pdfs(
+                pdf_jobs, cache, max_workers=max_workers, pages_per_task=pages_per_task, log=log,
+            )
+            report["extract"] = extract_report
+            incomplete.update(extract_report["incomplete"])
+            for line in format_page_issues(extract_report["page_issues"]):
+                log(line)
+
+        # ---- c) chunk only new/changed files ----
+        chunker = None
+        records: List[Dict[str, Any]] = []
+        by_content: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}  # (file hash, kind) -> its chunks this run
+
+        for topic_id, fmeta, fpath, kind, file_hash, file_key, file_records in entries:
+            if file_records is None and (file_hash, kind) in by_content:
+                # the same bytes listed under another topic: reuse its chunks, no second chunking
+                file_records = retarget_chunks(by_content[(file_hash, kind)], topic_id, fmeta)
+                if file_hash not in incomplete:
+                    cache.put_file_chunks(file_key, file_hash, config_key, file_records)
+                report["files_duplicate"] += 1
+            elif file_records is None:
+                if chunker is None:
+                    chunker = make_chunker(settings, counter.count)
+                pages = [(p, t) for p, t, _, _ in cache.get_pages(file_hash)] if kind == "pdf" else None
+                file_records = chunk_core_file(topic_id, fmeta, fpath, kind, chunker, pages)
+                if file_hash not in incomplete:
+                    cache.put_file_chunks(file_key, file_hash, config_key, file_records)
+                report["files_chunked"] += 1
+            else:
+                report["files_reused"] += 1
+            by_content.setdefault((file_hash, kind), file_records)
+
+            if not file_records:
+                log(f"! No extractable text (scanned images / empty markdown?): {fpath}")
+                report["files_empty"] += 1
+                continue
+
+            c_full = [citations_by_id[cid] for cid in fmeta.get("citations", []) if cid in citations_by_id]
+            for r in file_records:
+                r["metadata"].update({
+                    "pack_name": pack_name,
+                    "pack_version": pack_ver,
+                    "citations": c_full,
+                })
+            records.extend(file_records)
+
+        records, report["chunks_duplicate"] = merge_duplicate_chunks(records)
+        report["chunks_total"] = len(records)
+        report["chunking"] = dict(chunk_stats([r["text"] for r in records], settings["max_tokens"], counter.count),
+                                  tokenizer=counter.name)
+        log(
+            f"Prepared {len(records)} text chunks from {report['files_total']} files "
+            f"({report['files_reused']} unchanged, {report['files_chunked']} (re)chunked, "
+            f"{report['files_duplicate']} duplicates of another topic's file, "
+            f"{report['files_empty']} empty/scan-only, {report['files_missing']} missing; "
+            f"{report['chunks_duplicate']} repeated chunks stored once)"
+        )
+
+        # ---- d) embed only chunks not already in the cache ----
+        hashes = [r["metadata"]["chunk_hash"] for r in records]
+        vectors = cache.get_vectors(backend.cache_key, hashes)
+        todo = [h for h in dict.fromkeys(hashes) if h not in vectors]
+        todo_set = set(todo)
+        report["chunks_cached"] = sum(1 for h in hashes if h not in todo_set)
+        text_by_hash = {r["metadata"]["chunk_hash"]: r["text"] for r in records}
+
+        def _checkpoint(idx: List[int], vecs: List[List[float]]) -> None:
+            batch = [todo[i] for i in idx]
+            cache.put_vectors(backend.cache_key, list(zip(batch, vecs)))
+            vectors.update(zip(batch, vecs))
+            report["chunks_embedded"] += len(batch)
+
+        if todo:
+            log(f"Embedding {len(todo)} new/changed chunks with {embed_model_name} ({backend.name}) …")
+            _, embed_stats = embed_texts(
+                [text_by_hash[h] for h in todo],
+                embed_model_name,
+                batch_size=batch_size,
+                max_concurrency=max_concurrency,
+                backend=backend,
+                on_batch=_checkpoint,
+                log=log,
+            )
+            report["embed"] = embed_stats
+            log(f"Embedding throughput: {embed_stats['chunks_per_sec']} chunks/sec")
+
+        # ---- e) FAISS persist from the vectors we already have ----
+        # the cache keeps full-size vectors, so changing dim or index type never re-embeds
+        ids = [r["metadata"]["chunk_id"] for r in records]
+        ordered = [vectors[r["metadata"]["chunk_hash"]] for r in records]
+        full = np.asarray(ordered, dtype=np.float32)
+        mat = matryoshka_truncate(full, dim)
+        if dim and mat.shape[1] != int(dim):
+            raise ValueError(f"{embed_model_name} returns dim {full.shape[1]}, smaller than the manifest's dim {dim}")
+        spec = index_spec(text_idx_cfg, index_type)
+        index = build_index(mat, spec, log=log)
+        paths = pack_paths(root, text_idx_cfg)
+        faiss.write_index(index, str(paths["index"]))  # docs go to docstore.sqlite below, no index.pkl
+        index_info = index_report(mat, index, full_vectors=full)
+        report["index"] = index_info
+        log(
+            f"Index {index_info['type']} at dim {index_info['dim']}: {index_info['index_bytes'] / 1e6:.2f} MB "
+            f"(flat float32 {index_info['flat_float32_bytes'] / 1e6:.2f} MB), "
+            + ", ".join(f"{k} {v}" for k, v in index_info.items() if k.startswith("recall@"))
+        )
+
+        # ---- f) Binary vector pack (+ optional JSONL export) + meta ----
+        vectors_info = write_vector_pack(
+            paths["vectors"], paths["docstore"], ids,
+            [r["text"] for r in records], [r["metadata"] for r in records], mat, dtype=vector_dtype,
+        )
+        # BM25 side of hybrid retrieval, same row order as FAISS
+        lexical_info = LexicalIndex.build([r["text"] for r in records]).save(lexical_path(root, text_idx_cfg))
+        if export_jsonl:
+            with open(embeddings_path, "w", encoding="utf-8") as f:
+                for doc_id, r, vec in zip(ids, records, mat.tolist()):
+                    rec = {"id": doc_id, "embedding": vec, "metadata": r["metadata"], "text": r["text"]}
+                    f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "model": embed_model_name,
+                    "backend": backend.name,
+                    "dim": int(mat.shape[1]),
+                    "source_dim": int(full.shape[1]),  # model output before Matryoshka truncation
+                    "normalize": normalize,
+                    "count": len(records),
+                    "pack": {"name": pack_name, "version": pack_ver, "locales": pack_locales},
+                    "chunking": settings,
+                    "supported_media_types": SUPPORTED_MEDIA_TYPES,
+                    "sources": source_hashes,  # path -> sha256, used to spot changed files
+                    "vectors": vectors_info,
+                    "lexical": lexical_info,
+                    "index": index_info,
+                },
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+
+        cache.set_state("status", "complete")
+
+    # query side goes through the same truncation as the stored vectors
+    vs = load_faiss_store(root, text_idx_cfg, TruncatedEmbeddings(backend, dim), dim=dim)
+
+    report["seconds"] = round(time.perf_counter() - t0, 2)
+    log(
+        f"Build done in {report['seconds']}s ✅ "
+        f"({report['chunks_embedded']} chunks embedded, {report['chunks_cached']} reused from cache)"
+    )
+    return vs, report
+
+
+# -------------------- 5) Image-caption index --------------------
+
+def build_image_index(
+    root: Path,
+    *,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    vector_dtype: str = "float32",
+    export_jsonl: bool = False,
+    index_type: Optional[str] = None,
+    dim: Optional[int] = None,
+    backend: Optional[EmbeddingBackend] = None,
+    derivatives: bool = True,
+    log: Callable[[str], None] = print,
+) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Embed every manifest `assets` caption once and write the image FAISS index,
+    binary vector pack, captions.jsonl and meta.json from those same vectors
+    (embeddings.jsonl only when `export_jsonl=True`). Vectors are truncated to
+    the manifest's embedding_config.images.dim, as for the text index.
+    `backend` defaults to OllamaBackend for the manifest's model, as in build_text_index.
+    With `derivatives`, also writes the chat UI's resized image copies (assets.build_derivatives).
+
+    Returns (faiss_vectorstore, report).
+    """
+    import uuid
+
+    import faiss
+
+    root = Path(root)
+    manifest = load_manifest(root)
+
+    # Pull embedding config from manifest
+    backend = backend or OllamaBackend(manifest["embedding_config"]["images"]["model"], batch_size=batch_size)
+    embed_model_name = backend.model
+    dim = dim or manifest["embedding_config"]["images"].get("dim")
+    normalize = bool(manifest["embedding_config"]["images"].get("normalize", True))
+
+    # Resolve precomputed index paths from manifest
+    images_idx_cfg = manifest["precomputed_indices"]["images"]
+    embeddings_path = root / images_idx_cfg["embeddings"]
+    meta_path = root / images_idx_cfg["meta"]
+    faiss_dir = root / images_idx_cfg["faiss"]["dir"]
+    captions_path = root / images_idx_cfg["captions"]
+    for p in (faiss_dir, embeddings_path.parent, meta_path.parent, captions_path.parent):
+        p.mkdir(parents=True, exist_ok=True)
+
+    pack_name = manifest["name"]
+    pack_ver = manifest["version"]
+    pack_locales = manifest["locales"]
+
+    # citation id -> full object
+    citations = {c["id"]: c for c in manifest.get("citations", [])}
+
+    texts: List[str] = []
+    metadatas: List[Dict[str, Any]] = []
+    for a in manifest.get("assets", []):
+        caption = (a.get("image_description") or a.get("alt_text") or "").strip()
+        tags = " ".join(a.get("tags", [])).strip()
+        texts.append(" | ".join(t for t in [caption, tags] if t))
+
+        # expand image citation IDs to full objects (like text pipeline)
+        c_ids = a.get("citations", []) or []
+        metadatas.append({
+            "pack_name": pack_name,
+            "pack_version": pack_ver,
+            "id": a["id"],
+            "path": a["path"],
+            "media_type": a.get("media_type", "image/png"),
+            "locale": a.get("locale", "hi_en"),
+            # Keep BOTH for convenience:
+            "citation_ids": c_ids,  # raw IDs as in manifest
+            "citations": [citations[cid] for cid in c_ids if cid in citations],  # expanded objects
+        })
+    log(f"Prepared {len(texts)} image-caption docs")
+
+    # ---- embed once, reuse for FAISS + JSONL ----
+    vectors, embed_stats = embed_texts(
+        texts, embed_model_name, batch_size=batch_size, max_concurrency=max_concurrency,
+        backend=backend, log=None,
+    )
+    log(f"Embedding throughput: {embed_stats['chunks_per_sec']} captions/sec")
+
+    ids = [str(uuid.uuid4()) for _ in texts]
+    mat = matryoshka_truncate(vectors, dim)
+    spec = index_spec(images_idx_cfg, index_type)
+    index = build_index(mat, spec, log=log)
+    paths = pack_paths(root, images_idx_cfg)
+    faiss.write_index(index, str(paths["index"]))  # docs go to docstore.sqlite, no index.pkl
+    index_info = index_report(mat, index, k=4, full_vectors=vectors)
+    vectors_info = write_vector_pack(paths["vectors"], paths["docstore"], ids, texts, metadatas, mat, dtype=vector_dtype)
+    if export_jsonl:
+        with open(embeddings_path, "w", encoding="utf-8") as f:
+            for doc_id, text, md, vec in zip(ids, texts, metadatas, mat.tolist()):
+                f.write(json.dumps({"id": doc_id, "embedding": vec, "metadata": md, "text": text}, ensure_ascii=False) + "\n")
+
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "model": embed_model_name,
+            "backend": backend.name,
+            "dim": int(mat.shape[1]),
+            "source_dim": len(vectors[0]) if vectors else None,
+            "normalize": normalize,
+            "count": len(texts),
+            "pack": {"name": pack_name, "version": pack_ver, "locales": pack_locales},
+            "vectors": vectors_info,
+            "index": index_info,
+        }, f, ensure_ascii=False, indent=2)
+
+    with open(captions_path, "w", encoding="utf-8") as f:
+        for doc_id, text, md in zip(ids, texts, metadatas):
+            # compact record with helpful fields
+            rec = {
+                "pack_name": pack_name,
+                "pack_version": pack_ver,
+                "id": doc_id,
+                "asset_id": md["id"],
+                "path": md["path"],
+                "locale": md["locale"],
+                "media_type": md["media_type"],
+                "citation_ids": md["citation_ids"],
+                "citation_titles": [c.get("title", "") for c in md["citations"]],
+                "text": text,  # caption
+            }
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+    log(f"Image index, vector pack, captions and meta saved ✅ ({len(texts)} rows)")
+    report = {"captions": len(texts), "embed": embed_stats, "index": index_info}
+    if derivatives:
+        from .assets import build_derivatives
+
+        report["derivatives"] = build_derivatives(root, log=log)
+    emb = TruncatedEmbeddings(backend, dim)
+    vs = load_faiss_store(root, images_idx_cfg, emb, dim=dim)
+    return vs, report
+
+
+# -------------------- 6) Re-index without re-embedding --------------------
+
+def reindex_pack(
+    root: Path,
+    kind: str = "text",
+    *,
+    index_type: Optional[str] = None,
+    dim: Optional[int] = None,
+    vector_dtype: Optional[str] = None,
+    log: Callable[[str], None] = print,
+) -> Dict[str, Any]:
+    """
+    Rebuild one pack's FAISS index (and re-truncate vectors.npy) from the stored
+    vectors, e.g. after changing faiss.type or lowering the declared dim in the
+    manifest. Nothing is re-embedded; vectors can only be truncated, never widened.
+    Returns the index report that is also written to meta.json.
+    """
+    import faiss
+    import numpy as np
+
+    from .vector_store import load_vectors
+
+    root = Path(root)
+    manifest = load_manifest(root)
+    idx_cfg = manifest["precomputed_indices"][kind]
+    dim = dim or manifest["embedding_config"][kind].get("dim")
+    paths = pack_paths(root, idx_cfg)
+
+    stored = np.array(load_vectors(paths["vectors"], mmap=False), dtype=np.float32)
+    mat = matryoshka_truncate(stored, dim)
+    if dim and mat.shape[1] != int(dim):
+        raise ValueError(f"{paths['vectors']} has dim {stored.shape[1]}; cannot widen to {dim}, rebuild the pack")
+
+    spec = index_spec(idx_cfg, index_type)
+    index = build_index(mat, spec, log=log)
+    faiss.write_index(index, str(paths["index"]))
+    index_info = index_report(mat, index, k=10 if kind == "text" else 4, full_vectors=stored)
+
+    meta_path = root / idx_cfg["meta"]
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    dtype = vector_dtype or meta.get("vectors", {}).get("dtype", "float32")
+    np.save(paths["vectors"], np.ascontiguousarray(mat.astype(dtype)))
+    meta["dim"] = int(mat.shape[1])
+    meta["source_dim"] = meta.get("source_dim") or int(stored.shape[1])
+    meta.setdefault("vectors", {}).update({"dtype": dtype, "count": int(mat.shape[0]), "dim": int(mat.shape[1])})
+    meta["index"] = index_info
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    log(f"{kind} index rebuilt: {index_info}")
+    return index_info
@@ -0,0 +1,337 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from .agent import DEFAULT_LLM, DEFAULT_TEMPERATURE, StartupTimer, build_agent, make_tools, prompt_warmup
+from .registry import DEFAULT_MEMORY_BUDGET_MB, PACK_ALIASES, PACKS_DIR, PackRegistry, find_pack_dirs, resolve_pack
+from .residency import DEFAULT_KEEP_ALIVE, ModelResidency
+from .memory import DEFAULT_HISTORY_TOKENS
+from .server import DEFAULT_MAX_CONCURRENT, DEFAULT_MAX_QUEUE, DEFAULT_QUEUE_TIMEOUT
+from .tokens import TOKENIZER_ENV, token_counter
+from .tracing import DEFAULT_TRACE_DIR, add_span, llm_span_attrs
+
+# Headless kiosk entry point:
+#
+#   python -m beacon.kiosk "Knowledge Packs/Pinellas County Floirda Hurricane Response Kpack"
+#   python -m beacon.kiosk INDIA --ask "saap ne kaat liya kya karein"
+#   python -m beacon.kiosk FLORIDA --check      # load everything, print the startup timings, exit
+#   python -m beacon.kiosk FLORIDA --all-packs  # every pack; FLORIDA loads first, others on demand
+#
+# Boot order, tuned for time-to-first-answer after a power cut: read the manifest,
+# then load the pack's indexes and build the agent on background threads while
+# gradio imports and the server (server.py: HTTP API + the UI as one of its
+# clients) starts. A question asked before the indexes are ready waits for them
+# inside the tool call. Once the agent is built, residency.py warms the chat model
+# (through the agent's own prompt prefix) and the embedder and keeps them loaded.
+
+class Kiosk:
+    """
+    A home pack (+ with `packs_dir`, every other pack there, see registry.py) and
+    the agent, started in the background; answers via `ask()` / `astream()`.
+    """
+
+    def __init__(
+        self,
+        pack_dir: Path,
+        *,
+        llm: str = DEFAULT_LLM,
+        temperature: float = DEFAULT_TEMPERATURE,
+        backend: str = "ollama",
+        model_dir: Optional[Path] = None,
+        num_threads: Optional[int] = None,
+        tokenizer: Optional[Path] = None,
+        keep_alive: Any = DEFAULT_KEEP_ALIVE,
+        ram_budget_gb: Optional[float] = None,
+        warmup: bool = True,
+        packs_dir: Optional[Path] = None,
+        pack_memory_mb: float = DEFAULT_MEMORY_BUDGET_MB,
+        verbose: bool = False,
+        log=print,
+    ):
+        self.timer = StartupTimer()
+        self.log = log
+        self.llm = llm
+        self.temperature = temperature
+        self.tokenizer = tokenizer
+        self.keep_alive = keep_alive
+        self.warmup = warmup
+        self.verbose = verbose
+        self.registry = PackRegistry(
+            find_pack_dirs(packs_dir) if packs_dir else [pack_dir], home=pack_dir,
+            memory_budget_mb=pack_memory_mb, backend=backend, model_dir=model_dir, num_threads=num_threads,
+            keep_alive=keep_alive, timer=self.timer, log=log,
+        )
+        self.pack = self.registry.home_pack  # loaded at start(); the others on their first question
+        self.residency = ModelResidency(keep_alive=keep_alive, ram_budget_gb=ram_budget_gb, timer=self.timer, log=log)
+        self._executor = None
+        self.tools: Dict[str, Any] = {}   # name -> tool, once the agent is built (router.prefetch runs them)
+        self._agent_error: Optional[BaseException] = None
+        self._agent_ready = threading.Event()
+        self._agent_thread: Optional[threading.Thread] = None
+        self._answered = threading.Event()
+
+    def start(self) -> "Kiosk":
+        """Start loading the indexes and building the agent; returns immediately."""
+        self.pack.load_in_background()
+        if self._agent_thread is None:
+            self._agent_thread = threading.Thread(target=self._build_agent, name="beacon-agent", daemon=True)
+            self._agent_thread.start()
+        return self
+
+    def _build_agent(self) -> None:
+        try:
+            with self.timer.phase("tokenizer"):
+                counter = token_counter(self.llm, self.tokenizer, log=self.log)
+            with self.timer.phase("imports: tools"):
+                tools = make_tools(self.registry, counter)
+            self.tools = {t.name: t for t in tools}
+            self._executor = build_agent(tools, self.llm, self.temperature, verbose=self.verbose, timer=self.timer,
+                                         keep_alive=self.keep_alive)
+        except BaseException as e:
+            self._agent_error = e
+            self.log(f"! building the agent failed: {e}")
+        finally:
+            self._agent_ready.set()
+        if self.warmup and self._agent_error is None:
+            self._start_residency(tools)
+
+    def _start_residency(self, tools: List[Any]) -> None:
+        """Register the chat model (if Ollama-served) and the pack's embedder, then warm them."""
+        if self.llm.startswith("ollama:"):
+            self.residency.add("llm", self.llm.split(":", 1)[1],
+                               prompt_warmup(tools, self.llm, self.temperature, self.keep_alive))
+
+        def warm_embedder() -> Dict[str, Any]:
+            self.pack.wait().backend.embed_documents(["warm-up"])  # the backend itself: no query-cache entry
+            return {}
+
+        def set_keep_alive(value: Any) -> None:
+            self.pack.backend.keep_alive = value
+
+        ollama = self.pack.backend_kind == "ollama"
+        self.residency.add("embeddings", self.pack.manifest["embedding_config"]["text"]["model"], warm_embedder,
+                           ollama=ollama, set_keep_alive=set_keep_alive if ollama else None)
+        self.residency.start()
+
+    def executor(self, timeout: Optional[float] = None):
+        """The AgentExecutor, once built (builds it in this thread if start() was never called)."""
+        if self._agent_thread is None and not self._agent_ready.is_set():
+            self._build_agent()
+        if not self._agent_ready.wait(timeout):
+            raise TimeoutError(f"agent still starting after {timeout}s")
+        if self._agent_error is not None:
+            raise RuntimeError(f"agent failed to start: {self._agent_error}") from self._agent_error
+        return self._executor
+
+    @property
+    def agent_ready(self) -> bool:
+        return self._agent_ready.is_set() and self._agent_error is None
+
+    def wait_ready(self, timeout: Optional[float] = None) -> "Kiosk":
+        self.executor(timeout)
+        self.pack.wait(timeout)
+        return self
+
+    def _first_answer(self) -> None:
+        if not self._answered.is_set():
+            self._answered.set()
+            self.timer.mark("first answer", once=True)
+            self.log(f"first answer {self.timer.phases['first answer']['at_ms']:.0f} ms after boot")
+
+    def ask(self, question: str, chat_history: Optional[List[Tuple[str, str]]] = None) -> str:
+        out = self.executor().invoke({"input": question, "chat_history": chat_history or []})["output"]
+        self._first_answer()
+        return out
+
+    async def astream(self, question: str, chat_history: Optional[List[Tuple[str, str]]] = None,
+                      prefetched: str = "") -> AsyncIterator[Dict[str, Any]]:
+        """
+        One question as it runs, from the AgentExecutor's astream_events:
+          {"token": str}                  a piece of chat-model output text, as generated
+          {"llm_end": [tool names]}       an LLM pass finished; non-empty if it called tools
+                                          (any text it streamed was not the answer)
+          {"tool": name, "observation"}   a tool result, as soon as the tool returns
+          {"output": str}                 the final answer
+        `chat_history` is earlier ("human" | "ai", text) turns of the same session and
+        `prefetched` a router.format_prefetched() block appended to the question.
+        """
+        executor = await asyncio.to_thread(self.executor)  # keep the event loop free while the agent builds
+        inputs = {"input": question, "chat_history": chat_history or [], "prefetched": prefetched}
+        started: Dict[str, float] = {}  # run_id -> perf_counter, for the llm / tool spans (tracing.py)
+        async for event in executor.astream_events(inputs, version="v2"):
+            kind, data = event["event"], event.get("data", {})
+            if kind in ("on_chat_model_start", "on_tool_start"):
+                started[event["run_id"]] = time.perf_counter()
+            elif kind == "on_chat_model_stream":
+                text = _message_text(data.get("chunk"))
+                if text:
+                    self._first_answer()
+                    yield {"token": text}
+            elif kind == "on_chat_model_end":
+                output = data.get("output")
+                calls = [c["name"] for c in getattr(output, "tool_calls", None) or []]
+                _end_span(started, event, "llm", tool_calls=len(calls),
+                          **llm_span_attrs(getattr(output, "response_metadata", None) or {}))
+                yield {"llm_end": calls}
+            elif kind == "on_tool_end":
+                _end_span(started, event, f"tool.{event['name']}")
+                yield {"tool": event["name"], "observation": data.get("output")}
+            elif kind == "on_chain_end" and not event.get("parent_ids"):
+                output = data.get("output") or {}
+                self._first_answer()
+                yield {"output": output.get("output", "") if isinstance(output, dict) else str(output)}
+
+
+def _end_span(started: Dict[str, float], event: Dict[str, Any], name: str, **attrs: Any) -> None:
+    t0 = started.pop(event["run_id"], None)
+    if t0 is not None:
+        add_span(name, (time.perf_counter() - t0) * 1000, start=t0, **attrs)
+
+
+def _message_text(chunk: Any) -> str:
+    """Text of a streamed message chunk (content is a string or a list of content blocks)."""
+    content = getattr(chunk, "content", "")
+    if isinstance(content, str):
+        return content
+    return "".join(b.get("text", "") if isinstance(b, dict) else str(b) for b in content or [])
+
+
+# ----------------------------
+# CLI
+# ----------------------------
+
+async def _ask_streaming(kiosk: Kiosk, question: str) -> None:
+    """--ask: print the answer as it is generated, then time to first token and total."""
+    t0 = time.perf_counter()
+    ttft = None
+    streamed = False
+    async for chunk in kiosk.astream(question):
+        if "token" in chunk:
+            if ttft is None:
+                ttft = (time.perf_counter() - t0) * 1000
+            streamed = True
+            print(chunk["token"], end="", flush=True)
+        elif chunk.get("llm_end") and streamed:
+            print("\n", flush=True)  # that text came with tool calls; the answer follows
+            ttft, streamed = None, False
+        elif "output" in chunk and not streamed:
+            print(chunk["output"], end="", flush=True)
+    total = (time.perf_counter() - t0) * 1000
+    print(f"\n\n(first token {ttft:.0f} ms, answer {total:.0f} ms)" if ttft is not None
+          else f"\n\n(answer {total:.0f} ms)", flush=True)
+
+
+def _report_when_ready(kiosk: Kiosk, server) -> None:
+    while not server.started and not server.should_exit:
+        time.sleep(0.05)
+    kiosk.timer.mark("server up")
+    try:
+        kiosk.wait_ready()
+    except Exception as e:
+        print(f"! kiosk not ready: {e}", flush=True)
+    print(kiosk.timer.report(), flush=True)
+    if kiosk.warmup and kiosk.residency.wait():
+        print(kiosk.residency.report(), flush=True)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m beacon.kiosk",
+        description="Serve the Beacon kiosk (HTTP API + Gradio chat UI) on one knowledge pack",
+    )
+    parser.add_argument("pack", help=f"pack directory, or one of: {', '.join(PACK_ALIASES)}")
+    parser.add_argument("--all-packs", action="store_true",
+                        help="also serve every other pack under --packs-dir, loaded on demand")
+    parser.add_argument("--packs-dir", type=Path, default=PACKS_DIR, help="where --all-packs looks for packs")
+    parser.add_argument("--pack-memory-mb", type=float, default=DEFAULT_MEMORY_BUDGET_MB,
+                        help="loaded packs above this size are unloaded, least recently used first")
+    parser.add_argument("--host", default="127.0.0.1", help="bind address (0.0.0.0 to serve the LAN)")
+    parser.add_argument("--port", type=int, default=7860, help="HTTP port (UI at /, API at /api)")
+    parser.add_argument("--no-ui", action="store_true", help="serve the HTTP API only")
+    parser.add_argument("--llm", default=DEFAULT_LLM, help="chat model for init_chat_model")
+    parser.add_argument("--llm-concurrency", type=int, default=DEFAULT_MAX_CONCURRENT,
+                        help="agent turns run at once (match OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE, help="waiting turns before 503 busy")
+    parser.add_argument("--queue-timeout", type=float, default=DEFAULT_QUEUE_TIMEOUT,
+                        help="seconds a turn may wait for the LLM")
+    parser.add_argument("--no-prefetch", action="store_true",
+                        help="let the agent call context / getImage itself (no pre-routing)")
+    parser.add_argument("--no-answer-cache", action="store_true",
+                        help="always run the agent (no semantic answer cache / FAQ pre-warming)")
+    parser.add_argument("--history-tokens", type=int, default=DEFAULT_HISTORY_TOKENS,
+                        help="recent conversation passed back verbatim; older turns are summarized")
+    parser.add_argument("--no-summaries", action="store_true",
+                        help="keep older questions instead of LLM summaries of older turns")
+    parser.add_argument("--backend", default="ollama", choices=("ollama", "onnx"), help="query embedding backend")
+    parser.add_argument("--model-dir", type=Path, help="model.onnx + tokenizer.json folder for --backend onnx")
+    parser.add_argument("--threads", type=int, help="query embedding threads")
+    parser.add_argument("--tokenizer", type=Path,
+                        help=f"the chat model's tokenizer.json, for exact context budgets (or ${TOKENIZER_ENV})")
+    parser.add_argument("--keep-alive", default=DEFAULT_KEEP_ALIVE,
+                        help="how long Ollama keeps the models loaded after the last turn (-1 = while running, e.g. 2h)")
+    parser.add_argument("--ram-budget-gb", type=float,
+                        help="keep the embedding model resident only if it fits next to the chat model")
+    parser.add_argument("--no-warmup", action="store_true", help="do not preload / warm the models at startup")
+    parser.add_argument("--ask", metavar="QUESTION", help="answer one question in the terminal and exit (no server)")
+    parser.add_argument("--check", action="store_true", help="load the pack and agent, print startup timings, exit")
+    parser.add_argument("--trace-dir", type=Path, default=DEFAULT_TRACE_DIR,
+                        help="rotating per-turn trace log (traces.jsonl; summarize with python -m beacon.tracing)")
+    parser.add_argument("--no-trace", action="store_true", help="keep /metrics but write no trace log")
+    parser.add_argument("--verbose", action="store_true", help="log agent steps")
+    args = parser.parse_args(argv)
+
+    try:
+        pack = resolve_pack(args.pack)
+    except FileNotFoundError as e:
+        parser.error(str(e))
+
+    kiosk = Kiosk(pack, llm=args.llm, backend=args.backend, model_dir=args.model_dir,
+                  num_threads=args.threads, tokenizer=args.tokenizer, keep_alive=args.keep_alive,
+                  ram_budget_gb=args.ram_budget_gb, warmup=not (args.no_warmup or args.ask),
+                  packs_dir=args.packs_dir if args.all_packs else None, pack_memory_mb=args.pack_memory_mb,
+                  verbose=args.verbose).start()
+    timer = kiosk.timer
+
+    if args.check or args.ask:
+        try:
+            kiosk.wait_ready()
+            if args.ask:
+                asyncio.run(_ask_streaming(kiosk, args.ask))
+            elif kiosk.warmup:
+                kiosk.residency.wait()
+        finally:
+            print(timer.report(), flush=True)
+            if kiosk.residency.models:
+                print(kiosk.residency.report(), flush=True)
+        return 0
+
+    with timer.phase("imports: server"):
+        import uvicorn
+
+        from .server import ChatService, create_app
+        from .tracing import Tracer
+    if not args.no_ui:
+        with timer.phase("imports: gradio"):
+            import gradio  # noqa: F401  (timed on its own: the slowest import on a kiosk)
+    with timer.phase("app"):
+        service = ChatService(kiosk, max_concurrent=args.llm_concurrency, max_queue=args.max_queue,
+                              queue_timeout=args.queue_timeout, answer_cache=not args.no_answer_cache,
+                              prefetch=not args.no_prefetch, history_tokens=args.history_tokens,
+                              summarize=not args.no_summaries,
+                              tracer=Tracer(trace_dir=None if args.no_trace else args.trace_dir))
+        app = create_app(service, ui=not args.no_ui)
+    server = uvicorn.Server(uvicorn.Config(app, host=args.host, port=args.port, log_level="warning"))
+    threading.Thread(target=_report_when_ready, args=(kiosk, server), daemon=True).start()
+    print(f"Beacon on http://{args.host}:{args.port} (API under /api)", flush=True)
+    server.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
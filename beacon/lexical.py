@@ -0,0 +1,337 @@
+from __future__ import annotations
+
+import math
+import re
+import time
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Lexical (BM25) side of hybrid retrieval. Built offline next to the FAISS index:
+#   vector_db/text/bm25.npz   sorted vocabulary + CSR postings, row ids == FAISS ids
+LEXICAL_FILE = "bm25.npz"
+LEXICAL_VERSION = 1
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+
+# ----------------------------
+# Tokenizer (English, romanized Hindi and Devanagari)
+# ----------------------------
+
+# Devanagari digits -> ASCII, zero-width joiners dropped, nukta folded away and
+# chandrabindu folded onto anusvara so common spelling variants share a token.
+_FOLD = {ord(d): str(i) for i, d in enumerate("०१२३४५६७८९")}
+_FOLD.update({0x200C: None, 0x200D: None, 0x093C: None, 0x0901: 0x0902})
+
+# Latin letters/digits, or a run of Devanagari letters + vowel signs + virama
+# (U+0900–U+0963, U+0971–U+097F; the danda punctuation is a separator).
+TOKEN_RE = re.compile(r"[a-z0-9]+|[\u0900-\u0963\u0971-\u097F]+")
+# phone numbers / ids written with separators ("727-464-3800", "+91 6123 456789")
+DIGIT_RUN_RE = re.compile(r"\d[\d\s\-().]{4,}\d")
+
+STOPWORDS = frozenset(
+    # English
+    "a an and are as at be by for from has have how i if in is it its of on or "
+    "that the this to was were what when where which who why will with you your "
+    # romanized Hindi (hi_en)
+    "hai hain ka ki ke ko se me mein aur ya bhi to kya kaise "
+    # Devanagari Hindi
+    "का की के को से में है हैं और या भी तो क्या कैसे यह वह एक पर ने लिए कि जो हो".split()
+)
+
+
+def _stem(tok: str) -> str:
+    # plural folding for Latin words only ("shelters" -> "shelter"); digits untouched
+    if len(tok) > 4 and tok.isalpha() and tok.isascii():
+        if tok.endswith("ies"):
+            return tok[:-3] + "y"
+        if tok.endswith("s") and not tok.endswith("ss"):
+            return tok[:-1]
+    return tok
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased, NFC-normalized tokens for BM25 — keeps Devanagari and hi_en text."""
+    text = unicodedata.normalize("NFC", text or "").casefold().translate(_FOLD)
+    toks = [_stem(t) for t in TOKEN_RE.findall(text) if t not in STOPWORDS]
+    # also index long digit runs joined, so "7274643800" matches "727-464-3800"
+    for m in DIGIT_RUN_RE.finditer(text):
+        joined = re.sub(r"\D", "", m.group())
+        if len(joined) >= 6:
+            toks.append(joined)
+    return toks
+
+
+# ----------------------------
+# BM25 index
+# ----------------------------
+
+class LexicalIndex:
+    """
+    Compact BM25 index: sorted `terms`, postings in CSR form (`term_ptr`,
+    `post_rows`, `post_tf`) and per-row lengths. On disk the vocabulary is one
+    UTF-8 blob plus offsets, so loading is a single np.load and a dict build;
+    scoring is numpy over the query terms' postings.
+    """
+
+    def __init__(self, terms: Sequence[str], term_ptr: np.ndarray, post_rows: np.ndarray,
+                 post_tf: np.ndarray, doc_len: np.ndarray, k1: float = BM25_K1, b: float = BM25_B):
+        self.terms = list(terms)
+        self.vocab = {t: i for i, t in enumerate(self.terms)}
+        self.term_ptr = term_ptr
+        self.post_rows = post_rows
+        self.post_tf = post_tf
+        self.doc_len = doc_len
+        self.k1 = k1
+        self.b = b
+        self.n_docs = int(doc_len.shape[0])
+        self.avgdl = float(doc_len.mean()) if self.n_docs else 0.0
+
+    @classmethod
+    def build(cls, texts: Sequence[str], k1: float = BM25_K1, b: float = BM25_B) -> "LexicalIndex":
+        postings: Dict[str, Dict[int, int]] = {}
+        doc_len = np.zeros(len(texts), dtype=np.int32)
+        for row, text in enumerate(texts):
+            toks = tokenize(text)
+            doc_len[row] = len(toks)
+            for t in toks:
+                slot = postings.setdefault(t, {})
+                slot[row] = slot.get(row, 0) + 1
+
+        terms = sorted(postings)
+        term_ptr = np.zeros(len(terms) + 1, dtype=np.int32)
+        rows: List[int] = []
+        tfs: List[int] = []
+        for i, t in enumerate(terms):
+            for row, tf in sorted(postings[t].items()):
+                rows.append(row)
+                tfs.append(tf)
+            term_ptr[i + 1] = len(rows)
+        return cls(
+            terms,
+            term_ptr,
+            np.array(rows, dtype=np.int32),
+            np.array(tfs, dtype=np.uint16),
+            doc_len,
+            k1=k1,
+            b=b,
+        )
+
+    def save(self, path: Path) -> Dict[str, Any]:
+        """Write bm25.npz (plain arrays, no pickle). Returns a summary for meta.json."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        encoded = [t.encode("utf-8") for t in self.terms]
+        term_off = np.zeros(len(encoded) + 1, dtype=np.int32)
+        term_off[1:] = np.cumsum([len(e) for e in encoded])
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                version=np.array([LEXICAL_VERSION]),
+                params=np.array([self.k1, self.b], dtype=np.float64),
+                term_bytes=np.frombuffer(b"".join(encoded), dtype=np.uint8),
+                term_off=term_off,
+                term_ptr=self.term_ptr,
+                post_rows=self.post_rows,
+                post_tf=self.post_tf,
+                doc_len=self.doc_len,
+            )
+        return {"file": path.name, "docs": self.n_docs, "terms": len(self.terms),
+                "postings": int(self.post_rows.shape[0])}
+
+    @classmethod
+    def load(cls, path: Path) -> "LexicalIndex":
+        with np.load(path, allow_pickle=False) as z:
+            if int(z["version"][0]) != LEXICAL_VERSION:
+                raise ValueError(f"{path} was built by lexical index v{int(z['version'][0])}, expected v{LEXICAL_VERSION}")
+            k1, b = (float(x) for x in z["params"])
+            blob, off = z["term_bytes"].tobytes(), z["term_off"]
+            terms = [blob[off[i]:off[i + 1]].decode("utf-8") for i in range(off.shape[0] - 1)]
+            return cls(terms, z["term_ptr"], z["post_rows"], z["post_tf"], z["doc_len"], k1=k1, b=b)
+
+    def _postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        i = self.vocab.get(term)
+        if i is None:
+            return self.post_rows[:0], self.post_tf[:0]
+        s, e = self.term_ptr[i], self.term_ptr[i + 1]
+        return self.post_rows[s:e], self.post_tf[s:e]
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every row for `query` (zeros where no term matches)."""
+        out = np.zeros(self.n_docs, dtype=np.float32)
+        if not self.n_docs:
+            return out
+        norm = self.k1 * (1.0 - self.b + self.b * self.doc_len / (self.avgdl or 1.0))
+        for term in set(tokenize(query)):
+            rows, tf = self._postings(term)
+            if rows.shape[0] == 0:
+                continue
+            df = rows.shape[0]
+            idf = math.log(1.0 + (self.n_docs - df + 0.5) / (df + 0.5))
+            tf = tf.astype(np.float32)
+            out[rows] += idf * tf * (self.k1 + 1.0) / (tf + norm[rows])
+        return out
+
+    def search(self, query: str, k: int = 20, allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Top-k (row, score) with score > 0; `allowed` is an optional boolean row mask."""
+        s = self.scores(query)
+        if allowed is not None:
+            s = np.where(allowed, s, 0.0)
+        hit = np.flatnonzero(s > 0)
+        if hit.shape[0] == 0:
+            return []
+        top = hit[np.argsort(-s[hit], kind="stable")[:k]]
+        return [(int(r), float(s[r])) for r in top]
+
+
+def lexical_path(root: Path, idx_cfg: Dict[str, Any]) -> Path:
+    """bm25.npz location for a `precomputed_indices.<kind>` block (default: next to meta.json)."""
+    root = Path(root)
+    if idx_cfg.get("lexical"):
+        return root / idx_cfg["lexical"]
+    return (root / idx_cfg["meta"]).parent / LEXICAL_FILE
+
+
+def load_lexical_index(root: Path, idx_cfg: Dict[str, Any], log=print) -> Optional[LexicalIndex]:
+    """Load the pack's BM25 index, or None (vector-only retrieval) if it was never built."""
+    path = lexical_path(root, idx_cfg)
+    if not path.exists():
+        log(f"! no lexical index at {path}; retrieval is vector-only")
+        return None
+    return LexicalIndex.load(path)
+
+
+# ----------------------------
+# Hybrid retrieval
+# ----------------------------
+
+def rrf_fuse(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """Reciprocal rank fusion: sum of 1 / (k + rank) over every ranking a row appears in."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, 1):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda kv: -kv[1])
+
+
+def vector_rows(
+    vs,
+    query: str,
+    k: int,
+    vector: Optional[Sequence[float]] = None,
+    allowed: Optional[np.ndarray] = None,
+) -> List[int]:
+    """
+    FAISS row ids for `query`, best first (embeds through vs.embedding_function
+    unless `vector` is given). With an `allowed` row mask only those rows are scanned.
+    """
+    if vector is None:
+        vector = vs.embedding_function.embed_query(query)
+    vec = np.asarray([vector], dtype=np.float32)
+    if allowed is None:
+        _, idx = vs.index.search(vec, min(k, vs.index.ntotal))
+    else:
+        from .filters import filtered_search
+
+        return filtered_search(vs.index, vec, k, allowed)
+    return [int(i) for i in idx[0] if i >= 0]
+
+
+def row_documents(vs, rows: Sequence[int]) -> List[Any]:
+    """Materialize Documents for FAISS rows through the store's docstore."""
+    out = []
+    for r in rows:
+        doc = vs.docstore.search(vs.index_to_docstore_id[r])
+        if not isinstance(doc, str):
+            out.append(doc)
+    return out
+
+
+def hybrid_search(
+    vs,
+    lexical: Optional[LexicalIndex],
+    query: str,
+    k: int = 4,
+    fetch_k: int = 20,
+    rrf_k: int = RRF_K,
+    vector: Optional[Sequence[float]] = None,
+    allowed: Optional[np.ndarray] = None,
+) -> List[Any]:
+    """
+    Top-k Documents from BM25 and vector search fused with RRF.
+    Falls back to plain vector search when the pack has no lexical index.
+    `allowed` (a row mask, see filters.RowFilter) restricts both sides before ranking.
+    """
+    v_rows = vector_rows(vs, query, max(k, fetch_k), vector=vector, allowed=allowed)
+    if lexical is None:
+        return row_documents(vs, v_rows[:k])
+    l_rows = [r for r, _ in lexical.search(query, fetch_k, allowed=allowed)]
+    fused = rrf_fuse([v_rows, l_rows], k=rrf_k)
+    return row_documents(vs, [r for r, _ in fused[:k]])
+
+
+def matches_expect(doc, expect: Dict[str, Any]) -> bool:
+    """
+    True when every metadata key in `expect` matches and the text contains
+    expect["text"] (if given). topic_id / file_id / path also match any entry of a
+    shared chunk's topic_ids / file_ids / paths.
+    """
+    for key, want in expect.items():
+        if key == "text":
+            if str(want).casefold() not in doc.page_content.casefold():
+                return False
+        elif doc.metadata.get(key) != want and want not in (doc.metadata.get(key + "s") or []):
+            return False
+    return True
+
+
+def compare_retrieval(
+    vs,
+    lexical: LexicalIndex,
+    cases: Sequence[Dict[str, Any]],
+    k: int = 4,
+) -> Dict[str, Any]:
+    """
+    Hit rate, MRR and latency of pure-vector vs hybrid retrieval.
+
+    Each case is {"query": str, "expect": {...}} where a hit is a returned chunk
+    whose metadata matches every key in "expect" (e.g. topic_id, file_id), or
+    whose text contains "expect"["text"].
+
+    Queries are embedded once up front (reported as embed_ms_mean) so both
+    modes are timed on search + fusion + docstore reads only.
+    """
+    qvecs, embed_ms = [], []
+    for case in cases:
+        t0 = time.perf_counter()
+        qvecs.append(vs.embedding_function.embed_query(case["query"]))
+        embed_ms.append((time.perf_counter() - t0) * 1000)
+
+    modes = {
+        "vector": lambda q, v: row_documents(vs, vector_rows(vs, q, k, vector=v)),
+        "hybrid": lambda q, v: hybrid_search(vs, lexical, q, k=k, vector=v),
+    }
+    report: Dict[str, Any] = {"embed_ms_mean": round(float(np.mean(embed_ms)) if embed_ms else 0.0, 2)}
+    for name, run in modes.items():
+        hits, rr, ms = 0, 0.0, []
+        for case, qvec in zip(cases, qvecs):
+            t0 = time.perf_counter()
+            docs = run(case["query"], qvec)
+            ms.append((time.perf_counter() - t0) * 1000)
+            rank = next((i for i, d in enumerate(docs, 1) if matches_expect(d, case["expect"])), None)
+            if rank:
+                hits += 1
+                rr += 1.0 / rank
+        n = max(1, len(cases))
+        report[name] = {
+            f"hit@{k}": round(hits / n, 3),
+            "mrr": round(rr / n, 3),
+            "ms_mean": round(float(np.mean(ms)) if ms else 0.0, 2),
+            "ms_p95": round(float(np.percentile(ms, 95)) if ms else 0.0, 2),
+        }
+    return report
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from .agent import CONTEXT_HEADER
+from .router import PREFETCH_HEADER
+
+# Bounded per-session conversation memory. Replaying a whole conversation would
+# make the CPU prefill of every turn grow with its length; instead the agent gets
+#
+#   summary    ("system", "Earlier in this conversation: ...") - older turns,
+#              condensed to at most `summary_tokens`
+#   recent     the newest turns verbatim, as many as fit `history_tokens`
+#              (the newest one always; at most `max_turns`)
+#
+# so the history part of the prompt stays roughly constant however long a visitor
+# keeps asking. Turns that fall out of the recent window are folded into the
+# summary by an LLM call that ChatService runs in the background only while no
+# turn is running or waiting, and cancels when one arrives (summarize_request
+# below). Until that has happened, their questions stand in for them
+# (fallback_summary), so "and for a child?" still knows what it follows; with
+# summaries off, or when one fails, that is what they are folded into.
+# Retrieved Pack text is never kept: a turn is the visitor's question and the
+# kiosk's answer, cut at a PACK RETRIEVAL or Retrieved Context block should one
+# have been passed inline or echoed back (strip_retrieval).
+
+DEFAULT_HISTORY_TOKENS = 800
+DEFAULT_SUMMARY_TOKENS = 200
+DEFAULT_MAX_TURNS = 6
+SUMMARY_WORDS = 100
+TRANSCRIPT_ANSWER_CHARS = 600   # per answer, in the summarization request
+
+SUMMARY_PREFIX = "Earlier in this conversation: "
+ASKED_PREFIX = "The visitor also asked: "
+QUESTION_SEP = " / "
+SUMMARIZE_INSTRUCTION = (
+    "Do not call any tools and do not give new advice. Summarize this conversation between a visitor and "
+    "the kiosk in at most {words} words for the kiosk's own memory: who is affected and their situation "
+    "(age, place, symptoms, hazards), what the visitor asked, and the key advice and numbers the kiosk gave. "
+    "Write in the visitor's language. Reply with the summary only."
+)
+
+_RETRIEVAL_RE = re.compile(
+    r"(?:\n*---\n" + re.escape(PREFETCH_HEADER) + "|" + re.escape(CONTEXT_HEADER) + r").*\Z", re.DOTALL,
+)
+
+
+def strip_retrieval(text: str) -> str:
+    """`text` up to a router.format_prefetched() or agent.format_context_block() block, if it has one."""
+    return _RETRIEVAL_RE.sub("", text or "").strip()
+
+
+@dataclass
+class ConversationMemory:
+    """One session's turns: a rolling summary of the older ones + the recent ones verbatim."""
+
+    turns: List[Tuple[str, str]] = field(default_factory=list)   # (question, answer), not yet summarized
+    summary: str = ""
+    summarized: int = 0     # turns folded into `summary` so far
+    version: int = 0        # bumped by every fold, so a stale background summary is dropped
+
+    def __bool__(self) -> bool:
+        return bool(self.turns or self.summary)
+
+    def __len__(self) -> int:
+        return self.summarized + len(self.turns)
+
+    def add(self, question: str, answer: str) -> None:
+        self.turns.append((strip_retrieval(question), strip_retrieval(answer)))
+
+    def split(self, count: Callable[[str], int], history_tokens: int = DEFAULT_HISTORY_TOKENS,
+              max_turns: int = DEFAULT_MAX_TURNS) -> int:
+        """Index into `turns` where the recent window starts (everything before it is for the summary)."""
+        used, start = 0, len(self.turns)
+        for i in range(len(self.turns) - 1, max(-1, len(self.turns) - 1 - max_turns), -1):
+            q, a = self.turns[i]
+            used += count(q) + count(a)
+            if used > history_tokens and start < len(self.turns):
+                break
+            start = i
+        return start
+
+    def chat_history(self, count: Callable[[str], int], history_tokens: int = DEFAULT_HISTORY_TOKENS,
+                     summary_tokens: int = DEFAULT_SUMMARY_TOKENS,
+                     max_turns: int = DEFAULT_MAX_TURNS) -> List[Tuple[str, str]]:
+        """The agent's chat_history: ("system", summary) if any, then the recent turns as human / ai."""
+        start = self.split(count, history_tokens, max_turns)
+        out: List[Tuple[str, str]] = []
+        summary = fallback_summary(self.summary, self.turns[:start], count, summary_tokens)
+        if summary:
+            out.append(("system", SUMMARY_PREFIX + summary))
+        for q, a in self.turns[start:]:
+            out += [("human", q), ("ai", a)]
+        return out
+
+    def fold(self, n: int, summary: str, version: int) -> bool:
+        """Replace the first `n` turns by `summary` (made from them at `version`); False if stale."""
+        if version != self.version or n > len(self.turns):
+            return False
+        del self.turns[:n]
+        self.summary = summary.strip()
+        self.summarized += n
+        self.version += 1
+        return True
+
+
+def fallback_summary(summary: str, older: Sequence[Tuple[str, str]], count: Callable[[str], int],
+                     summary_tokens: int = DEFAULT_SUMMARY_TOKENS) -> str:
+    """The summary so far + the questions of `older` (newest kept), together within summary_tokens."""
+    summary, _, asked_before = summary.partition(ASKED_PREFIX)  # an earlier fallback's questions
+    candidates = [q for q in asked_before.split(QUESTION_SEP) if q.strip()] + [q for q, _ in older]
+    questions: List[str] = []
+    budget = summary_tokens // 2 if summary.strip() else summary_tokens
+    for q in reversed(candidates):
+        budget -= count(q) + 1
+        if budget < 0:
+            break
+        questions.insert(0, q.strip())
+    asked = ASKED_PREFIX + QUESTION_SEP.join(questions) if questions else ""
+    summary = summary.strip()
+    room = summary_tokens - count(asked)
+    if count(summary) > room:
+        from .context_assembly import cut_to_tokens  # numpy; not on the kiosk's import path
+
+        summary = cut_to_tokens(summary, room, count)
+    return f"{summary} {asked}".strip()
+
+
+def summarize_request(summary: str, turns: Sequence[Tuple[str, str]], words: int = SUMMARY_WORDS) -> str:
+    """The message asking the chat model to fold `turns` into `summary`."""
+    lines = [SUMMARIZE_INSTRUCTION.format(words=words), ""]
+    if summary:
+        lines += [f"Summary so far: {summary}", ""]
+    for q, a in turns:
+        answer = a if len(a) <= TRANSCRIPT_ANSWER_CHARS else a[:TRANSCRIPT_ANSWER_CHARS].rsplit(" ", 1)[0] + " …"
+        lines += [f"Visitor: {q}", f"Kiosk: {answer}"]
+    return "\n".join(lines)
+
+
+def clean_summary(text: Optional[str], count: Callable[[str], int],
+                  summary_tokens: int = DEFAULT_SUMMARY_TOKENS) -> str:
+    """The model's reply as a summary: one paragraph, cut to the budget; "" if it gave none."""
+    text = re.sub(r"^\s*(?:summary\s*:\s*)", "", (text or "").strip(), flags=re.IGNORECASE)
+    text = " ".join(text.split())
+    if count(text) > summary_tokens:
+        from .context_assembly import cut_to_tokens
+
+        text = cut_to_tokens(text, summary_tokens, count)
+    return text
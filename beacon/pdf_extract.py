@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .build_cache import BuildCache
+
+# (page_number, text, status, error) — status is "ok", "empty" (no text layer,
+# usually a scanned page) or "error" (pypdf raised while extracting that page)
+PageRow = Tuple[int, str, str, Optional[str]]
+
+DEFAULT_PAGES_PER_TASK = 25
+
+
+def default_workers() -> int:
+    # leave a core for the notebook / Ollama
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+def _clean(txt: str) -> str:
+    return txt.replace("\u00A0", " ").strip()
+
+
+def pdf_page_count(pdf_path: Path) -> int:
+    from pypdf import PdfReader
+
+    return len(PdfReader(str(pdf_path)).pages)
+
+
+def extract_page_range(pdf_path: str, start: int, end: int) -> List[PageRow]:
+    """
+    Extract 1-indexed pages [start, end] from one PDF. Runs inside a worker process.
+    A failing page is reported as an "error" row instead of failing the whole range.
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(pdf_path)
+    rows: List[PageRow] = []
+    for page_num in range(start, end + 1):
+        try:
+            txt = _clean(reader.pages[page_num - 1].extract_text() or "")
+            rows.append((page_num, txt, "ok" if txt else "empty", None))
+        except Exception as e:
+            rows.append((page_num, "", "error", f"{type(e).__name__}: {e}"))
+    return rows
+
+
+def _ranges(pages: Sequence[int], size: int) -> List[Tuple[int, int]]:
+    """Group sorted page numbers into contiguous (start, end) ranges of at most `size` pages."""
+    out: List[Tuple[int, int]] = []
+    for p in sorted(pages):
+        if out and p == out[-1][1] + 1 and p - out[-1][0] < size:
+            out[-1] = (out[-1][0], p)
+        else:
+            out.append((p, p))
+    return out
+
+
+def extract_pdfs(
+    files: Sequence[Tuple[str, Path]],
+    cache: BuildCache,
+    *,
+    max_workers: Optional[int] = None,
+    pages_per_task: int = DEFAULT_PAGES_PER_TASK,
+    log: Callable[[str], None] = print,
+) -> Dict[str, Any]:
+    """
+    Make sure every page of every (file_hash, path) PDF is in the page cache.
+
+    Only pages not already cached are extracted, split into page ranges that are
+    spread across a process pool, and written to the cache as each range finishes
+    (so an interrupted extraction resumes at page granularity). A range whose task
+    failed as a whole is not cached; its file hash is listed under "incomplete".
+
+    Returns a report with timings and per-page "empty"/"error" issues.
+    """
+    t0 = time.perf_counter()
+    tasks: List[Tuple[str, str, int, int]] = []
+    issues: List[Dict[str, Any]] = []
+    seen = set()
+    incomplete = set()  # file hashes with pages that could not be extracted this time
+
+    for file_hash, path in files:
+        if file_hash in seen:
+            continue
+        seen.add(file_hash)
+        n_pages = cache.get_pdf_page_count(file_hash)
+        if n_pages is None:
+            try:
+                n_pages = pdf_page_count(path)
+            except Exception as e:
+                issues.append({"path": str(path), "page": None, "status": "error", "error": f"{type(e).__name__}: {e}"})
+                incomplete.add(file_hash)
+                continue
+            cache.put_pdf_page_count(file_hash, n_pages)
+        missing = sorted(set(range(1, n_pages + 1)) - cache.cached_pages(file_hash))
+        for start, end in _ranges(missing, pages_per_task):
+            tasks.append((file_hash, str(path), start, end))
+
+    pages_extracted = 0
+    if tasks:
+        workers = max_workers or default_workers()
+        log(f"Extracting {sum(e - s + 1 for _, _, s, e in tasks)} PDF pages in {len(tasks)} tasks on {workers} processes …")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(extract_page_range, p, s, e): (h, p, s, e) for h, p, s, e in tasks}
+            for fut in as_completed(futures):
+                file_hash, path, start, end = futures[fut]
+                try:
+                    rows = fut.result()
+                except Exception as e:
+                    # the whole task failed (broken pool, killed worker, ...): nothing is cached,
+                    # so the next build extracts these pages again
+                    issues.append({"path": path, "page": f"{start}-{end}" if end > start else start,
+                                   "status": "error", "error": f"{type(e).__name__}: {e}; retried next build"})
+                    incomplete.add(file_hash)
+                    continue
+                cache.put_pages(file_hash, rows)
+                pages_extracted += len(rows)
+
+    # per-page issues for every requested file, cached or fresh
+    for file_hash, path in dict(files).items():
+        for page, _, status, error in cache.get_pages(file_hash):
+            if status != "ok":
+                issues.append({"path": str(path), "page": page, "status": status, "error": error})
+
+    return {
+        "pdfs": len(seen),
+        "pages_extracted": pages_extracted,
+        "seconds": round(time.perf_counter() - t0, 2),
+        "page_issues": issues,
+        "incomplete": sorted(incomplete),
+    }
+
+
+def format_page_issues(issues: Sequence[Dict[str, Any]], max_pages: int = 12) -> List[str]:
+    """One log line per file, listing empty (scan-only?) and failed pages."""
+    by_path: Dict[str, Dict[str, List[str]]] = {}
+    for it in issues:
+        slot = by_path.setdefault(it["path"], {"empty": [], "error": []})
+        if it["page"] is None:
+            slot["error"].append(f"file ({it['error']})")
+        else:
+            slot[it["status"]].append(str(it["page"]) if it["status"] == "empty" else f"{it['page']} ({it['error']})")
+
+    def _fmt(items: List[str]) -> str:
+        more = f" … +{len(items) - max_pages} more" if len(items) > max_pages else ""
+        return ", ".join(items[:max_pages]) + more
+
+    lines = []
+    for path, slot in by_path.items():
+        parts = []
+        if slot["empty"]:
+            parts.append(f"no text on pages {_fmt(slot['empty'])} (scanned?)")
+        if slot["error"]:
+            parts.append(f"failed on {_fmt(slot['error'])}")
+        lines.append(f"! {path}: " + "; ".join(parts))
+    return lines
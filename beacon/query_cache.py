@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from .build_cache import _pack_vector, _unpack_vector
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_MAX_PERSISTED = 5000
+
+
+def normalize_query(text: str) -> str:
+    """Cache key for a query: surrounding/repeated whitespace does not change the embedding we want."""
+    return " ".join((text or "").split())
+
+
+class QueryEmbeddingCache(Embeddings):
+    """
+    Embeddings wrapper shared by every retrieval tool (text and image stores).
+
+    `embed_query` goes through a bounded in-memory LRU, then an optional SQLite
+    file that survives restarts, and only then the wrapped model. Concurrent
+    misses on the same query wait for a single model call instead of each
+    making their own. `embed_documents` (build-time) passes straight through.
+    """
+
+    def __init__(
+        self,
+        base: Embeddings,
+        model: str,
+        *,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        path: Optional[Path] = None,
+        max_persisted: int = DEFAULT_MAX_PERSISTED,
+    ):
+        self.base = base
+        self.model = model
+        self.max_entries = max_entries
+        self.max_persisted = max_persisted
+        self._lru: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._inflight: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.path = Path(path) if path else None
+        self._conn: Optional[sqlite3.Connection] = None
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS queries (
+                    model     TEXT NOT NULL,
+                    query     TEXT NOT NULL,
+                    vector    BLOB NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (model, query)
+                )
+                """
+            )
+            self._conn.commit()
+
+    # --- persistent layer ---
+    def _disk_get(self, key: str) -> Optional[List[float]]:
+        if self._conn is None:
+            return None
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT vector FROM queries WHERE model = ? AND query = ?", (self.model, key)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE queries SET last_used = ? WHERE model = ? AND query = ?", (time.time(), self.model, key)
+            )
+            self._conn.commit()
+        return _unpack_vector(row[0])
+
+    def _disk_put(self, key: str, vec: List[float]) -> None:
+        if self._conn is None:
+            return
+        with self._db_lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO queries (model, query, vector, last_used) VALUES (?, ?, ?, ?)",
+                (self.model, key, _pack_vector(vec), time.time()),
+            )
+            # keep the file bounded: drop the least recently used rows beyond the cap
+            self._conn.execute(
+                """
+                DELETE FROM queries WHERE rowid IN (
+                    SELECT rowid FROM queries ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_persisted,),
+            )
+            self._conn.commit()
+
+    # --- in-memory layer ---
+    def _remember(self, key: str, vec: List[float]) -> None:
+        # caller holds self._lock
+        self._lru[key] = vec
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    # --- Embeddings interface ---
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        while True:
+            with self._lock:
+                vec = self._lru.get(key)
+                if vec is not None:
+                    self._lru.move_to_end(key)
+                    self.hits += 1
+                    return list(vec)
+                waiter = self._inflight.get(key)
+                if waiter is None:
+                    self._inflight[key] = threading.Event()
+                    break
+            # another thread is embedding this exact query; reuse its result
+            waiter.wait()
+
+        try:
+            vec = self._disk_get(key)
+            if vec is not None:
+                with self._lock:
+                    self.disk_hits += 1
+            else:
+                vec = list(self.base.embed_query(key))
+                with self._lock:
+                    self.misses += 1
+                self._disk_put(key, vec)
+            with self._lock:
+                self._remember(key, vec)
+            return list(vec)
+        finally:
+            with self._lock:
+                self._inflight.pop(key).set()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+
+    # --- bookkeeping ---
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.disk_hits) / total, 3) if total else 0.0,
+                "entries": len(self._lru),
+                "max_entries": self.max_entries,
+            }
+
+    def clear(self) -> None:
+        """Forget every cached query (memory and disk), e.g. after switching embedding models."""
+        with self._lock:
+            self._lru.clear()
+        if self._conn is not None:
+            with self._db_lock:
+                self._conn.execute("DELETE FROM queries")
+                self._conn.commit()
+
+    def close(self) -> None:
+        if self._conn is not None:
+            with self._db_lock:
+                self._conn.close()
+            self._conn = None
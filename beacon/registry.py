@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import math
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from .agent import KnowledgePack, StartupTimer
+
+# Pack registry: several packs (regions) behind one kiosk.
+#
+# Every pack's manifest is parsed once, when the registry is built; a pack's
+# indexes load on its first question (use()) and loaded packs are kept in LRU
+# order. When their estimated size (KnowledgePack.memory_mb) exceeds
+# memory_budget_mb, the least recently used are unloaded: never the home pack
+# (the one the kiosk was started with) and never one a tool is reading. Packs
+# embedding with the same model share one backend (one ONNX session / client).
+#
+# route() sends a question to the pack(s) whose manifest profile it matches:
+# name, topic ids / titles, file ids and the optional
+#
+#   routing:
+#     keywords: [pinellas, florida, clearwater, ...]
+#
+# Terms count by how few packs share them (idf), twice for the pack name and the
+# routing keywords (the places a pack covers), so "hurricane" points at the
+# Florida pack while "first aid", in every pack, decides nothing; Devanagari
+# prefers packs with a "hi" locale. A runner-up within FAN_OUT_RATIO of the best
+# pack gets the question too (chunks merged by context_assembly.assemble_across);
+# a question that matches no pack goes to the home pack.
+
+PACKS_DIR = Path("Knowledge Packs")
+PACK_ALIASES = {
+    "FLORIDA": "Pinellas County Floirda Hurricane Response Kpack",
+    "INDIA": "Bihar India Support Kpack",
+}
+DEFAULT_MEMORY_BUDGET_MB = 1024.0
+FAN_OUT_RATIO = 0.6
+MAX_FAN_OUT = 2
+
+_DEVANAGARI_RE = re.compile(r"[ऀ-ॿ]")
+
+
+def resolve_pack(arg: str) -> Path:
+    """A pack directory, or one of the PACK_ALIASES under 'Knowledge Packs'."""
+    path = Path(arg)
+    if not (path / "manifest.yaml").exists() and arg.upper() in PACK_ALIASES:
+        path = PACKS_DIR / PACK_ALIASES[arg.upper()]
+    if not (path / "manifest.yaml").exists():
+        raise FileNotFoundError(f"no manifest.yaml in {path}")
+    return path
+
+
+def find_pack_dirs(packs_dir: Path = PACKS_DIR) -> List[Path]:
+    """Every directory under `packs_dir` with a manifest.yaml, by name."""
+    return sorted(p.parent for p in Path(packs_dir).glob("*/manifest.yaml"))
+
+
+def _terms(parts: Sequence[Any]) -> List[str]:
+    from .lexical import tokenize  # lexical imports numpy; keep it off the kiosk's import path
+
+    return tokenize(" ".join(str(p).replace("-", " ") for p in parts))
+
+
+def _profile(pack: KnowledgePack) -> Dict[str, float]:
+    """Routing terms of a pack -> weight (2: name / routing keywords, 1: topics and files)."""
+    m = pack.manifest
+    topics = []
+    for topic in m.get("index_of_topics", []) or []:
+        topics += [topic.get("id", ""), topic.get("title", "")]
+        topics += [f.get("id", "") for f in topic.get("core_files", []) or []]
+    profile = dict.fromkeys(_terms(topics), 1.0)
+    keywords = [m.get("name", ""), pack.root.name] + list((m.get("routing", {}) or {}).get("keywords", []) or [])
+    profile.update(dict.fromkeys(_terms(keywords), 2.0))
+    return profile
+
+
+class PackRegistry:
+    """Packs by id (directory name), loaded lazily and evicted LRU under a memory budget."""
+
+    def __init__(
+        self,
+        roots: Sequence[Path],
+        *,
+        home: Optional[Path] = None,
+        memory_budget_mb: float = DEFAULT_MEMORY_BUDGET_MB,
+        backend: str = "ollama",
+        model_dir: Optional[Path] = None,
+        num_threads: Optional[int] = None,
+        keep_alive: Optional[Any] = None,
+        timer: Optional[StartupTimer] = None,
+        log=print,
+    ):
+        self.memory_budget_mb = float(memory_budget_mb)
+        self.log = log
+        self.backend_pool: Dict[Any, Any] = {}
+        self.packs: Dict[str, KnowledgePack] = {}
+        home = Path(home) if home is not None else (Path(roots[0]) if roots else None)
+        self.home = home.name if home is not None else None
+        for root in ([home] if home is not None else []) + [Path(r) for r in roots]:
+            if root.name in self.packs:
+                continue
+            self.packs[root.name] = KnowledgePack(
+                root, backend=backend, model_dir=model_dir, num_threads=num_threads, keep_alive=keep_alive,
+                backend_pool=self.backend_pool,
+                timer=timer if root.name == self.home else StartupTimer(),  # startup report = home pack
+                log=log,
+            )
+        self._lock = threading.Lock()
+        self._lru: "OrderedDict[str, None]" = OrderedDict()
+        self._in_use: Dict[str, int] = {}
+        self._idf: Optional[Dict[str, float]] = None
+        self._profiles: Dict[str, Dict[str, float]] = {}
+        self.loads = 0
+        self.evictions = 0
+
+    @classmethod
+    def discover(cls, packs_dir: Path = PACKS_DIR, **kwargs) -> "PackRegistry":
+        """Every pack under `packs_dir` (home: kwargs["home"], else the first)."""
+        return cls(find_pack_dirs(packs_dir), **kwargs)
+
+    @classmethod
+    def of(cls, pack: KnowledgePack) -> "PackRegistry":
+        """A registry of one already-constructed pack (make_tools(pack))."""
+        reg = cls([])
+        reg.home = pack.root.name
+        reg.packs[reg.home] = pack
+        return reg
+
+    def __len__(self) -> int:
+        return len(self.packs)
+
+    @property
+    def home_pack(self) -> KnowledgePack:
+        return self.packs[self.home]
+
+    def resolve(self, name: str) -> str:
+        """Pack id for an id, an alias (FLORIDA), a manifest name or a pack path; KeyError if none."""
+        wanted = str(name).strip()
+        if wanted.upper() in PACK_ALIASES and PACK_ALIASES[wanted.upper()] in self.packs:
+            return PACK_ALIASES[wanted.upper()]
+        for key, pack in self.packs.items():
+            if wanted.lower() in (key.lower(), str(pack.name).lower(), str(pack.root).lower()):
+                return key
+        if Path(wanted).name in self.packs:
+            return Path(wanted).name
+        raise KeyError(f"unknown pack {name!r}; available: {', '.join(self.ids())}")
+
+    def ids(self) -> List[str]:
+        aliases = {v: k for k, v in PACK_ALIASES.items()}
+        return [aliases.get(key, key) for key in self.packs]
+
+    # --- loading / eviction ---
+    @contextmanager
+    def use(self, name: Optional[str] = None) -> Iterator[KnowledgePack]:
+        """The pack, loaded (first use loads it in this thread); not evicted until the block exits."""
+        key = self.resolve(name) if name else self.home
+        pack = self.packs[key]
+        with self._lock:
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+            self._lru[key] = None
+            self._lru.move_to_end(key)
+        try:
+            if not pack.ready:
+                self.loads += 1
+            pack.wait()
+            self._evict()
+            yield pack
+        finally:
+            with self._lock:
+                self._in_use[key] -= 1
+
+    def _evict(self) -> None:
+        with self._lock:
+            loaded = {k: p.memory_mb() for k, p in self.packs.items() if p.ready}
+            total = sum(loaded.values())
+            for key in list(self._lru):
+                if total <= self.memory_budget_mb:
+                    break
+                if key == self.home or self._in_use.get(key) or key not in loaded:
+                    continue
+                self.packs[key].unload()
+                if not self.packs[key].ready:
+                    del self._lru[key]
+                    total -= loaded[key]
+                    self.evictions += 1
+                    self.log(f"unloaded pack {key} ({loaded[key]:.0f} MB) to stay within "
+                             f"{self.memory_budget_mb:.0f} MB")
+
+    # --- routing ---
+    def _build_profiles(self) -> None:
+        self._profiles = {key: _profile(pack) for key, pack in self.packs.items()}
+        n = len(self._profiles)
+        df: Dict[str, int] = {}
+        for terms in self._profiles.values():
+            for t in terms:
+                df[t] = df.get(t, 0) + 1
+        self._idf = {t: math.log(n / c) for t, c in df.items()}
+
+    def scores(self, query: str) -> Dict[str, float]:
+        if self._idf is None:
+            self._build_profiles()
+        from .lexical import tokenize
+
+        terms = set(tokenize(query))
+        out = {key: sum(self._idf[t] * profile[t] for t in terms & profile.keys())
+               for key, profile in self._profiles.items()}
+        if _DEVANAGARI_RE.search(query or ""):
+            for key, pack in self.packs.items():
+                if any(str(loc).lower().startswith("hi") for loc in pack.manifest.get("locales", []) or []):
+                    out[key] += 1.0
+        return out
+
+    def route(self, query: str, topic_id: Optional[str] = None, locale: Optional[str] = None) -> List[str]:
+        """Pack ids for a question, best first (one unless the runner-up is close; see above)."""
+        if len(self.packs) == 1:
+            return [self.home]
+        candidates = list(self.packs)
+        if topic_id:
+            having = [k for k in candidates if any(t.get("id") == topic_id for t in
+                                                   self.packs[k].manifest.get("index_of_topics", []) or [])]
+            candidates = having or candidates
+        if locale:
+            speaking = [k for k in candidates if any(str(loc).lower().startswith(locale.lower()[:2]) for loc in
+                                                     self.packs[k].manifest.get("locales", []) or [])]
+            candidates = speaking or candidates
+        scores = self.scores(query)
+        ranked = sorted(candidates, key=lambda k: (-scores[k], k != self.home))
+        best = scores[ranked[0]]
+        if best <= 0:
+            return [self.home] if self.home in candidates else ranked[:1]
+        return [k for k in ranked[:MAX_FAN_OUT] if scores[k] >= best * FAN_OUT_RATIO]
+
+    # --- reporting ---
+    def describe(self, key: str) -> Dict[str, Any]:
+        pack = self.packs[key]
+        m = pack.manifest
+        return {
+            "id": self.ids()[list(self.packs).index(key)],
+            "name": m.get("name", key),
+            "version": m.get("version", "unknown"),
+            "date": m.get("date", "unknown"),
+            "locales": m.get("locales", []),
+            "topics": [t.get("id") for t in m.get("index_of_topics", []) or []],
+            "loaded": pack.ready and pack.error is None,
+        }
+
+    def signature(self) -> str:
+        """name@version of every pack, for caches whose answers may come from any of them."""
+        return ",".join(f"{p.manifest.get('name', k)}@{p.manifest.get('version', '')}" for k, p in self.packs.items())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            loaded = {k: p.memory_mb() for k, p in self.packs.items() if p.ready}
+        return {
+            "home": self.home,
+            "packs": self.ids(),
+            "loaded_mb": loaded,
+            "memory_budget_mb": self.memory_budget_mb,
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+# Model residency for the kiosk's models. Without it the first question after
+# boot pays Ollama's cold load of the chat model (tens of seconds on CPU for
+# gpt-oss:20b) and of the embedder, and Ollama unloads both after 5 idle minutes
+# (its default keep_alive), so the next visitor pays it again.
+#
+#   warm-up  at startup every model gets one minimal request, twice: the first is
+#            the cold latency (load + full prefill), the second the warm one. The
+#            chat model is sent the agent's own system prompt + tool schemas
+#            (agent.prompt_warmup), so Ollama's prompt cache holds that fixed
+#            prefix before the first real turn.
+#   keep     every request carries `keep_alive` (-1: resident while the kiosk runs;
+#            a duration such as "2h" is the idle policy: Ollama may unload after
+#            that long without a turn). A watchdog reloads a model Ollama dropped
+#            anyway (restart, eviction by another model) unless the idle policy
+#            allowed it; the next turn after an idle unload re-warms right away.
+#   budget   with `ram_budget_gb`, models are kept resident in order (chat model
+#            first) while their loaded sizes fit; one that does not gets Ollama's
+#            default keep_alive and loads on demand (--backend onnx avoids this
+#            for the embedder).
+# In-process models (the onnx embedder) are warmed but need no residency.
+
+DEFAULT_KEEP_ALIVE = "-1"
+ON_DEMAND_KEEP_ALIVE = "5m"     # Ollama's own default
+DEFAULT_CHECK_INTERVAL = 60.0   # seconds between watchdog checks
+
+_DURATION_RE = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*(ms|s|m|h)?\s*$")
+_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0, None: 1.0}
+
+
+def keep_alive_seconds(value: Any) -> Optional[float]:
+    """Ollama keep_alive -> seconds; None = forever (negative). Bare numbers are seconds, as in Ollama."""
+    m = _DURATION_RE.match(str(value))
+    if not m:
+        raise ValueError(f"bad keep_alive {value!r}; expected e.g. -1, 300, 30m, 2h")
+    seconds = float(m.group(1)) * _UNITS[m.group(2)]
+    return None if seconds < 0 else seconds
+
+
+def _ollama_name(name: str) -> str:
+    return name if ":" in name else name + ":latest"
+
+
+@dataclass
+class ManagedModel:
+    role: str                                   # "llm" | "embeddings"
+    name: str
+    warm: Callable[[], Dict[str, Any]]          # one minimal request; returns Ollama's timings if it has them
+    ollama: bool = True                         # False: in-process, warmed only
+    set_keep_alive: Optional[Callable[[Any], None]] = None
+    pinned: bool = True                         # kept resident (False: over the RAM budget, on demand)
+    resident: Optional[bool] = None             # last seen in Ollama's loaded models
+    size_mb: Optional[float] = None
+    loads: int = 0
+    timings: Dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"name": self.name, "ollama": self.ollama, "pinned": self.pinned, "resident": self.resident,
+                "size_mb": self.size_mb, "loads": self.loads, **self.timings, "error": self.error}
+
+
+def _ns_ms(meta: Dict[str, Any], key: str) -> Optional[float]:
+    v = meta.get(key)
+    return round(v / 1e6, 1) if isinstance(v, (int, float)) else None
+
+
+class ModelResidency:
+    """
+    Warm-up + keep-alive watchdog for the models a Kiosk uses; `state` is
+    "cold" (not started), "warming", "warm", "idle" (unloaded by the idle
+    policy) or "failed" (a warm-up request failed; turns still try the models).
+    """
+
+    def __init__(
+        self,
+        *,
+        keep_alive: Any = DEFAULT_KEEP_ALIVE,
+        ram_budget_gb: Optional[float] = None,
+        check_interval: float = DEFAULT_CHECK_INTERVAL,
+        host: Optional[str] = None,
+        timer=None,
+        log=print,
+    ):
+        self.keep_alive = keep_alive
+        self.idle_s = keep_alive_seconds(keep_alive)
+        self.ram_budget_mb = ram_budget_gb * 1024 if ram_budget_gb else None
+        self.check_interval = check_interval
+        self.host = host
+        self.timer = timer
+        self.log = log
+        self.models: List[ManagedModel] = []
+        self.state = "cold"
+        self.last_activity = time.time()
+        self._client = None
+        self._warm = threading.Event()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, role: str, name: str, warm: Callable[[], Any], *, ollama: bool = True,
+            set_keep_alive: Optional[Callable[[Any], None]] = None) -> "ModelResidency":
+        """Register a model before start(); the chat model first (it is kept resident first)."""
+        self.models.append(ManagedModel(role, name, warm, ollama, set_keep_alive))
+        return self
+
+    # --- lifecycle ---
+    def start(self) -> "ModelResidency":
+        """Warm every model, then watch residency; on a background thread, returns immediately."""
+        if self._thread is None:
+            self.state = "warming"
+            self._thread = threading.Thread(target=self._run, name="beacon-residency", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "warm"
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the first warm-up finished (successfully or not)."""
+        return self._warm.wait(timeout)
+
+    def touch(self) -> None:
+        """A turn started: restarts the idle clock and re-warms models the idle policy let go."""
+        self.last_activity = time.time()
+        if self.state == "idle":
+            self.state = "warming"
+            self._wake.set()
+
+    # --- Ollama ---
+    def client(self):
+        if self._client is None:
+            from ollama import Client
+
+            self._client = Client(host=self.host) if self.host else Client()
+        return self._client
+
+    def loaded(self) -> Dict[str, float]:
+        """Models Ollama has in memory: name -> size in MB."""
+        return {m.model: round((m.size or 0) / 2**20, 1) for m in self.client().ps().models}
+
+    def _refresh(self) -> Dict[str, float]:
+        loaded = self.loaded()
+        for m in self.models:
+            if m.ollama:
+                name = _ollama_name(m.name)
+                m.resident = name in loaded
+                m.size_mb = loaded.get(name, m.size_mb)
+        return loaded
+
+    # --- warm-up ---
+    def _request(self, m: ManagedModel) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        meta = m.warm()
+        meta = meta if isinstance(meta, dict) else {}
+        out = {"ms": round((time.perf_counter() - t0) * 1000, 1)}
+        for key, name in (("load_duration", "load_ms"), ("prompt_eval_duration", "prefill_ms")):
+            if _ns_ms(meta, key) is not None:
+                out[name] = _ns_ms(meta, key)
+        if meta.get("prompt_eval_count") is not None:
+            out["prompt_tokens"] = meta["prompt_eval_count"]
+        return out
+
+    def _warm_model(self, m: ManagedModel, measure_warm: bool = True) -> None:
+        try:
+            cold = self._request(m)
+            m.loads += 1
+            m.timings.update({f"cold_{k}": v for k, v in cold.items()})
+            if measure_warm:
+                warm = self._request(m)
+                m.timings.update({f"warm_{k}": v for k, v in warm.items()})
+            m.error = None
+            what = f"{m.role} {m.name}: cold {cold['ms']:.0f} ms"
+            if measure_warm:
+                what += f", warm {m.timings['warm_ms']:.0f} ms"
+            self.log(what)
+        except Exception as e:
+            m.error = str(e)
+            self.log(f"! warming {m.role} {m.name} failed: {e}")
+
+    def warm_all(self) -> None:
+        self.state = "warming"
+        for m in self.models:
+            if self.timer is not None:
+                with self.timer.phase(f"warm: {m.role}"):
+                    self._warm_model(m)
+            else:
+                self._warm_model(m)
+        self._apply_budget()
+        self.state = "failed" if any(m.error for m in self.models) else "warm"
+        self.last_activity = time.time()
+        if self.timer is not None:
+            self.timer.mark("warm-up done", once=True)
+        self._warm.set()
+
+    def _apply_budget(self) -> None:
+        if not any(m.ollama for m in self.models):
+            return
+        try:
+            self._refresh()
+        except Exception as e:
+            self.log(f"! cannot list Ollama's loaded models: {e}")
+            return
+        if self.ram_budget_mb is None:
+            return
+        used = 0.0
+        for m in self.models:
+            if not m.ollama or m.size_mb is None:
+                continue
+            if used + m.size_mb <= self.ram_budget_mb or m.role == "llm":
+                used += m.size_mb
+                if m.size_mb > self.ram_budget_mb:
+                    self.log(f"! {m.name} ({m.size_mb:.0f} MB) alone exceeds the RAM budget; keeping it anyway")
+                continue
+            m.pinned = False
+            if m.set_keep_alive is not None:
+                m.set_keep_alive(ON_DEMAND_KEEP_ALIVE)
+                try:
+                    m.warm()  # one request with the new keep_alive replaces the pinned one
+                except Exception:
+                    pass
+            self.log(f"{m.name} ({m.size_mb:.0f} MB) does not fit the RAM budget next to the chat model; "
+                     f"it loads on demand")
+
+    # --- watchdog ---
+    def _idle_expired(self) -> bool:
+        return self.idle_s is not None and time.time() - self.last_activity > self.idle_s
+
+    def check(self) -> None:
+        """One watchdog pass: reload pinned models Ollama dropped, or go idle if the policy allows it."""
+        managed = [m for m in self.models if m.ollama and m.pinned]
+        if not managed:
+            return
+        self._refresh()
+        missing = [m for m in managed if not m.resident]
+        if not missing:
+            if self.state == "idle":
+                self.state = "warm"
+            return
+        if self._idle_expired() and self.state != "warming":
+            self.state = "idle"
+            return
+        self.state = "warming"
+        for m in missing:
+            self.log(f"{m.role} {m.name} is no longer loaded; reloading")
+            self._warm_model(m, measure_warm=False)
+        self._refresh()
+        self.state = "failed" if any(m.error for m in missing) else "warm"
+
+    def _run(self) -> None:
+        self.warm_all()
+        while not self._stop.is_set():
+            self._wake.wait(self.check_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.check()
+            except Exception as e:
+                self.log(f"! residency check failed: {e}")
+
+    # --- reporting ---
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "keep_alive": self.keep_alive,
+            "idle_s": round(time.time() - self.last_activity, 1),
+            "ram_budget_mb": self.ram_budget_mb,
+            "models": {m.role: m.stats() for m in self.models},
+        }
+
+    def report(self) -> str:
+        """Cold vs warm latency per model, as a table like StartupTimer.report()."""
+        def ms(v):
+            return f"{v:.0f}" if isinstance(v, (int, float)) else "—"
+
+        lines = [f"{'model':<30} {'cold ms':>9} {'warm ms':>9} {'load ms':>9} {'prefill cold / warm':>21}"]
+        for m in self.models:
+            t = m.timings
+            prefill = f"{ms(t.get('cold_prefill_ms'))} / {ms(t.get('warm_prefill_ms'))}"
+            line = (f"  {m.name[:28]:<28} {ms(t.get('cold_ms')):>9} {ms(t.get('warm_ms')):>9} "
+                    f"{ms(t.get('cold_load_ms')):>9} {prefill:>21}")
+            lines.append(line + (f"   ! {m.error[:60]}" if m.error else ""))
+        return "\n".join(lines)
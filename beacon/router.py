@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+# Deterministic pre-router: decides before the LLM runs whether a turn needs
+# `context` and/or `getImage`, runs those retrievals in parallel and hands the
+# results to the agent with the question. The system prompt requires those calls
+# for nearly every kiosk question, so without this most turns spend one LLM pass
+# only to emit the tool calls; with it they finish in a single pass. The tools
+# stay bound, so the agent can still call them again (other query / topic_id / k).
+#
+# Rules (cheap, offline, in the spirit of score_domain / should_attach_context in
+# "Ideas (old)/kiosk_core_manifest.py"):
+#   context  every question except small talk and plain arithmetic
+#   image    a visual request or a physical technique (system prompt rule 2); the
+#            image matcher's calibrated cosine threshold then decides whether any
+#            picture is close enough (NO_IMAGE is passed on too, so it is not retried)
+# A short follow-up in an ongoing conversation ("and for a child?") is left to the
+# agent: retrieving on its literal text would fetch the wrong chunks.
+
+_SMALLTALK_RE = re.compile(
+    r"^\s*(?:hi|hello|hey|thanks|thank you|thx|ok|okay|bye|good ?bye|good (?:morning|evening|night)|"
+    r"namaste|namaskar|dhanyavad|dhanyawad|shukriya|नमस्ते|धन्यवाद)\b[\s!.?]*$",
+    re.IGNORECASE,
+)
+_MATH_RE = re.compile(
+    r"^\s*(?:what(?:'s| is)\s+)?[-+]?\d+(?:\.\d+)?(?:\s*(?:[-+*/x×÷^]|plus|minus|times|multiplied by|divided by|over)"
+    r"\s*[-+]?\d+(?:\.\d+)?)+\s*[=?]*\s*$",
+    re.IGNORECASE,
+)
+_VISUAL_RE = re.compile(
+    r"\b(?:show|see|diagram|picture|photo|image|map|visual\w*|illustrat\w*|look(?:s)? like|chart|infographic|"
+    r"dikha\w*|dikhao|tasveer|naksha)\b|दिखा|तस्वीर|चित्र|नक्शा",
+    re.IGNORECASE,
+)
+_TECHNIQUE_RE = re.compile(
+    r"\b(?:cpr|heimlich|chok\w*|tourniquet|splint\w*|bandag\w*|sling|recovery position|chest compression\w*|"
+    r"back blows?|immobili[sz]\w*|boil\w* water|wound|dressing)\b",
+    re.IGNORECASE,
+)
+
+PREFETCH_HEADER = "PACK RETRIEVAL (already run for this question; counts as calling these tools)"
+
+
+@dataclass
+class Route:
+    context: bool
+    image: bool
+    reason: str
+
+    @property
+    def prefetch(self) -> bool:
+        return self.context or self.image
+
+
+def route(message: str, has_history: bool = False) -> Route:
+    text = (message or "").strip()
+    if not text:
+        return Route(False, False, "empty")
+    if _SMALLTALK_RE.match(text):
+        return Route(False, False, "small talk")
+    if _MATH_RE.match(text):
+        return Route(False, False, "arithmetic")
+    if has_history and len(text.split()) < 5:
+        return Route(False, False, "short follow-up")
+    visual = bool(_VISUAL_RE.search(text))
+    technique = bool(_TECHNIQUE_RE.search(text))
+    reason = "visual request" if visual else "physical technique" if technique else "pack question"
+    return Route(True, visual or technique, reason)
+
+
+async def prefetch(tools: Dict[str, Any], message: str, r: Route) -> List[Dict[str, Any]]:
+    """Run the routed tools in parallel; [{"tool", "input", "observation"}] in tool order."""
+    calls = []
+    if r.context:
+        calls.append(("context", {"query": message}))
+    if r.image:
+        calls.append(("getImage", {"query": message}))
+    results = await asyncio.gather(*[asyncio.to_thread(tools[name].invoke, args) for name, args in calls])
+    return [{"tool": name, "input": args, "observation": obs} for (name, args), obs in zip(calls, results)]
+
+
+def format_prefetched(results: List[Dict[str, Any]]) -> str:
+    """The block appended to the question: context_block for context, status + citations for getImage."""
+    if not results:
+        return ""
+    lines = ["", "", "---", PREFETCH_HEADER + ":"]
+    for r in results:
+        obs = r["observation"]
+        lines.append(f"{r['tool']}({json.dumps(r['input'], ensure_ascii=False)}) ->")
+        if r["tool"] == "context":
+            lines.append(obs.get("context_block") if obs.get("chunks") else "No relevant chunks found in the Pack.")
+        elif r["tool"] == "getImage":
+            if obs.get("status") == "OK":
+                titles = "; ".join(c.get("title", "") for c in obs.get("citations", []) if isinstance(c, dict))
+                lines.append(f"status OK: an image is shown to the user automatically. Source(s): {titles or '—'}")
+            else:
+                lines.append("status NO_IMAGE: no suitable Pack image; give clear step-by-step text instead.")
+        else:
+            lines.append(json.dumps(obs, ensure_ascii=False, default=str))
+        lines.append("")
+    return "\n".join(lines).rstrip()
+
+
+def llm_calls_saved(prefetched: List[Dict[str, Any]], called: List[str]) -> int:
+    """
+    One LLM pass is saved when prefetching made the tool-calling pass unnecessary,
+    i.e. the agent did not call any of the prefetched tools again itself.
+    """
+    if not prefetched:
+        return 0
+    return 0 if {r["tool"] for r in prefetched} & set(called) else 1
@@ -0,0 +1,763 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import json
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Sequence, Tuple
+
+from .memory import (DEFAULT_HISTORY_TOKENS, DEFAULT_SUMMARY_TOKENS, ConversationMemory, clean_summary,
+                     fallback_summary, summarize_request)
+from .router import format_prefetched, llm_calls_saved, prefetch, route
+from .tracing import Tracer, add_span, span
+
+# HTTP serving layer: one Kiosk shared by many sessions (several people at one
+# kiosk, or a relief centre's terminals against one laptop).
+#
+#   POST   /api/chat             {"message", "session_id"?, "priority"?} -> full answer (JSON)
+#   POST   /api/chat/stream      same body -> text/event-stream of events (see ChatService.stream)
+#   POST   /api/sessions         -> {"session_id"}
+#   DELETE /api/sessions/{id}
+#   GET    /api/health           pack / agent readiness, queue depth, answer-cache hit rate
+#   GET    /metrics              per-stage latency histograms (tracing.py), Prometheus text format
+#
+# Every turn takes an LLM slot from an AdmissionGate: at most `max_concurrent`
+# agent runs at once (Ollama serves one model on one machine), the rest wait in
+# a priority queue so safety-critical questions go first, and a full queue is
+# refused with 503 + Retry-After instead of piling up unbounded tail latency.
+# Repeated first questions are answered from the semantic answer cache
+# (answer_cache.py) without queueing at all. A session's history is bounded by
+# tokens (memory.py): its recent turns verbatim, the older ones as a rolling
+# summary that the LLM writes while the kiosk is idle. The Gradio UI (ui.py) is
+# one more client of the same ChatService.
+
+DEFAULT_MAX_CONCURRENT = 1    # agent runs in flight; raise with OLLAMA_NUM_PARALLEL
+DEFAULT_MAX_QUEUE = 16        # waiting turns before new ones are refused
+DEFAULT_QUEUE_TIMEOUT = 180.0  # seconds a turn may wait for a slot
+DEFAULT_MAX_SESSIONS = 256
+DEFAULT_SESSION_TTL = 3600.0  # idle seconds before a session is forgotten
+DEFAULT_HISTORY_TURNS = 6     # at most this many (user, assistant) pairs verbatim, within history_tokens
+SUMMARY_IDLE_S = 2.0          # idle seconds before a background summary starts
+
+PRIORITIES = {"urgent": 0, "normal": 1, "low": 2}
+
+# Safety-critical wording (English, romanized Hindi, Devanagari): these jump the queue.
+_URGENT_RE = re.compile(
+    r"\b(?:bleed\w*|blood|unconscious|not breathing|can'?t breathe|chok\w*|cpr|heart attack|chest pain|"
+    r"stroke|seizure|drown\w*|snake\w*|bite|bitten|poison\w*|overdose|burn\w*|electrocut\w*|"
+    r"trapped|fire|flood\w*|evacuat\w*|emergency|labou?r pain|pregnan\w*|tourniquet|"
+    r"saap|saanp|khoon|behosh|zeher|jahar|aag)\b"
+    r"|साँप|सांप|खून|बेहोश|ज़हर|जहर|आग|सांस",
+    re.IGNORECASE,
+)
+
+
+def classify_priority(message: str) -> int:
+    """PRIORITIES["urgent"] for safety-critical questions, else "normal"."""
+    return PRIORITIES["urgent"] if _URGENT_RE.search(message or "") else PRIORITIES["normal"]
+
+
+def resolve_priority(priority: Any, message: str) -> int:
+    """Explicit priority ("urgent" / "normal" / "low" or 0-2) wins over the keyword classifier."""
+    if priority is None:
+        return classify_priority(message)
+    if isinstance(priority, str):
+        if priority not in PRIORITIES:
+            raise ValueError(f"unknown priority {priority!r}; expected one of {', '.join(PRIORITIES)}")
+        return PRIORITIES[priority]
+    return min(max(int(priority), 0), max(PRIORITIES.values()))
+
+
+# ----------------------------
+# Admission control
+# ----------------------------
+
+class QueueFull(Exception):
+    """The admission queue is at max_queue; retry later."""
+
+
+class QueueTimeout(Exception):
+    """A turn waited longer than queue_timeout for an LLM slot."""
+
+
+class AdmissionGate:
+    """
+    Bounded LLM concurrency with a priority queue (lower number first, FIFO
+    within a priority). Runs on one event loop; not thread-safe.
+    """
+
+    def __init__(self, max_concurrent: int = DEFAULT_MAX_CONCURRENT, max_queue: int = DEFAULT_MAX_QUEUE,
+                 queue_timeout: Optional[float] = DEFAULT_QUEUE_TIMEOUT):
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be >= 1")
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self._heap: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_ms: Deque[float] = deque(maxlen=1024)
+
+    def _waiting(self) -> List[Tuple[int, int, asyncio.Future]]:
+        return [e for e in self._heap if not e[2].done()]
+
+    @property
+    def depth(self) -> int:
+        return len(self._waiting())
+
+    def position(self, priority: int) -> int:
+        """Turns a new request at `priority` would wait behind (0 = admitted at once)."""
+        ahead = sum(1 for p, _, _ in self._waiting() if p <= priority)
+        return ahead + (1 if self.running >= self.max_concurrent else 0)
+
+    def full(self) -> bool:
+        return self.running >= self.max_concurrent and self.depth >= self.max_queue
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITIES["normal"]):
+        """Hold one LLM slot for the block; raises QueueFull / QueueTimeout."""
+        t0 = time.perf_counter()
+        if self.running < self.max_concurrent and not self._waiting():
+            self.running += 1
+        else:
+            if self.depth >= self.max_queue:
+                self.rejected += 1
+                raise QueueFull(f"{self.depth} turns already waiting")
+            fut = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._heap, (priority, next(self._seq), fut))
+            try:
+                await asyncio.wait_for(asyncio.shield(fut), self.queue_timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if fut.done() and not fut.cancelled():
+                    self._release()  # granted just as we gave up: pass the slot on
+                else:
+                    fut.cancel()
+                if isinstance(e, asyncio.TimeoutError):
+                    self.timed_out += 1
+                    raise QueueTimeout(f"no LLM slot within {self.queue_timeout:.0f}s") from None
+                raise
+        wait = (time.perf_counter() - t0) * 1000
+        self.admitted += 1
+        self.wait_ms.append(wait)
+        try:
+            yield wait
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        while self._heap:
+            _, _, fut = heapq.heappop(self._heap)
+            if not fut.done():
+                fut.set_result(None)  # the slot passes straight to the next waiter
+                return
+        self.running -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        from .bench import latency_summary
+
+        by_priority = {name: 0 for name in PRIORITIES}
+        names = {v: k for k, v in PRIORITIES.items()}
+        for p, _, _ in self._waiting():
+            by_priority[names.get(p, "low")] += 1
+        return {
+            "running": self.running,
+            "max_concurrent": self.max_concurrent,
+            "queued": sum(by_priority.values()),
+            "queued_by_priority": by_priority,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait_ms": latency_summary(list(self.wait_ms)),
+        }
+
+
+# ----------------------------
+# Sessions
+# ----------------------------
+
+@dataclass
+class Session:
+    id: str
+    memory: ConversationMemory = field(default_factory=ConversationMemory)
+    created: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+    turns: int = 0
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)  # one turn at a time per session
+
+
+class SessionStore:
+    """Bounded LRU of sessions; idle ones expire after `ttl` seconds. Busy ones are never dropped."""
+
+    def __init__(self, max_sessions: int = DEFAULT_MAX_SESSIONS, ttl: float = DEFAULT_SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def _expire(self, keep: Optional[str] = None) -> None:
+        cutoff = time.time() - self.ttl
+        for sid in [s.id for s in self._sessions.values() if s.last_used < cutoff and not s.lock.locked()]:
+            del self._sessions[sid]
+        # over the cap: drop the least recently used sessions, never one with a turn in flight
+        # (its turn would write into an orphan while a new Session with that id ran beside it)
+        excess = len(self._sessions) - self.max_sessions
+        if excess > 0:
+            idle = [s.id for s in self._sessions.values() if not s.lock.locked() and s.id != keep][:excess]
+            for sid in idle:
+                del self._sessions[sid]
+
+    def get(self, session_id: Optional[str] = None) -> Session:
+        """The session with this id (created if unknown or expired); a new one for None."""
+        sid = session_id or uuid.uuid4().hex
+        session = self._sessions.get(sid)
+        if session is None:
+            session = self._sessions[sid] = Session(sid)
+        self._sessions.move_to_end(sid)
+        session.last_used = time.time()
+        self._expire(keep=sid)
+        return session
+
+    def drop(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+
+# ----------------------------
+# Chat service
+# ----------------------------
+
+class ChatService:
+    """
+    Sessions + admission control in front of one Kiosk; shared by the HTTP API and the Gradio UI.
+
+    With `answer_cache` (answer_cache.py), a session's first question is looked
+    up by embedding before it queues for the LLM, and every answered first
+    question is stored. Follow-ups are never cached: their answer depends on the
+    conversation so far. Every turn is traced through `tracer` (tracing.py).
+
+    The agent sees at most `history_tokens` of recent turns and a `summary_tokens`
+    summary of the rest (memory.py). With `summarize`, turns that leave the recent
+    window are summarized by the chat model one session at a time, only after
+    SUMMARY_IDLE_S with no turn running or waiting; a new turn cancels the request.
+    Without it (or when it fails) their questions are kept as the summary instead.
+    """
+
+    def __init__(
+        self,
+        kiosk,
+        *,
+        max_concurrent: int = DEFAULT_MAX_CONCURRENT,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        queue_timeout: Optional[float] = DEFAULT_QUEUE_TIMEOUT,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+        session_ttl: float = DEFAULT_SESSION_TTL,
+        history_turns: int = DEFAULT_HISTORY_TURNS,
+        history_tokens: int = DEFAULT_HISTORY_TOKENS,
+        summary_tokens: int = DEFAULT_SUMMARY_TOKENS,
+        summarize: bool = True,
+        answer_cache: bool = True,
+        prefetch: bool = True,
+        tracer: Optional[Tracer] = None,
+    ):
+        self.kiosk = kiosk
+        self.tracer = tracer or Tracer(trace_dir=None)  # metrics only; the CLI also writes the trace log
+        self.gate = AdmissionGate(max_concurrent, max_queue, queue_timeout)
+        self.sessions = SessionStore(max_sessions, session_ttl)
+        self.history_turns = history_turns
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.use_summaries = summarize
+        self._summarizer = None
+        self._to_summarize: "OrderedDict[str, Session]" = OrderedDict()
+        self._summary_worker: Optional[asyncio.Task] = None
+        self._summary_call: Optional[asyncio.Future] = None
+        self._active = 0                        # turns in _turn()
+        self._last_active = time.monotonic()
+        self.memory = {"summaries": 0, "preempted": 0, "failed": 0, "extractive": 0}
+        self.use_answer_cache = answer_cache
+        self._answer_cache = None
+        self._cache_lock = threading.Lock()
+        self.use_prefetch = prefetch
+        self.routing = {"turns": 0, "prefetched": 0, "llm_calls": 0, "llm_calls_saved": 0}
+        self.latency: Dict[str, Deque[float]] = {"ttft_ms": deque(maxlen=1024), "ms": deque(maxlen=1024)}  # agent turns
+
+    # --- answer cache ---
+    def answer_cache(self):
+        """The pack's AnswerCache (opened once the pack is loaded), or None when disabled / unavailable."""
+        if not self.use_answer_cache:
+            return None
+        with self._cache_lock:
+            if self._answer_cache is None:
+                from .answer_cache import AnswerCache
+
+                pack = self.kiosk.pack.wait()
+                registry = self.kiosk.registry
+                self._answer_cache = AnswerCache.for_pack(
+                    pack.root, pack.manifest, self.kiosk.llm, pack.emb.model,
+                    packs=registry.signature() if len(registry) > 1 else "",
+                )
+            return self._answer_cache
+
+    def _cache_lookup(self, message: str):
+        """(cache, query vector, hit or None), run off the event loop."""
+        cache = self.answer_cache()
+        vector = self.kiosk.pack.emb.embed_query(message)  # shared query cache: the tools reuse it
+        return cache, vector, cache.lookup(message, vector)
+
+    async def stream(self, message: str, session_id: Optional[str] = None,
+                     priority: Any = None, prewarm: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """
+        One turn as events:
+          {"type": "session", "session_id", "priority"}
+          {"type": "warming", "state"}                 models still loading (residency.py): a slower answer
+          {"type": "cached", "query", "similarity"}    answer cache hit: no queue, no LLM run
+          {"type": "route", "context", "image", "reason"}   pre-router decision (router.py)
+          {"type": "tool", "tool", "observation", "prefetched": True}   prefetched retrieval
+          {"type": "queued", "position", "depth"}      only if the turn has to wait
+          {"type": "admitted", "queue_ms"}
+          {"type": "tool", "tool", "observation"}      each tool result the agent asked for, as it returns
+          {"type": "token", "text"}                    the answer as it is generated
+          {"type": "retract"}                          drop the tokens so far: that LLM pass called tools
+          {"type": "answer", "text"}                   the whole answer (also after tokens)
+          {"type": "done", "ms", "ttft_ms", "queue_ms", "cached", "llm_calls", "llm_calls_saved"}
+          {"type": "error", "error", "status"}         QueueFull or a session still busy after queue_timeout (503), QueueTimeout (504), agent errors (500)
+        `ttft_ms` is time to the first answer token (to the answer, for a cache hit), like `ms` from the request.
+        Each turn is one trace (tracing.py): its stages, and how it ended. A `prewarm`
+        turn (FAQ answered into the cache, not a visitor's) is traced with prewarm=True
+        and left out of the /metrics histograms and the router / latency stats.
+        """
+        trace = self.tracer.start(chars=len(message), **({"prewarm": True} if prewarm else {}))
+        outcome: Dict[str, Any] = {}
+        self._active += 1
+        if self._summary_call is not None:
+            self._summary_call.cancel()  # the visitor comes first; the summary is redone when idle
+        try:
+            async for event in self._turn(message, session_id, priority, prewarm):
+                kind = event["type"]
+                if kind == "session":
+                    outcome.update(session=event["session_id"], priority=event["priority"])
+                elif kind == "route":
+                    outcome["route"] = event["reason"]
+                elif kind in ("done", "error"):
+                    outcome.update({k: v for k, v in event.items() if k != "type"})
+                yield event
+        finally:
+            self._active -= 1
+            self._last_active = time.monotonic()
+            self.tracer.finish(trace, **outcome)
+
+    async def _turn(self, message: str, session_id: Optional[str], priority: Any,
+                    prewarm: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        t0 = time.perf_counter()
+        prio = resolve_priority(priority, message)
+        session = self.sessions.get(session_id)
+        yield {"type": "session", "session_id": session.id, "priority": prio}
+        residency = self.kiosk.residency
+        residency.touch()
+        if residency.models and residency.state in ("warming", "idle"):
+            yield {"type": "warming", "state": residency.state}
+
+        # one turn at a time per session, waiting no longer than for an LLM slot
+        try:
+            await asyncio.wait_for(session.lock.acquire(), self.gate.queue_timeout)
+        except asyncio.TimeoutError:
+            yield {"type": "error", "error": "kiosk busy: this session's previous turn is still running",
+                   "status": 503}
+            return
+        try:
+            cache = vector = None
+            if self.use_answer_cache and not session.memory:
+                try:
+                    with span("cache.lookup") as attrs:
+                        cache, vector, hit = await asyncio.to_thread(self._cache_lookup, message)
+                        attrs["hit"] = hit is not None
+                except Exception:
+                    hit = None  # a pack that failed to load surfaces through the agent's tools below
+                if hit is not None:
+                    yield {"type": "cached", "query": hit.query, "similarity": round(hit.similarity, 4)}
+                    for t in hit.tools:
+                        yield {"type": "tool", "tool": t["tool"], "observation": t["observation"]}
+                    yield {"type": "answer", "text": hit.answer}
+                    self._remember(session, message, hit.answer)
+                    ms = round((time.perf_counter() - t0) * 1000, 1)
+                    yield {"type": "done", "ms": ms, "ttft_ms": ms,
+                           "queue_ms": 0.0, "cached": True, "llm_calls": 0, "llm_calls_saved": 0}
+                    return
+
+            # pre-route: run context / getImage now (while queued) so the agent needs one LLM pass
+            tools: List[Dict[str, Any]] = []
+            prefetched: List[Dict[str, Any]] = []
+            if self.use_prefetch:
+                r = route(message, has_history=bool(session.memory))
+                yield {"type": "route", "context": r.context, "image": r.image, "reason": r.reason}
+                if r.prefetch:
+                    try:
+                        await asyncio.to_thread(self.kiosk.executor)  # tools exist once the agent is built
+                        with span("prefetch", context=r.context, image=r.image):
+                            prefetched = await prefetch(self.kiosk.tools, message, r)
+                    except Exception as e:
+                        self.kiosk.log(f"! prefetch failed, falling back to tool calls: {e}")
+                for p in prefetched:
+                    tools.append({"tool": p["tool"], "observation": p["observation"]})
+                    yield {"type": "tool", "tool": p["tool"], "observation": p["observation"], "prefetched": True}
+
+            position = self.gate.position(prio)
+            if position and not self.gate.full():
+                yield {"type": "queued", "position": position, "depth": self.gate.depth}
+            called: List[str] = []
+            llm_calls = 0
+            ttft_ms = None
+            try:
+                async with self.gate.slot(prio) as queue_ms:
+                    add_span("queue", queue_ms)
+                    yield {"type": "admitted", "queue_ms": round(queue_ms, 1)}
+                    t_run = time.perf_counter()
+                    answer = None
+                    streamed = False  # tokens of the current LLM pass were sent
+                    history = session.memory.chat_history(self.count, self.history_tokens, self.summary_tokens,
+                                                          self.history_turns)
+                    async for chunk in self.kiosk.astream(message, chat_history=history,
+                                                          prefetched=format_prefetched(prefetched)):
+                        if "token" in chunk:
+                            if ttft_ms is None:
+                                ttft_ms = round((time.perf_counter() - t0) * 1000, 1)
+                            streamed = True
+                            yield {"type": "token", "text": chunk["token"]}
+                        elif "llm_end" in chunk:
+                            llm_calls += 1
+                            if chunk["llm_end"]:  # this pass produced tool calls, not the answer
+                                called += chunk["llm_end"]
+                                if streamed:
+                                    ttft_ms = None
+                                    yield {"type": "retract"}
+                            streamed = False
+                        elif "tool" in chunk:
+                            obs = chunk["observation"]
+                            if isinstance(obs, dict):
+                                tools.append({"tool": chunk["tool"], "observation": obs})
+                                yield {"type": "tool", "tool": chunk["tool"], "observation": obs}
+                        elif "output" in chunk:
+                            answer = chunk["output"]
+                            yield {"type": "answer", "text": answer}
+                    run_ms = (time.perf_counter() - t_run) * 1000
+            except QueueFull as e:
+                yield {"type": "error", "error": f"kiosk busy: {e}", "status": 503}
+                return
+            except QueueTimeout as e:
+                yield {"type": "error", "error": f"kiosk busy: {e}", "status": 504}
+                return
+            except Exception as e:
+                yield {"type": "error", "error": str(e), "status": 500}
+                return
+
+            if answer:
+                # never cache a retrieval miss: the pack may simply not cover it (yet)
+                missed = any(t["tool"] == "context" and not t["observation"].get("chunks") for t in tools)
+                if cache is not None and vector is not None and not missed:
+                    await asyncio.to_thread(cache.put, message, vector, answer, tools, run_ms)
+                self._remember(session, message, answer)
+        finally:
+            session.lock.release()
+        saved = llm_calls_saved(prefetched, called)
+        ms = round((time.perf_counter() - t0) * 1000, 1)
+        ttft_ms = ttft_ms if ttft_ms is not None else ms  # nothing streamed: the answer came whole
+        if not prewarm:
+            self.routing["turns"] += 1
+            self.routing["prefetched"] += bool(prefetched)
+            self.routing["llm_calls"] += llm_calls
+            self.routing["llm_calls_saved"] += saved
+            self.latency["ms"].append(ms)
+            self.latency["ttft_ms"].append(ttft_ms)
+        yield {"type": "done", "ms": ms, "ttft_ms": ttft_ms, "queue_ms": round(queue_ms, 1),
+               "cached": False, "llm_calls": llm_calls, "llm_calls_saved": saved}
+
+    def _remember(self, session: Session, message: str, answer: str) -> None:
+        session.turns += 1
+        session.memory.add(message, answer)
+        if self._summary_job(session) is None:
+            return
+        if not self.use_summaries:
+            self._fold_extractive(session)
+            return
+        self._to_summarize[session.id] = session
+        if self._summary_worker is None or self._summary_worker.done():
+            self._summary_worker = asyncio.create_task(self._summarize_when_idle())
+
+    # --- conversation memory ---
+    def count(self, text: str) -> int:
+        """Tokens of `text` for the chat model (tokens.py; the counter the tools use)."""
+        from .tokens import token_counter
+
+        return token_counter(self.kiosk.llm, self.kiosk.tokenizer, log=self.kiosk.log).count(text)
+
+    def _summary_job(self, session: Session) -> Optional[Tuple[int, str, int]]:
+        """(turns to fold, summarization request, memory version), or None while all turns fit."""
+        memory = session.memory
+        n = memory.split(self.count, self.history_tokens, self.history_turns)
+        if not n:
+            return None
+        return n, summarize_request(memory.summary, memory.turns[:n]), memory.version
+
+    def _fold_extractive(self, session: Session) -> None:
+        memory = session.memory
+        n = memory.split(self.count, self.history_tokens, self.history_turns)
+        memory.fold(n, fallback_summary(memory.summary, memory.turns[:n], self.count, self.summary_tokens),
+                    memory.version)
+        self.memory["extractive"] += 1
+
+    def summarizer(self):
+        """agent.prompt_summarizer() for the kiosk's chat model and tools, built on first use."""
+        if self._summarizer is None:
+            from .agent import prompt_summarizer
+
+            k = self.kiosk
+            self._summarizer = prompt_summarizer(list(k.tools.values()), k.llm, k.temperature, k.keep_alive)
+        return self._summarizer
+
+    async def _summarize_when_idle(self, poll_s: float = 0.5) -> None:
+        """Fold the sessions in _to_summarize, oldest request first, whenever the kiosk is idle."""
+        while self._to_summarize:
+            while self._active or self.gate.running or self.gate.depth \
+                    or time.monotonic() - self._last_active < SUMMARY_IDLE_S:
+                await asyncio.sleep(poll_s)
+            sid, session = next(iter(self._to_summarize.items()))
+            job = self._summary_job(session) if sid in self.sessions else None
+            if job is None:
+                del self._to_summarize[sid]
+                continue
+            n, request, version = job
+            call = self._summary_call = asyncio.ensure_future(self.summarizer()(request))
+            try:
+                await asyncio.wait({call})
+            finally:
+                call.cancel()
+                self._summary_call = None
+            if call.cancelled():
+                self.memory["preempted"] += 1
+                continue
+            summary = "" if call.exception() else clean_summary(call.result(), self.count, self.summary_tokens)
+            if not summary:
+                self.kiosk.log(f"! conversation summary failed ({call.exception() or 'empty reply'}); "
+                               f"keeping the questions instead")
+                self.memory["failed"] += 1
+                self._fold_extractive(session)
+            elif session.memory.fold(n, summary, version):
+                self.memory["summaries"] += 1
+
+    def memory_stats(self) -> Dict[str, Any]:
+        """History budgets and how older turns were folded so far."""
+        return dict(self.memory, history_tokens=self.history_tokens, summary_tokens=self.summary_tokens,
+                    pending=len(self._to_summarize))
+
+    async def answer(self, message: str, session_id: Optional[str] = None, priority: Any = None,
+                     prewarm: bool = False) -> Dict[str, Any]:
+        """
+        Collect one turn: {"session_id", "answer", "tools", "cached", "queue_ms", "ms",
+        "llm_calls", "llm_calls_saved"} or {"error", "status"}.
+        """
+        out: Dict[str, Any] = {"answer": None, "tools": []}
+        async for event in self.stream(message, session_id, priority, prewarm=prewarm):
+            kind = event["type"]
+            if kind == "session":
+                out["session_id"] = event["session_id"]
+            elif kind == "tool":
+                out["tools"].append({"tool": event["tool"], "observation": event["observation"]})
+            elif kind == "answer":
+                out["answer"] = event["text"]
+            elif kind == "done":
+                out.update({k: v for k, v in event.items() if k != "type"})
+            elif kind == "error":
+                out.update(error=event["error"], status=event["status"])
+        return out
+
+    async def prewarm(self, questions: Optional[Sequence[str]] = None, poll_s: float = 1.0) -> Dict[str, int]:
+        """
+        Answer FAQ questions (default: the manifest's answer_cache.faq) into the
+        answer cache, one at a time and only while no user turn is running or waiting.
+        """
+        await asyncio.to_thread(self.kiosk.wait_ready)
+        cache = await asyncio.to_thread(self.answer_cache)
+        if cache is None:
+            return {"warmed": 0, "skipped": 0, "failed": 0}
+        if questions is None:
+            questions = (self.kiosk.pack.manifest.get("answer_cache", {}) or {}).get("faq", []) or []
+        out = {"warmed": 0, "skipped": 0, "failed": 0}
+        for q in questions:
+            if q in cache:
+                out["skipped"] += 1
+                continue
+            while self.gate.running or self.gate.depth:
+                await asyncio.sleep(poll_s)
+            session = self.sessions.get()
+            try:
+                result = await self.answer(q, session.id, "low", prewarm=True)
+            finally:
+                self.sessions.drop(session.id)
+            if result.get("answer") and not result.get("cached"):
+                out["warmed"] += 1
+            elif result.get("cached"):
+                out["skipped"] += 1
+            else:
+                out["failed"] += 1
+        return out
+
+    def health(self) -> Dict[str, Any]:
+        pack = self.kiosk.pack
+        return {
+            "pack": pack.name,
+            "indexes_ready": pack.ready and pack.error is None,
+            "agent_ready": self.kiosk.agent_ready,
+            "models": self.kiosk.residency.stats(),
+            "packs": self.kiosk.registry.stats(),
+            "sessions": len(self.sessions),
+            "queue": self.gate.stats(),
+            "answer_cache": self._answer_cache.stats() if self._answer_cache is not None else None,
+            "router": self.router_stats(),
+            "latency": self.latency_stats(),
+            "memory": self.memory_stats(),
+        }
+
+    def gauges(self) -> Dict[str, float]:
+        """Current values for /metrics, next to the trace histograms."""
+        gate = self.gate.stats()
+        out = {
+            "beacon_turns_running": gate["running"],
+            "beacon_turns_queued": gate["queued"],
+            "beacon_turns_admitted_total": gate["admitted"],
+            "beacon_turns_rejected_total": gate["rejected"],
+            "beacon_turns_timed_out_total": gate["timed_out"],
+            "beacon_sessions": len(self.sessions),
+            "beacon_llm_calls_saved_total": self.routing["llm_calls_saved"],
+            "beacon_models_warm": float(self.kiosk.residency.state == "warm"),
+        }
+        if self._answer_cache is not None:
+            cache = self._answer_cache.stats()
+            out.update(beacon_answer_cache_lookups_total=cache["lookups"], beacon_answer_cache_hits_total=cache["hits"])
+        return out
+
+    def latency_stats(self) -> Dict[str, Any]:
+        """Time to first answer token and to the whole answer over recent agent turns (not cache hits)."""
+        from .bench import latency_summary
+
+        return {name: latency_summary(list(values)) for name, values in self.latency.items()}
+
+    def router_stats(self) -> Dict[str, Any]:
+        """Agent turns, how many were prefetched, and LLM passes used / saved per turn."""
+        r, turns = self.routing, self.routing["turns"]
+        return dict(r, llm_calls_per_turn=round(r["llm_calls"] / turns, 2) if turns else 0.0,
+                    llm_calls_saved_per_turn=round(r["llm_calls_saved"] / turns, 2) if turns else 0.0)
+
+
+# ----------------------------
+# FastAPI app
+# ----------------------------
+
+MEDIA_URL = "/media"  # image derivatives (assets.py); not /assets, which is gradio's own
+
+
+def create_app(service: ChatService, ui: bool = True, prewarm: bool = True):
+    """
+    FastAPI app serving the API under /api, pack image derivatives under /media
+    and (with `ui`) the Gradio chat UI at /.
+    Busy answers (full queue) are 503 + Retry-After; a stream reports them as an
+    "error" event, since an answer-cache hit needs no queue slot at all.
+    """
+    from fastapi import Body, FastAPI, HTTPException
+    from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+
+    from .assets import MEDIA_TYPES, media_file
+
+    @asynccontextmanager
+    async def lifespan(_app):
+        # fill the answer cache from the manifest FAQ while nobody is using the kiosk
+        task = asyncio.create_task(service.prewarm()) if prewarm and service.use_answer_cache else None
+        yield
+        if task is not None:
+            task.cancel()
+
+    app = FastAPI(title="Beacon", docs_url="/api/docs", openapi_url="/api/openapi.json", lifespan=lifespan)
+
+    def _retry_after() -> str:
+        return str(max(1, int(service.gate.stats()["wait_ms"].get("p50", 1000) / 1000)))
+
+    def _body(body: Dict[str, Any]) -> Tuple[str, Optional[str], Any]:
+        message = (body.get("message") or "").strip()
+        if not message:
+            raise HTTPException(422, "message is required")
+        try:
+            resolve_priority(body.get("priority"), message)
+        except (TypeError, ValueError) as e:
+            raise HTTPException(422, str(e))
+        return message, body.get("session_id"), body.get("priority")
+
+    @app.post("/api/sessions")
+    async def new_session():
+        return {"session_id": service.sessions.get().id}
+
+    @app.delete("/api/sessions/{session_id}")
+    async def drop_session(session_id: str):
+        if not service.sessions.drop(session_id):
+            raise HTTPException(404, "unknown session")
+        return {"session_id": session_id, "dropped": True}
+
+    @app.post("/api/chat")
+    async def chat(body: Dict[str, Any] = Body(...)):
+        message, session_id, priority = _body(body)
+        out = await service.answer(message, session_id, priority)
+        if "error" in out:
+            headers = {"Retry-After": _retry_after()} if out["status"] == 503 else None
+            return JSONResponse(out, status_code=out["status"], headers=headers)
+        return out
+
+    @app.post("/api/chat/stream")
+    async def chat_stream(body: Dict[str, Any] = Body(...)):
+        message, session_id, priority = _body(body)
+
+        async def events():
+            async for event in service.stream(message, session_id, priority):
+                yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    @app.get("/api/health")
+    async def health():
+        return service.health()
+
+    @app.get("/metrics")
+    async def metrics():
+        # Prometheus text format; scraped locally or saved with curl, the kiosk has no uplink
+        return PlainTextResponse(service.tracer.metrics.render(service.gauges()),
+                                 media_type="text/plain; version=0.0.4")
+
+    @app.get(MEDIA_URL + "/{name}")
+    async def media(name: str):
+        # content-hashed names (assets.py): a new image is a new URL, so browsers never need to revalidate
+        path = media_file([p.root for p in service.kiosk.registry.packs.values()], name)
+        if path is None:
+            raise HTTPException(404, "unknown media file")
+        return FileResponse(path, media_type=MEDIA_TYPES[path.suffix[1:]],
+                            headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+    if ui:
+        import gradio as gr
+
+        from .ui import build_ui
+
+        app = gr.mount_gradio_app(app, build_ui(service, media_url=MEDIA_URL), path="/")
+    return app
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Token counting for prompt budgets (context assembly), with the chat model's
+# own tokenizer whenever one is available, tried in this order:
+#   tokenizer.json  an explicit file (--tokenizer / BEACON_TOKENIZER) loaded with
+#                   `tokenizers`, e.g. the tokenizer.json of openai/gpt-oss-20b
+#   tiktoken        the encoding of a known model family (gpt-oss -> o200k_harmony);
+#                   an offline kiosk needs the BPE file in TIKTOKEN_CACHE_DIR
+#   estimate        ~4 chars per token, ~2 for non-Latin
+#                   script; `exact` is False so callers can report it
+# Counters are built once per (llm, tokenizer) and shared by every tool.
+#
+# Chunking (chunking.py) counts with the embedding model's tokenizer instead
+# (embedding_token_counter): an explicit tokenizer.json (BEACON_EMBED_TOKENIZER),
+# else the ONNX backend's own. A pack build refuses to chunk by the estimate
+# (ingest.build_text_index); only the stand-in benchmark build accepts it.
+
+TOKENIZER_ENV = "BEACON_TOKENIZER"
+EMBED_TOKENIZER_ENV = "BEACON_EMBED_TOKENIZER"
+TIKTOKEN_ENCODINGS: Dict[str, Tuple[str, ...]] = {
+    # family substring of the --llm id -> encodings to try (harmony adds only special tokens)
+    "gpt-oss": ("o200k_harmony", "o200k_base"),
+    "gpt-4o": ("o200k_base",),
+}
+CHARS_PER_TOKEN = 4
+
+
+class TokenCounter:
+    """`count(text)` -> tokens; `name` says which tokenizer, `exact` whether it is the model's own."""
+
+    def __init__(self, name: str, encode: Optional[Callable[[str], int]] = None):
+        self.name = name
+        self.exact = encode is not None
+        self._encode = encode
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encode is not None:
+            return self._encode(text)
+        return estimate_tokens(text)
+
+    def __repr__(self) -> str:
+        return f"TokenCounter({self.name!r}, exact={self.exact})"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough count for when no tokenizer is installed; errs high on Devanagari / emoji."""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    other = len(text) - ascii_chars
+    return max(1, -(-ascii_chars // CHARS_PER_TOKEN) + -(-other // 2))
+
+
+def _untruncated(tok):
+    # a copy that counts every token: tokenizer.json files (and OnnxBackend's) may
+    # truncate to the model's max length, which would under-count long texts
+    from tokenizers import Tokenizer
+
+    tok = Tokenizer.from_str(tok.to_str())
+    tok.no_truncation()
+    tok.no_padding()
+    return tok
+
+
+def _from_tokenizers(name: str, tok) -> TokenCounter:
+    tok = _untruncated(tok)
+    return TokenCounter(name, lambda text: len(tok.encode(text, add_special_tokens=False).ids))
+
+
+def _from_tokenizer_json(path: Path) -> TokenCounter:
+    from tokenizers import Tokenizer
+
+    return _from_tokenizers(f"tokenizers:{path.name}", Tokenizer.from_file(str(path)))
+
+
+def _from_tiktoken(encoding: str) -> TokenCounter:
+    import tiktoken
+
+    enc = tiktoken.get_encoding(encoding)
+    return TokenCounter(f"tiktoken:{encoding}", lambda text: len(enc.encode(text, disallowed_special=())))
+
+
+_COUNTERS: Dict[Tuple[str, str], TokenCounter] = {}
+_LOCK = threading.Lock()
+
+
+def token_counter(llm: str = "", tokenizer: Optional[Path] = None, log=print) -> TokenCounter:
+    """The best available counter for chat model `llm` (see the order above); cached per arguments."""
+    tokenizer = tokenizer or os.environ.get(TOKENIZER_ENV) or None
+    key = (llm, str(tokenizer or ""))
+    with _LOCK:
+        if key in _COUNTERS:
+            return _COUNTERS[key]
+
+        counter = None
+        if tokenizer:
+            try:
+                counter = _from_tokenizer_json(Path(tokenizer))
+            except Exception as e:
+                log(f"! tokenizer {tokenizer} not usable ({e}); trying the next option")
+        if counter is None:
+            for family, encodings in TIKTOKEN_ENCODINGS.items():
+                if family not in llm:
+                    continue
+                for encoding in encodings:
+                    try:
+                        counter = _from_tiktoken(encoding)
+                        break
+                    except Exception as e:
+                        log(f"! tiktoken {encoding} not usable ({e})")
+                break
+        if counter is None:
+            counter = TokenCounter("estimate")
+            log(f"context token counts for {llm or 'the chat model'} are estimates "
+                f"(set --tokenizer to its tokenizer.json for exact counts)")
+        _COUNTERS[key] = counter
+        return counter
+
+
+def embedding_token_counter(backend: Any = None, tokenizer: Optional[Path] = None, log=print) -> TokenCounter:
+    """
+    Tokens as embedding `backend` sees them (see the order above); cached per model
+    and tokenizer. Without a tokenizer the counter is the estimate (`exact` False).
+    """
+    tokenizer = tokenizer or os.environ.get(EMBED_TOKENIZER_ENV) or None
+    model = getattr(backend, "model", "")
+    key = (f"embed:{model}", str(tokenizer or ""))
+    with _LOCK:
+        if key in _COUNTERS:
+            return _COUNTERS[key]
+
+        counter = None
+        if tokenizer:
+            try:
+                counter = _from_tokenizer_json(Path(tokenizer))
+            except Exception as e:
+                log(f"! embedding tokenizer {tokenizer} not usable ({e}); trying the next option")
+        own = getattr(backend, "tokenizer", None)  # OnnxBackend: the model's tokenizer.json, already loaded
+        if counter is None and own is not None:
+            counter = _from_tokenizers(f"tokenizers:{model}", own)
+        if counter is None:
+            counter = TokenCounter("estimate")
+        _COUNTERS[key] = counter
+        return counter
@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import argparse
+import contextvars
+import glob
+import json
+import logging
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+# Per-turn latency tracing, offline. A turn (ChatService.stream) opens a Trace;
+# code on its path records spans into it, also from the worker threads tools
+# run on (asyncio.to_thread and LangChain copy the context):
+#
+#   cache.lookup   answer-cache embedding + lookup     queue        wait for an LLM slot
+#   prefetch       pre-routed retrieval (router.py)    tool.<name>  one tool run
+#   text.embed     query embedding                     text.vector  FAISS search
+#   text.bm25      BM25 search                         text.assemble  dedup / MMR / packing
+#   image.match    getImage caption match              ui.render    building the chat messages
+#   llm            one chat-model pass; Ollama's prompt / output token counts and
+#                  prefill / decode tokens per second when it reports them
+#
+# (the stage names bench.py uses for the same steps). A finished trace is one
+# JSON line in a rotating log (logs/traces.jsonl, 10 MB x 5 by default) and is
+# added to in-process histograms that /metrics serves in the Prometheus text
+# format, so a kiosk with no connectivity can be read afterwards:
+#
+#   python -m beacon.tracing logs/traces.jsonl      # p50 / p95 per stage
+#
+# Without an open trace (notebook, bench) span() only costs a context lookup.
+# Turns the kiosk runs itself (FAQ prewarm) are logged with "prewarm": true and
+# kept out of the histograms and the summary, which measure visitors' turns.
+
+DEFAULT_TRACE_DIR = Path("logs")
+TRACE_FILE = "traces.jsonl"
+MAX_BYTES = 10 * 2**20
+BACKUPS = 5
+BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+TOKENS_PER_S_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+_current: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("beacon_trace", default=None)
+
+
+class Trace:
+    """Spans of one turn: [{"name", "start_ms", "ms", **attrs}], start relative to the turn."""
+
+    def __init__(self, **attrs: Any):
+        self.id = uuid.uuid4().hex[:16]
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.attrs: Dict[str, Any] = dict(attrs)
+        self.spans: List[Dict[str, Any]] = []
+        self._token = None
+
+    def add(self, name: str, ms: float, start: Optional[float] = None, **attrs: Any) -> None:
+        """A span measured by the caller; `start` is its time.perf_counter() start (default: now - ms)."""
+        start = start if start is not None else time.perf_counter() - ms / 1000
+        self.spans.append({"name": name, "start_ms": round((start - self._t0) * 1000, 1),
+                           "ms": round(ms, 2), **attrs})  # list.append: safe from tool threads
+
+    def record(self) -> Dict[str, Any]:
+        return {"trace_id": self.id, "ts": round(self.started, 3),
+                "ms": round((time.perf_counter() - self._t0) * 1000, 1), **self.attrs, "spans": self.spans}
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """Time the block into the current trace (if any); the yielded dict takes more attributes."""
+    trace = _current.get()
+    if trace is None:
+        yield attrs
+        return
+    t0 = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        trace.add(name, (time.perf_counter() - t0) * 1000, start=t0, **attrs)
+
+
+def add_span(name: str, ms: float, start: Optional[float] = None, **attrs: Any) -> None:
+    """Trace.add on the current trace, if any."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, ms, start=start, **attrs)
+
+
+def llm_span_attrs(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Token counts and prefill / decode tokens per second from Ollama's response metadata."""
+    out: Dict[str, Any] = {}
+    for key, count_key, dur_key in (("prefill", "prompt_eval_count", "prompt_eval_duration"),
+                                    ("decode", "eval_count", "eval_duration")):
+        count, dur = metadata.get(count_key), metadata.get(dur_key)
+        if isinstance(count, (int, float)):
+            out[f"{key}_tokens"] = int(count)
+            if isinstance(dur, (int, float)) and dur > 0:
+                out[f"{key}_tok_s"] = round(count / (dur / 1e9), 1)
+    if isinstance(metadata.get("load_duration"), (int, float)):
+        out["load_ms"] = round(metadata["load_duration"] / 1e6, 1)
+    return out
+
+
+# ----------------------------
+# Metrics (Prometheus text format)
+# ----------------------------
+
+class _Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for i, b in enumerate(self.buckets):
+            if value <= b:
+                self.counts[i] += 1
+
+    def lines(self, name: str, labels: str) -> List[str]:
+        sep = "," if labels else ""
+        out = [f'{name}_bucket{{{labels}{sep}le="{b:g}"}} {c}' for b, c in zip(self.buckets, self.counts)]
+        out.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        out.append(f"{name}_sum{{{labels}}} {self.sum:.6g}")
+        out.append(f"{name}_count{{{labels}}} {self.count}")
+        return out
+
+
+class Metrics:
+    """Histograms of finished traces: stage seconds, turn / first-token seconds, LLM tokens per second."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: Dict[str, _Histogram] = {}
+        self.turns: Dict[str, _Histogram] = {}
+        self.tok_s: Dict[str, _Histogram] = {}
+
+    def observe(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            for s in record["spans"]:
+                self.stages.setdefault(s["name"], _Histogram(BUCKETS_S)).observe(s["ms"] / 1000)
+                for phase in ("prefill", "decode"):
+                    if f"{phase}_tok_s" in s:
+                        self.tok_s.setdefault(phase, _Histogram(TOKENS_PER_S_BUCKETS)).observe(s[f"{phase}_tok_s"])
+            for key in ("ms", "ttft_ms"):
+                if isinstance(record.get(key), (int, float)):
+                    self.turns.setdefault(key, _Histogram(BUCKETS_S)).observe(record[key] / 1000)
+
+    def render(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        """The /metrics body; `gauges` are current values (queue depth, sessions, ...) by metric name."""
+        with self._lock:
+            lines = ["# HELP beacon_stage_seconds Time spent in one stage of a chat turn.",
+                     "# TYPE beacon_stage_seconds histogram"]
+            for name, h in sorted(self.stages.items()):
+                lines += h.lines("beacon_stage_seconds", f'stage="{name}"')
+            lines += ["# HELP beacon_turn_seconds Whole agent turns (ms) and time to the first answer token (ttft_ms).",
+                      "# TYPE beacon_turn_seconds histogram"]
+            for name, h in sorted(self.turns.items()):
+                lines += h.lines("beacon_turn_seconds", f'measure="{name}"')
+            lines += ["# HELP beacon_llm_tokens_per_second Chat-model throughput per pass, as Ollama reports it.",
+                      "# TYPE beacon_llm_tokens_per_second histogram"]
+            for name, h in sorted(self.tok_s.items()):
+                lines += h.lines("beacon_llm_tokens_per_second", f'phase="{name}"')
+        for name, value in (gauges or {}).items():
+            lines += [f"# TYPE {name} gauge", f"{name} {value:g}"]
+        return "\n".join(lines) + "\n"
+
+
+# ----------------------------
+# Tracer
+# ----------------------------
+
+class Tracer:
+    """Opens a Trace per turn; finished ones go to the rotating JSONL log (None: metrics only)."""
+
+    def __init__(self, trace_dir: Optional[Path] = DEFAULT_TRACE_DIR, max_bytes: int = MAX_BYTES,
+                 backups: int = BACKUPS):
+        self.metrics = Metrics()
+        self.path = Path(trace_dir) / TRACE_FILE if trace_dir is not None else None
+        self._log = None
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            handler = RotatingFileHandler(self.path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._log = logging.getLogger(f"beacon.traces.{id(self)}")
+            self._log.propagate = False
+            self._log.setLevel(logging.INFO)
+            self._log.addHandler(handler)
+
+    def start(self, **attrs: Any) -> Trace:
+        """A new trace, current for this task (and the threads it hands work to) until finish()."""
+        trace = Trace(**attrs)
+        trace._token = _current.set(trace)
+        return trace
+
+    def finish(self, trace: Trace, **attrs: Any) -> Dict[str, Any]:
+        trace.attrs.update(attrs)
+        try:
+            _current.reset(trace._token)
+        except ValueError:  # finished from another context (e.g. a closed stream's cleanup)
+            _current.set(None)
+        record = trace.record()
+        if not record.get("prewarm"):
+            self.metrics.observe(record)
+        if self._log is not None:
+            self._log.info(json.dumps(record, ensure_ascii=False, default=str))
+        return record
+
+
+# ----------------------------
+# Summary CLI
+# ----------------------------
+
+def read_traces(paths: Sequence[Path]) -> List[Dict[str, Any]]:
+    """Trace records from JSONL files; a directory means its traces.jsonl and rotated backups."""
+    files: List[str] = []
+    for p in paths:
+        p = Path(p)
+        files += sorted(glob.glob(str(p / (TRACE_FILE + "*")))) if p.is_dir() else [str(p)]
+    out = []
+    for f in files:
+        with open(f, "r", encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    out.append(json.loads(line))
+                except ValueError:
+                    continue  # a line cut off by a power loss
+    return out
+
+
+def summarize(records: Sequence[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """latency_summary per stage (ms), plus "turn" and "ttft" over whole turns."""
+    from .bench import latency_summary
+
+    ms: Dict[str, List[float]] = {}
+    for r in records:
+        if isinstance(r.get("ms"), (int, float)):
+            ms.setdefault("turn", []).append(r["ms"])
+        if isinstance(r.get("ttft_ms"), (int, float)):
+            ms.setdefault("ttft", []).append(r["ttft_ms"])
+        for s in r.get("spans", []):
+            ms.setdefault(s["name"], []).append(s["ms"])
+            for phase in ("prefill", "decode"):
+                if f"{phase}_tok_s" in s:
+                    ms.setdefault(f"llm {phase} tok/s", []).append(s[f"{phase}_tok_s"])
+    return {name: latency_summary(values) for name, values in ms.items()}
+
+
+def format_summary(summary: Dict[str, Dict[str, float]], n_turns: int) -> str:
+    lines = [f"{n_turns} turns", f"{'stage':<20} {'n':>6} {'p50':>10} {'p95':>10} {'mean':>10}   (ms; tok/s rows: tokens/s)"]
+    for name, s in sorted(summary.items(), key=lambda kv: -kv[1].get("p50", 0)):
+        lines.append(f"  {name:<18} {s['n']:>6} {s.get('p50', 0):>10.1f} {s.get('p95', 0):>10.1f} {s.get('mean', 0):>10.1f}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m beacon.tracing",
+        description="p50 / p95 per stage from the kiosk's trace log",
+    )
+    parser.add_argument("paths", nargs="*", type=Path, default=[DEFAULT_TRACE_DIR],
+                        help=f"trace files or directories (default: {DEFAULT_TRACE_DIR}/, rotated files included)")
+    parser.add_argument("--since", type=float, help="only turns in the last this many hours")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args(argv)
+
+    records = read_traces(args.paths)
+    if args.since is not None:
+        cutoff = time.time() - args.since * 3600
+        records = [r for r in records if r.get("ts", 0) >= cutoff]
+    records = [r for r in records if not r.get("prewarm")]
+    if not records:
+        print("no traces found", file=sys.stderr)
+        return 1
+    summary = summarize(records)
+    print(json.dumps(summary, indent=2) if args.json else format_summary(summary, len(records)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
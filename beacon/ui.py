@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from .assets import CHAT_WIDTH, find_derivatives, image_html, pick
+from .tracing import span
+
+# Gradio chat UI: a client of the ChatService (server.py), so its turns share the
+# HTTP API's sessions, priority queue and LLM concurrency limit. gradio is
+# imported inside the functions that need it, so importing this module costs
+# nothing until the UI is built.
+
+AVATAR = Path(__file__).resolve().parent.parent / "Beacon Media Assets" / "avatar.png"
+TOKEN_REDRAW_S = 0.08  # min seconds between chat redraws while the answer streams
+
+
+# --- citations: (title, url, license) ---
+def format_sources_md(obs: Dict[str, Any]) -> str:
+    if not isinstance(obs, dict):
+        return ""
+    collected: List[Dict[str, Any]] = []
+
+    # top-level citations (e.g., getImage)
+    top = obs.get("citations")
+    if isinstance(top, list):
+        for c in top:
+            if isinstance(c, dict):
+                collected.append(c)
+
+    # chunk-level citations (e.g., context)
+    chunks = obs.get("chunks")
+    if isinstance(chunks, list):
+        for ch in chunks:
+            if not isinstance(ch, dict):
+                continue
+            ch_cites = ch.get("citations")
+            if isinstance(ch_cites, list):
+                for c in ch_cites:
+                    if isinstance(c, dict):
+                        collected.append(c)
+
+    seen = set()
+    lines: List[str] = []
+    for c in collected:
+        title = (c.get("title") or c.get("id") or "Source").strip()
+        url   = (c.get("url") or "").strip()
+        lic   = (c.get("license") or "—").strip()
+        key = (url or title).lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        if url:
+            lines.append(f"- [{title}]({url}) · {lic}")
+        else:
+            lines.append(f"- {title} · {lic}")
+
+    return "**Sources**\n" + "\n".join(lines) if lines else ""
+
+
+def image_message(obs, media_url=None):
+    """
+    ChatMessage showing the image a tool returned, or None. Pack images with
+    derivatives (assets.py) are shown at chat size: as a srcset served from
+    `media_url` when the HTTP app serves them, else as the chat-size JPEG.
+    """
+    if not isinstance(obs, dict):
+        return None
+    path = (
+        obs.get("image_path")
+        or obs.get("path")
+        or obs.get("file_path")
+        or obs.get("local_path")
+        or None
+    )
+    url = obs.get("image_url") or obs.get("url")
+    media = path or url
+    if not media:
+        return None
+    import gradio as gr
+
+    found = find_derivatives(path) if path else None
+    if found is not None:
+        cache, entry = found
+        if media_url:
+            alt = "; ".join(c.get("title", "") for c in obs.get("citations", []) if isinstance(c, dict))
+            return gr.ChatMessage(role="assistant", content=image_html(entry, media_url, alt))
+        media = str(cache.file(pick(entry, CHAT_WIDTH, "jpg")["file"]))
+    return gr.ChatMessage(role="assistant", content=gr.Image(value=media))
+
+
+def chat_handler(service, media_url=None):
+    """Async streaming handler for gr.Chatbot(type="messages"); one ChatService session per browser tab."""
+    import gradio as gr
+    from gradio import ChatMessage
+
+    async def interact_with_langchain_agent(user_text, history, request: gr.Request):
+        """
+        Streams a conversation turn:
+          - append user msg
+          - show ⏳ placeholder (warming up / queue position if the kiosk is busy)
+          - stream agent tool results (image + Sources only) as each tool returns
+          - stream the answer token by token (redrawn at most every TOKEN_REDRAW_S)
+        Robust to exceptions; will surface errors in-chat and close cleanly.
+        """
+        # 1) user message
+        history.append(ChatMessage(role="user", content=user_text))
+        yield history
+
+        # 2) thinking placeholder
+        thinking_msg = ChatMessage(role="assistant", content="⏳ Thinking...")
+        history.append(thinking_msg)
+        yield history
+
+        def _drop_placeholder():
+            if thinking_msg in history:
+                history.remove(thinking_msg)
+
+        draft = None       # the assistant message the answer streams into
+        last_redraw = 0.0
+
+        try:
+            # 3) stream the turn through the service (queue, then agent)
+            session_id = getattr(request, "session_hash", None) if request is not None else None
+            async for event in service.stream(user_text, session_id=session_id):
+                kind = event["type"]
+
+                if kind == "warming":
+                    thinking_msg.content = "⏳ Warming up the models (the first answer takes longer)..."
+                    yield history
+
+                elif kind == "queued":
+                    thinking_msg.content = f"⏳ Waiting for the kiosk ({event['position']} ahead)..."
+                    yield history
+
+                # show ONLY user-facing results from tools
+                elif kind == "tool":
+                    _drop_placeholder()
+                    obs = event["observation"]
+
+                    # image (and sources), timed into the turn's trace
+                    with span("ui.render", tool=event["tool"]):
+                        img_msg = image_message(obs, media_url)
+                        sources_md = format_sources_md(obs)
+                    if img_msg is not None:
+                        history.append(img_msg)
+                        yield history
+
+                    # sources
+                    if sources_md:
+                        history.append(ChatMessage(role="assistant", content=sources_md))
+                        yield history
+
+                elif kind == "token":
+                    _drop_placeholder()
+                    if draft is None:
+                        draft = ChatMessage(role="assistant", content="")
+                        history.append(draft)
+                    draft.content += event["text"]
+                    # every token re-renders the chat; a slow tablet keeps up with a few redraws a second
+                    if time.monotonic() - last_redraw >= TOKEN_REDRAW_S:
+                        last_redraw = time.monotonic()
+                        yield history
+
+                elif kind == "retract":
+                    # that text came with tool calls; the answer is still to come
+                    if draft in history:
+                        history.remove(draft)
+                    draft = None
+                    history.append(thinking_msg)
+                    yield history
+
+                # final assistant output (the whole text, also after streamed tokens)
+                elif kind == "answer":
+                    _drop_placeholder()
+                    if draft is None:
+                        history.append(ChatMessage(role="assistant", content=event["text"]))
+                    else:
+                        draft.content = event["text"]
+                    yield history
+
+                elif kind == "error":
+                    _drop_placeholder()
+                    history.append(ChatMessage(role="assistant", content=f"⚠️ Error: {event['error']}"))
+                    yield history
+
+            # finished normally — ensure placeholder is gone
+            _drop_placeholder()
+            yield history
+
+        except Exception as e:
+            # surface the real error so you can see it instead of a vague aclose warning
+            _drop_placeholder()
+            history.append(ChatMessage(role="assistant", content=f"⚠️ Error: {e}"))
+            yield history
+
+        finally:
+            # give Gradio a tick to close the async generator cleanly
+            await asyncio.sleep(0)
+
+    return interact_with_langchain_agent
+
+
+def status_md(service) -> str:
+    """One status line: warming up until the pack, agent and models are ready."""
+    kiosk = service.kiosk
+    state = kiosk.residency.state if kiosk.residency.models else "warm"
+    if not (kiosk.pack.ready and kiosk.agent_ready) or state in ("cold", "warming"):
+        return "⏳ *Warming up the models — the first answer may take a minute.*"
+    if state == "idle":
+        return "💤 *Models unloaded after idle time; the next answer re-loads them.*"
+    return "✅ *Ready.*"
+
+
+def build_ui(service, media_url=None):
+    """
+    gr.Blocks chat app over a ChatService; answers stream once the pack and agent are ready.
+    `media_url`: where the app serves image derivatives (server.create_app); None when launched alone.
+    """
+    import gradio as gr
+
+    with gr.Blocks(title="Beacon") as demo:
+        gr.Markdown("# Beacon - Knowledge Agent " + service.kiosk.pack.name)
+        status = gr.Markdown(status_md(service))
+        gr.Timer(2.0).tick(lambda: status_md(service), outputs=[status], queue=False)
+
+        chatbot = gr.Chatbot(
+            type="messages",
+            label="Agent",
+            avatar_images=(None, str(AVATAR) if AVATAR.exists() else None),
+            height=650,
+        )
+        textbox = gr.Textbox(lines=1, label="Chat Message", placeholder="Ask something…")
+
+        # Clear the textbox after submit so it feels chatty
+        def _clear_now(_msg, _chat):
+            return gr.update(value="")
+
+        # streaming submit; concurrency is bounded by the service's AdmissionGate,
+        # not by gradio's queue (which would serve one tab at a time, in arrival order)
+        textbox.submit(
+            chat_handler(service, media_url),
+            inputs=[textbox, chatbot],
+            outputs=[chatbot],
+            concurrency_limit=None,
+        )
+
+        # instant clear
+        textbox.submit(
+            _clear_now,
+            inputs=[textbox, chatbot],
+            outputs=[textbox],
+            queue=False,
+        )
+    return demo
@@ -0,0 +1,353 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Binary vector pack written next to meta.json:
+#   vectors.npy                   (n, dim) float32/float16 matrix, row i == FAISS id i (np.load(mmap_mode="r"))
+#   faiss_index/docstore.sqlite   text + metadata per row, resolved lazily (see docstore.py)
+VECTORS_FILE = "vectors.npy"
+DOCSTORE_FILE = "docstore.sqlite"
+
+
+def pack_paths(root: Path, idx_cfg: Dict[str, Any]) -> Dict[str, Path]:
+    """Resolve vector-pack file paths from a manifest `precomputed_indices.<kind>` block."""
+    root = Path(root)
+    base = (root / idx_cfg["meta"]).parent
+    faiss_cfg = idx_cfg["faiss"]
+    vectors = root / idx_cfg["vectors"] if idx_cfg.get("vectors") else base / VECTORS_FILE
+    docstore = root / faiss_cfg["docstore"] if faiss_cfg.get("docstore") else root / faiss_cfg["dir"] / DOCSTORE_FILE
+    return {"vectors": vectors, "index": root / faiss_cfg["index"], "docstore": docstore}
+
+
+# ----------------------------
+# Writing
+# ----------------------------
+
+def write_vector_pack(
+    vectors_path: Path,
+    docstore_path: Path,
+    ids: Sequence[str],
+    texts: Sequence[str],
+    metadatas: Sequence[Dict[str, Any]],
+    vectors: Any,
+    dtype: str = "float32",
+) -> Dict[str, Any]:
+    """Write vectors.npy + docstore.sqlite. Returns a summary for meta.json."""
+    from .docstore import write_docstore
+
+    if dtype not in ("float32", "float16"):
+        raise ValueError(f"dtype must be float32 or float16, got {dtype!r}")
+    mat = np.ascontiguousarray(np.asarray(vectors, dtype=dtype))
+    if mat.ndim != 2 or mat.shape[0] != len(ids):
+        raise ValueError(f"vectors shape {mat.shape} does not match {len(ids)} records")
+
+    vectors_path = Path(vectors_path)
+    vectors_path.parent.mkdir(parents=True, exist_ok=True)
+    np.save(vectors_path, mat)
+    write_docstore(docstore_path, ids, texts, metadatas)
+
+    return {
+        "file": vectors_path.name,
+        "docstore": Path(docstore_path).name,
+        "dtype": dtype,
+        "count": int(mat.shape[0]),
+        "dim": int(mat.shape[1]),
+    }
+
+
+def export_jsonl(docstore, vectors: np.ndarray, jsonl_path: Path) -> None:
+    """Write the legacy embeddings.jsonl ({"id", "embedding", "metadata", "text"} per line)."""
+    with open(jsonl_path, "w", encoding="utf-8") as f:
+        for i, doc in enumerate(docstore):
+            out = {"id": doc.id, "embedding": vectors[i].astype(np.float32).tolist(),
+                   "metadata": doc.metadata, "text": doc.page_content}
+            f.write(json.dumps(out, ensure_ascii=False) + "\n")
+
+
+def convert_jsonl(jsonl_path: Path, vectors_path: Path, docstore_path: Path, dtype: str = "float32") -> Dict[str, Any]:
+    """One-off migration of an existing embeddings.jsonl into the binary vector pack."""
+    ids, texts, metadatas, vecs = [], [], [], []
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            r = json.loads(line)
+            ids.append(r["id"])
+            texts.append(r.get("text", ""))
+            metadatas.append(r.get("metadata", {}))
+            vecs.append(r["embedding"])
+    return write_vector_pack(vectors_path, docstore_path, ids, texts, metadatas, vecs, dtype=dtype)
+
+
+# ----------------------------
+# Loading
+# ----------------------------
+
+def load_vectors(vectors_path: Path, mmap: bool = True) -> np.ndarray:
+    """Memory-map (default) the (n, dim) vector matrix; nothing is parsed or copied."""
+    return np.load(vectors_path, mmap_mode="r" if mmap else None)
+
+
+# ----------------------------
+# Index types
+# ----------------------------
+# Chosen per pack in the manifest (precomputed_indices.<kind>.faiss.type, default "flat"):
+#   flat      exact L2 (LangChain's FAISS default)            4 bytes / dim / vector
+#   sq8       int8 scalar quantization                         1 byte  / dim / vector
+#   pq        product quantization, pq_m sub-vectors x 8 bits  pq_m bytes / vector
+#   ivf_flat / ivf_sq8 / ivf_pq   the same behind an IVF coarse quantizer (nlist lists,
+#             nprobe searched) so a query scans only part of a large pack
+INDEX_TYPES = ("flat", "sq8", "pq", "ivf_flat", "ivf_sq8", "ivf_pq")
+
+
+def index_spec(idx_cfg: Dict[str, Any], index_type: Optional[str] = None) -> Dict[str, Any]:
+    """Index type + parameters from a `precomputed_indices.<kind>` block (optionally overridden)."""
+    faiss_cfg = idx_cfg.get("faiss", {}) or {}
+    spec = {
+        "type": index_type or faiss_cfg.get("type", "flat"),
+        "nlist": faiss_cfg.get("nlist"),
+        "nprobe": faiss_cfg.get("nprobe", 8),
+        "pq_m": faiss_cfg.get("pq_m", 32),
+    }
+    if spec["type"] not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type {spec['type']!r}; expected one of {INDEX_TYPES}")
+    return spec
+
+
+def _pq_params(dim: int, n: int, m: int) -> Tuple[int, int]:
+    # pq_m must divide dim; each sub-quantizer's k-means wants ~39 vectors per centroid,
+    # so small packs get fewer bits per code (never more centroids than vectors)
+    while dim % m:
+        m -= 1
+    nbits = min(8, max(4, int(np.log2(max(n / 39, 1)))))
+    nbits = min(nbits, int(np.log2(max(n, 2))))
+    return m, nbits
+
+
+def build_index(vectors: np.ndarray, spec: Optional[Dict[str, Any]] = None, log=print):
+    """Build (and train, for quantized/IVF types) a FAISS index over the vector matrix."""
+    import faiss
+
+    spec = spec or {"type": "flat"}
+    mat = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = mat.shape
+    kind = spec["type"]
+    if kind == "flat":
+        index = faiss.IndexFlatL2(dim)
+        index.add(mat)
+        return index
+
+    codec = kind.split("_", 1)[-1]
+    if codec == "sq8":
+        factory = "SQ8"
+    elif codec == "pq":
+        m, nbits = _pq_params(dim, n, int(spec.get("pq_m") or 32))
+        if n < 39 * 2 ** nbits:
+            log(f"! {n} vectors is small for PQ{m}x{nbits} training; expect lower recall than sq8")
+        factory = f"PQ{m}x{nbits}"
+    else:
+        factory = "Flat"
+    if kind.startswith("ivf_"):
+        nlist = int(spec.get("nlist") or max(1, 4 * int(np.sqrt(n))))
+        nlist = max(1, min(nlist, n))
+        if n < 39 * nlist:
+            log(f"! {n} vectors is small for IVF{nlist}; a flat or sq8 index is likely better for this pack")
+        factory = f"IVF{nlist},{factory}"
+
+    index = faiss.index_factory(dim, factory, faiss.METRIC_L2)
+    index.train(mat)
+    index.add(mat)
+    if kind.startswith("ivf_"):
+        faiss.extract_index_ivf(index).nprobe = int(spec.get("nprobe") or 8)
+    return index
+
+
+def build_flat_index(vectors: np.ndarray):
+    """Exact L2 index (LangChain's FAISS default) straight from the mapped matrix."""
+    return build_index(vectors, {"type": "flat"})
+
+
+def index_kind(index) -> str:
+    """Which INDEX_TYPES entry a loaded FAISS index is."""
+    import faiss
+
+    index = faiss.downcast_index(index)
+    for cls, kind in (
+        (faiss.IndexIVFPQ, "ivf_pq"), (faiss.IndexIVFScalarQuantizer, "ivf_sq8"), (faiss.IndexIVFFlat, "ivf_flat"),
+        (faiss.IndexPQ, "pq"), (faiss.IndexScalarQuantizer, "sq8"), (faiss.IndexFlat, "flat"),
+    ):
+        if isinstance(index, cls):
+            return kind
+    return type(index).__name__
+
+
+def _index_params(index) -> Dict[str, Any]:
+    # the parameters actually baked into the index (after _pq_params / nlist clamping)
+    import faiss
+
+    index = faiss.downcast_index(index)
+    params: Dict[str, Any] = {}
+    if isinstance(index, faiss.IndexIVF):
+        params.update(nlist=int(index.nlist), nprobe=int(index.nprobe))
+    pq = getattr(index, "pq", None)
+    if pq is not None:
+        params.update(pq_m=int(pq.M), pq_bits=int(pq.nbits))
+    return params
+
+
+def _neighbors(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    import faiss
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    return exact.search(np.ascontiguousarray(queries, dtype=np.float32), k)[1]
+
+
+def _recall(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def index_report(
+    vectors: np.ndarray,
+    index,
+    k: int = 10,
+    sample: int = 200,
+    full_vectors: Optional[np.ndarray] = None,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Memory footprint and recall@k of `index` against an exact flat index over the
+    same vectors, using a sample of the pack's own vectors as queries.
+
+    With `full_vectors` (the untruncated embeddings) also report recall@k of the
+    stored (truncated) vectors against exact search at full dimension.
+    """
+    import faiss
+
+    n = vectors.shape[0]
+    k = max(1, min(k, n))
+    rows = np.random.default_rng(seed).choice(n, size=min(sample, n), replace=False)
+    queries = np.asarray(vectors[rows], dtype=np.float32)
+
+    truth = _neighbors(vectors, queries, k)
+    found = index.search(queries, k)[1]
+    report: Dict[str, Any] = {
+        "type": index_kind(index),
+        **_index_params(index),
+        "count": int(n),
+        "dim": int(vectors.shape[1]),
+        "index_bytes": int(faiss.serialize_index(index).nbytes),
+        "flat_float32_bytes": int(n * vectors.shape[1] * 4),
+        "vectors_bytes": int(vectors.nbytes),
+        f"recall@{k}_vs_flat": round(_recall(found, truth), 4),
+    }
+    if full_vectors is not None:
+        full_vectors = np.asarray(full_vectors, dtype=np.float32)
+    if full_vectors is not None and full_vectors.shape[1] != vectors.shape[1]:
+        full_truth = _neighbors(full_vectors, np.asarray(full_vectors[rows], dtype=np.float32), k)
+        report["full_dim"] = int(full_vectors.shape[1])
+        report[f"recall@{k}_vs_full_dim"] = round(_recall(found, full_truth), 4)
+    return report
+
+
+# ----------------------------
+# FAISS rebuild / validation
+# ----------------------------
+
+def check_index(index, vectors: np.ndarray, sample: int = 16, atol: Optional[float] = None) -> None:
+    """
+    Raise ValueError if a FAISS index does not hold exactly these vectors.
+    Compares count, dim and (for exact flat indexes) a spread-out sample of reconstructed rows.
+    """
+    n, dim = vectors.shape
+    if index.ntotal != n or index.d != dim:
+        raise ValueError(f"FAISS index has {index.ntotal}x{index.d} vectors, vector pack has {n}x{dim}")
+    if n == 0 or index_kind(index) != "flat":
+        return  # quantized codes only approximate the vectors
+    if atol is None:
+        atol = 1e-3 if vectors.dtype == np.float16 else 1e-6
+    rows: List[int] = sorted({int(i) for i in np.linspace(0, n - 1, num=min(sample, n))})
+    for i in rows:
+        if not np.allclose(index.reconstruct(i), vectors[i].astype(np.float32), atol=atol):
+            raise ValueError(f"FAISS index row {i} differs from {VECTORS_FILE}")
+
+
+def check_declared_dim(vectors: np.ndarray, dim: Optional[int], what: str) -> None:
+    """Raise ValueError if the stored vectors do not have the manifest's declared dim."""
+    if dim and vectors.shape[1] != int(dim):
+        raise ValueError(
+            f"{what}: stored vectors have dim {vectors.shape[1]} but the manifest declares dim {dim}; "
+            "rebuild the pack (vectors are truncated to the declared dim at build time)"
+        )
+
+
+def load_index(index_path: Path, vectors_path: Optional[Path] = None,
+               spec: Optional[Dict[str, Any]] = None, log=print):
+    """
+    Load index.faiss and validate it against the memory-mapped vector pack (and the
+    manifest's index type, when `spec` is given). If index.faiss is missing, stale
+    or of another type, rebuild it from vectors.npy (no JSON parsing).
+    """
+    import faiss
+
+    index_path = Path(index_path)
+    vectors = load_vectors(vectors_path) if vectors_path and Path(vectors_path).exists() else None
+
+    if index_path.exists():
+        index = faiss.read_index(str(index_path))
+        if vectors is None:
+            return index
+        try:
+            check_index(index, vectors)
+            if spec and index_kind(index) != spec["type"]:
+                raise ValueError(f"index is {index_kind(index)}, manifest asks for {spec['type']}")
+            return index
+        except ValueError as e:
+            log(f"! {index_path.name} does not match {Path(vectors_path).name} ({e}); rebuilding from vectors")
+    elif vectors is None:
+        raise FileNotFoundError(f"Neither {index_path} nor a vector pack was found")
+
+    return build_index(vectors, spec, log=log)
+
+
+def load_faiss_store(root: Path, idx_cfg: Dict[str, Any], embeddings, allow_pickle: bool = False,
+                     dim: Optional[int] = None):
+    """
+    LangChain FAISS store for one `precomputed_indices.<kind>` block: the index is
+    checked against (or rebuilt from) the memory-mapped vector pack and documents
+    resolve lazily from docstore.sqlite. With `dim` (the manifest's declared
+    embedding dim) a pack built at another dimension is refused.
+
+    Legacy packs whose manifest still points at an index.pkl docstore are only
+    loaded with `allow_pickle=True` (migrate them with docstore.convert_pickle_docstore).
+    """
+    from langchain_community.vectorstores import FAISS
+
+    from .docstore import SqliteDocstore
+
+    paths = pack_paths(root, idx_cfg)
+    if dim and paths["vectors"].exists():
+        check_declared_dim(load_vectors(paths["vectors"]), dim, str(paths["vectors"]))
+    index = load_index(paths["index"], paths["vectors"], spec=index_spec(idx_cfg))
+    if dim and index.d != int(dim):
+        raise ValueError(f"{paths['index']}: index dim {index.d} but the manifest declares dim {dim}")
+
+    if paths["docstore"].suffix == ".pkl":
+        if not allow_pickle:
+            raise ValueError(
+                f"{paths['docstore']} is a pickled docstore; convert it with "
+                "beacon.docstore.convert_pickle_docstore or pass allow_pickle=True for a trusted pack"
+            )
+        import pickle
+
+        with open(paths["docstore"], "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+    else:
+        docstore = SqliteDocstore(paths["docstore"])
+        index_to_docstore_id = docstore.index_to_docstore_id()
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
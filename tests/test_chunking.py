@@ -0,0 +1,87 @@
+import pytest
+
+from beacon.chunking import Chunker, fixed_windows, make_chunker, pack_blocks, parse_blocks, running_lines
+
+
+def words(text: str) -> int:
+    return len(text.split())
+
+
+def _manual(sections: int = 6) -> str:
+    """Markdown-like text: headings, numbered steps, and paragraphs of varied length."""
+    parts = []
+    for s in range(sections):
+        parts.append(f"Heat Stroke Care {s}")
+        parts += [f"{i}. Move the person {s} to shade and loosen tight clothing at once." for i in range(1, 4)]
+        parts.append(" ".join(f"Sentence {s}.{j} says to give small sips of clean water." for j in range(s * 4 + 1)))
+    return "\n\n".join(parts)
+
+
+@pytest.mark.parametrize("max_tokens,overlap", [(16, 4), (40, 8), (120, 0)])
+def test_semantic_chunks_fit_max_tokens(max_tokens, overlap):
+    chunker = make_chunker({"strategy": "semantic+fixed", "max_tokens": max_tokens, "overlap_tokens": overlap}, words)
+    chunks = chunker(_manual())
+
+    assert chunks
+    assert all(words(c) <= max_tokens for c in chunks)
+    # every source sentence survives somewhere
+    assert all(f"Sentence 5.{j} " in " ".join(chunks) for j in range(21))
+
+
+def test_pack_blocks_keeps_steps_with_their_heading():
+    text = "Snake Bite First Aid\n\n1. Keep the limb still.\n2. Remove rings.\n3. Go to the hospital."
+    chunks = pack_blocks(parse_blocks(text), 64, 8, words)
+
+    assert len(chunks) == 1
+    assert [b.kind for b in chunks[0]] == ["heading", "item", "item", "item"]
+
+
+def test_fixed_windows_progress_and_overlap():
+    text = " ".join(f"w{i}" for i in range(100))
+    windows = fixed_windows(text, 10, 3, words)
+
+    assert all(words(w) <= 10 for w in windows)
+    assert windows[0].split()[0] == "w0" and windows[-1].split()[-1] == "w99"
+    for prev, nxt in zip(windows, windows[1:]):
+        a, b = prev.split(), nxt.split()
+        assert b[:3] == a[-3:]                              # the overlap is repeated
+        assert int(b[0][1:]) > int(a[0][1:])                # and each window moves forward
+
+
+def test_fixed_windows_overlap_not_below_budget():
+    # overlap >= max_tokens and a word over the budget must still terminate
+    text = "a b c " + "x" * 50 + " d e"
+    windows = fixed_windows(text, 3, 5, lambda s: sum(1 + len(w) // 10 for w in s.split()))
+
+    assert windows[-1].endswith("e")
+    assert len(windows) < 10
+
+
+def test_running_headers_and_footers_removed():
+    advice = ["Boil water.", "Wash hands.", "Rest in shade.", "Call the clinic.", "Keep the limb still.", "Cover food."]
+    pages = [
+        (n, f"District Health Manual\n{tip}\nRevised 2024 edition {n}")
+        for n, tip in enumerate(advice, start=1)
+    ]
+    assert running_lines([t for _, t in pages]) == {"District Health Manual", "Revised # edition #"}
+
+    chunker = Chunker({"strategy": "semantic+fixed", "max_tokens": 40, "overlap_tokens": 0}, words)
+    out = chunker.pages(pages)
+    text = " ".join(t for _, _, t in out)
+
+    assert "District Health Manual" not in text and "Revised" not in text
+    assert all(tip in text for tip in advice)
+    assert out[0][0] == 1 and out[-1][1] == 6
+    assert all(first <= last for first, last, _ in out)
+
+
+def test_short_documents_keep_their_first_line():
+    pages = [(1, "Flood Safety\nBoil water before drinking."), (2, "Flood Safety\nMove to high ground.")]
+    assert running_lines([t for _, t in pages]) == set()
+
+
+def test_token_strategies_need_a_counter():
+    with pytest.raises(ValueError):
+        Chunker({"strategy": "fixed", "max_tokens": 10, "overlap_tokens": 2})
+    with pytest.raises(ValueError):
+        Chunker({"strategy": "sentences", "max_tokens": 10, "overlap_tokens": 2}, words)
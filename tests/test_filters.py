@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+
+from beacon.filters import RowFilter, filtered_search
+from beacon.vector_store import INDEX_TYPES, build_index, index_kind
+
+N, DIM = 800, 32
+
+TOPICS = {
+    "snakebite": ("en", "snake bite {i}: keep the limb still and go to the hospital for antivenom"),
+    "heatwave": ("hi_en", "heat stroke {i}: drink water, rest in the shade and cool the body"),
+    "flood": ("hi", "flood {i}: move to high ground and boil drinking water before use"),
+}
+PER_TOPIC = 40
+
+
+def _vectors(seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((N, DIM)).astype(np.float32)
+
+
+def _store(kind: str = "flat"):
+    """A small LangChain FAISS store (+ BM25) over synthetic chunks of three topics."""
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+
+    from beacon.embedding import HashingEmbeddings
+    from beacon.lexical import LexicalIndex
+
+    docs = [
+        Document(page_content=text.format(i=i), metadata={"topic_id": topic, "locale": locale})
+        for topic, (locale, text) in TOPICS.items()
+        for i in range(PER_TOPIC)
+    ]
+    # one chunk shared by two topics (ingest.merge_duplicate_chunks)
+    docs[0].metadata["topic_ids"] = ["snakebite", "flood"]
+    emb = HashingEmbeddings(64)
+    vectors = np.asarray(emb.embed_documents([d.page_content for d in docs]), dtype=np.float32)
+    index = build_index(vectors, {"type": kind, "nprobe": 1, "pq_m": 8}, log=lambda *a: None)
+    ids = [str(i) for i in range(len(docs))]
+    vs = FAISS(emb, index, InMemoryDocstore(dict(zip(ids, docs))), dict(enumerate(ids)))
+    return vs, LexicalIndex.build([d.page_content for d in docs])
+
+
+@pytest.mark.filterwarnings("ignore")
+@pytest.mark.parametrize("kind", INDEX_TYPES)
+@pytest.mark.parametrize("every", [2, 40])  # a broad mask, and one narrower than k per IVF list
+def test_filtered_search_every_index_type(kind, every):
+    vectors = _vectors()
+    index = build_index(vectors, {"type": kind, "nprobe": 1, "pq_m": 8}, log=lambda *a: None)
+    assert index_kind(index) == kind
+    mask = np.zeros(N, dtype=bool)
+    mask[::every] = True
+
+    rows = filtered_search(index, vectors[1:2], 10, mask)
+
+    assert len(rows) == 10
+    assert all(mask[rows])
+    assert len(set(rows)) == 10
+
+
+def test_filtered_search_fewer_matches_than_k():
+    vectors = _vectors()
+    index = build_index(vectors, {"type": "ivf_flat", "nprobe": 1}, log=lambda *a: None)
+    mask = np.zeros(N, dtype=bool)
+    mask[[3, 500]] = True
+
+    assert sorted(filtered_search(index, vectors[3:4], 10, mask)) == [3, 500]
+    assert filtered_search(index, vectors[3:4], 10, np.zeros(N, dtype=bool)) == []
+
+
+def test_unfiltered_search():
+    from beacon.lexical import hybrid_search
+
+    vs, lexical = _store()
+    allowed, applied = RowFilter.from_store(vs).mask()
+
+    assert allowed is None and applied == {}
+    docs = hybrid_search(vs, lexical, "snake bite antivenom", k=4, allowed=allowed)
+    assert len(docs) == 4
+    assert all(d.metadata["topic_id"] == "snakebite" for d in docs)
+
+
+@pytest.mark.filterwarnings("ignore")
+@pytest.mark.parametrize("kind", INDEX_TYPES)
+def test_topic_filter_returns_full_k(kind):
+    from beacon.lexical import hybrid_search, vector_rows
+
+    vs, lexical = _store(kind)
+    allowed, applied = RowFilter.from_store(vs).mask(topic_id="heatwave")
+
+    assert applied == {"topic_id": "heatwave"}
+    assert int(allowed.sum()) == PER_TOPIC
+    # a query about another topic still gets k rows, all from the filtered one
+    assert len(vector_rows(vs, "snake bite antivenom", 10, allowed=allowed)) == 10
+    docs = hybrid_search(vs, lexical, "snake bite antivenom", k=4, allowed=allowed)
+    assert len(docs) == 4
+    assert all(d.metadata["topic_id"] == "heatwave" for d in docs)
+
+
+def test_unknown_topic_is_ignored():
+    from beacon.lexical import hybrid_search
+
+    vs, lexical = _store()
+    allowed, applied = RowFilter.from_store(vs).mask(topic_id="no-such-topic")
+
+    assert allowed is None
+    assert applied == {"ignored": {"topic_id": "no-such-topic"}}
+    assert len(hybrid_search(vs, lexical, "flood water", k=4, allowed=allowed)) == 4
+
+
+def test_locale_and_shared_topic_masks():
+    vs, _ = _store()
+    rf = RowFilter.from_store(vs)
+
+    # "en" also matches bilingual hi_en chunks
+    en, _ = rf.mask(locale="en")
+    assert int(en.sum()) == 2 * PER_TOPIC
+    # the shared chunk is in the mask of both its topics
+    flood, _ = rf.mask(topic_id="flood")
+    snake, _ = rf.mask(topic_id="snakebite")
+    assert flood[0] and snake[0]
+    assert int(flood.sum()) == PER_TOPIC + 1
+    both, applied = rf.mask(topic_id="flood", locale="hi")
+    assert applied == {"topic_id": "flood", "locale": "hi"}
+    assert int(both.sum()) == PER_TOPIC
@@ -0,0 +1,39 @@
+from beacon.ingest import merge_duplicate_chunks
+
+
+def _record(chunk_id: str, text: str, topic: str, file_id: str, path: str, citations=()):
+    return {
+        "text": text,
+        "metadata": {
+            "chunk_id": chunk_id, "chunk_hash": f"h:{text}", "topic_id": topic, "file_id": file_id,
+            "path": path, "citations": list(citations),
+        },
+    }
+
+
+def test_merge_keeps_first_ids_and_unions_the_rest():
+    records = [
+        _record("c1", "boil water", "flood", "f1", "flood/en.md", [{"id": "who-1"}]),
+        _record("c2", "move to high ground", "flood", "f1", "flood/en.md"),
+        _record("c3", "boil water", "cholera", "f2", "cholera/en.md", [{"id": "who-1"}, {"id": "moh-7"}]),
+        _record("c4", "boil water", "flood", "f3", "flood/hi.md"),
+    ]
+    merged, folded = merge_duplicate_chunks(records)
+
+    assert folded == 2
+    assert [r["metadata"]["chunk_id"] for r in merged] == ["c1", "c2"]
+    md = merged[0]["metadata"]
+    assert (md["topic_id"], md["file_id"], md["path"]) == ("flood", "f1", "flood/en.md")
+    assert md["topic_ids"] == ["flood", "cholera"]
+    assert md["file_ids"] == ["f1", "f2", "f3"]
+    assert md["paths"] == ["flood/en.md", "cholera/en.md", "flood/hi.md"]
+    assert [c["id"] for c in md["citations"]] == ["who-1", "moh-7"]
+    assert merged[1]["metadata"]["topic_ids"] == ["flood"]
+
+
+def test_merge_does_not_touch_its_input():
+    records = [_record("c1", "rest", "heat", "f1", "a.md"), _record("c2", "rest", "heat", "f2", "b.md")]
+    merge_duplicate_chunks(records)
+
+    assert "topic_ids" not in records[0]["metadata"]
+    assert merge_duplicate_chunks([]) == ([], 0)